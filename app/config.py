@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # 找到项目根目录下的 .env 文件并加载
@@ -10,4 +11,72 @@ load_dotenv(dotenv_path=dotenv_path)
 class Settings:
     API_KEY: str = os.getenv("OPENWEATHER_API_KEY")
 
+    # 天气上游接口：连接池大小(也是并发请求数上限)、每个请求的连接/读取超时，
+    # 以及实时天气数据包(并发请求多个接口)的总等待时间(秒)
+    WEATHER_POOL_MAXSIZE: int = int(os.getenv("WEATHER_POOL_MAXSIZE", 32))
+    WEATHER_CONNECT_TIMEOUT: float = float(os.getenv("WEATHER_CONNECT_TIMEOUT", 3))
+    WEATHER_READ_TIMEOUT: float = float(os.getenv("WEATHER_READ_TIMEOUT", 8))
+    WEATHER_BUNDLE_DEADLINE: float = float(os.getenv("WEATHER_BUNDLE_DEADLINE", 10))
+    # 各 worker 共享的天气缓存(SQLite)文件路径，留空则只使用进程内缓存
+    WEATHER_CACHE_PATH: str = os.getenv("WEATHER_CACHE_PATH", os.path.join(tempfile.gettempdir(), "weather-cache.sqlite3"))
+    # 实时天气/30天趋势缓存过期后仍可返回旧数据(同时后台刷新)的时长(秒)，
+    # 以及后台预取的热门键数量与预取周期(秒)，WEATHER_PREFETCH_TOP_N=0 时不预取
+    WEATHER_STALE_TTL: int = int(os.getenv("WEATHER_STALE_TTL", 3600))
+    WEATHER_PREFETCH_TOP_N: int = int(os.getenv("WEATHER_PREFETCH_TOP_N", 10))
+    WEATHER_PREFETCH_INTERVAL: int = int(os.getenv("WEATHER_PREFETCH_INTERVAL", 60))
+    # 多城市批量查询：单次最多城市数、同时获取的城市数(各 worker 内全局)、等待未命中城市的最长时间(秒)
+    WEATHER_BATCH_MAX_CITIES: int = int(os.getenv("WEATHER_BATCH_MAX_CITIES", 30))
+    WEATHER_BATCH_CONCURRENCY: int = int(os.getenv("WEATHER_BATCH_CONCURRENCY", 8))
+    WEATHER_BATCH_DEADLINE: float = float(os.getenv("WEATHER_BATCH_DEADLINE", 15))
+    # 历史天气：已结束日期的永久存储(SQLite，为空时不保存)、按日期范围查询时并发请求的天数与最大跨度(天)
+    WEATHER_HISTORY_PATH: str = os.getenv("WEATHER_HISTORY_PATH", os.path.join(tempfile.gettempdir(), "weather-history.sqlite3"))
+    WEATHER_HISTORY_CONCURRENCY: int = int(os.getenv("WEATHER_HISTORY_CONCURRENCY", 4))
+    WEATHER_HISTORY_MAX_DAYS: int = int(os.getenv("WEATHER_HISTORY_MAX_DAYS", 31))
+    # 城市名 -> 经纬度 的永久索引(SQLite)，为空时只使用内置城市与进程内缓存
+    GEOCODE_INDEX_PATH: str = os.getenv("GEOCODE_INDEX_PATH", os.path.join(tempfile.gettempdir(), "geocode-index.sqlite3"))
+    # 天气地图瓦片缓存：进程内缓存容量(字节)、共享的磁盘目录(为空时只用进程内缓存)，
+    # 以及上游没有给出 Cache-Control 时的缓存时长(秒)
+    TILE_CACHE_MEMORY_BYTES: int = int(os.getenv("TILE_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+    TILE_CACHE_DIR: str = os.getenv("TILE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "weather-tiles"))
+    TILE_CACHE_DEFAULT_TTL: int = int(os.getenv("TILE_CACHE_DEFAULT_TTL", 600))
+
+    # 热力图插值结果缓存：内存层的字节预算，以及可选的磁盘层目录(留空则不启用)
+    HEATMAP_GRID_CACHE_BYTES: int = int(os.getenv("HEATMAP_GRID_CACHE_BYTES", 64 * 1024 * 1024))
+    HEATMAP_GRID_CACHE_DIR: str = os.getenv("HEATMAP_GRID_CACHE_DIR", "")
+    # 栅格化底图叠加层缓存的字节预算
+    HEATMAP_OVERLAY_CACHE_BYTES: int = int(os.getenv("HEATMAP_OVERLAY_CACHE_BYTES", 128 * 1024 * 1024))
+    # 栅格渲染模式输出宽度(image_width，像素)的允许范围，超出时截断到该范围
+    HEATMAP_RASTER_MIN_WIDTH: int = int(os.getenv("HEATMAP_RASTER_MIN_WIDTH", 64))
+    HEATMAP_RASTER_MAX_WIDTH: int = int(os.getenv("HEATMAP_RASTER_MAX_WIDTH", 4096))
+
+    # 热力图任务进程池：每个Web进程的池大小、排队上限、同步等待超时(秒)，
+    # 以及各Web进程共享的任务结果目录和结果保留时间(秒)
+    HEATMAP_POOL_WORKERS: int = int(os.getenv("HEATMAP_POOL_WORKERS", 2))
+    HEATMAP_QUEUE_LIMIT: int = int(os.getenv("HEATMAP_QUEUE_LIMIT", 8))
+    HEATMAP_JOB_TIMEOUT: int = int(os.getenv("HEATMAP_JOB_TIMEOUT", 120))
+    HEATMAP_JOB_DIR: str = os.getenv("HEATMAP_JOB_DIR", os.path.join(tempfile.gettempdir(), "heatmap-jobs"))
+    HEATMAP_JOB_RESULT_TTL: int = int(os.getenv("HEATMAP_JOB_RESULT_TTL", 3600))
+
+    # 插值曲面(供瓦片/导出接口复用)的共享存储目录与保留时间(秒)，以及瓦片内存缓存的字节预算
+    HEATMAP_SURFACE_DIR: str = os.getenv("HEATMAP_SURFACE_DIR", os.path.join(tempfile.gettempdir(), "heatmap-surfaces"))
+    HEATMAP_SURFACE_TTL: int = int(os.getenv("HEATMAP_SURFACE_TTL", 86400))
+    HEATMAP_TILE_CACHE_BYTES: int = int(os.getenv("HEATMAP_TILE_CACHE_BYTES", 64 * 1024 * 1024))
+
+    # 上传表格解析结果缓存：内存层字节预算，以及各进程共享的目录和保留时间(秒)
+    UPLOAD_PARSE_CACHE_BYTES: int = int(os.getenv("UPLOAD_PARSE_CACHE_BYTES", 32 * 1024 * 1024))
+    UPLOAD_PARSE_CACHE_DIR: str = os.getenv("UPLOAD_PARSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "upload-parse-cache"))
+    UPLOAD_PARSE_CACHE_TTL: int = int(os.getenv("UPLOAD_PARSE_CACHE_TTL", 3600))
+
+    # 地图会话数据存储：sqlite(各进程共享，默认) 或 memory(仅当前进程)，
+    # 数据库文件路径、总字节数上限，以及会话在最后一次访问后的保留时间(秒)
+    SESSION_STORE_BACKEND: str = os.getenv("SESSION_STORE_BACKEND", "sqlite")
+    SESSION_STORE_PATH: str = os.getenv("SESSION_STORE_PATH", os.path.join(tempfile.gettempdir(), "map-sessions.sqlite3"))
+    SESSION_STORE_MAX_BYTES: int = int(os.getenv("SESSION_STORE_MAX_BYTES", 256 * 1024 * 1024))
+    SESSION_STORE_TTL: int = int(os.getenv("SESSION_STORE_TTL", 6 * 3600))
+
+    # 地图上传暂存目录(分块上传/续传，各进程共享)、未完成上传的保留时间(秒)与单个文件的大小上限
+    UPLOAD_SPOOL_DIR: str = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "map-uploads"))
+    UPLOAD_SPOOL_TTL: int = int(os.getenv("UPLOAD_SPOOL_TTL", 86400))
+    UPLOAD_MAX_BYTES: int = int(os.getenv("UPLOAD_MAX_BYTES", 512 * 1024 * 1024))
+
 settings = Settings()
\ No newline at end of file
@@ -1,5 +1,20 @@
 # app/services/carbon_estimator.py
 
+import numpy as np
+import pandas as pd
+
+# 批量估算时清单表格的列名 -> 内部列名(中英文表头均可)
+INVENTORY_COLUMNS = {
+    '企业名称': 'name', 'name': 'name',
+    '天然气': 'gas', 'gas': 'gas',
+    '柴油': 'diesel', 'diesel': 'diesel',
+    '汽油': 'gasoline', 'gasoline': 'gasoline',
+    '煤炭': 'coal', 'coal': 'coal',
+    '用电量': 'consumption_kwh', 'consumption_kwh': 'consumption_kwh',
+    '电网区域': 'region', 'region': 'region',
+}
+
+
 class CarbonEstimator:
     """
     企业碳排放初步估算器
@@ -64,3 +79,60 @@ class CarbonEstimator:
             "scope1_emissions": round(e_scope1, 4),
             "scope2_emissions": round(e_scope2, 4)
         }
+
+    def estimate_batch(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        批量估算：frame 每行一家企业，列为 INVENTORY_COLUMNS 中的内部列名(缺少的列视为空)。
+        一次向量化计算所有行，计算规则与 estimate_total_emissions 相同(无法解析的值按 0 计)，
+        返回 name(若有)、三项排放量、valid 与 flags(该行存在的数据问题)。
+        """
+        n = len(frame)
+        issues = []
+
+        # 范围一：燃料消耗矩阵 (行 × 燃料) 乘以排放因子向量
+        fuels = list(self.EF_SCOPE1)
+        consumption = np.zeros((n, len(fuels)))
+        for j, fuel in enumerate(fuels):
+            if fuel in frame:
+                values, invalid = self._numeric_column(frame[fuel])
+                issues.append((f"invalid_{fuel}", invalid))
+                issues.append((f"negative_{fuel}", values < 0))
+                consumption[:, j] = np.nan_to_num(values)
+        scope1 = consumption @ np.array([self.EF_SCOPE1[fuel] for fuel in fuels])
+
+        # 范围二：用电量(kWh -> MWh) 乘以所在区域电网的排放因子
+        if 'consumption_kwh' in frame:
+            kwh, invalid = self._numeric_column(frame['consumption_kwh'])
+            issues.append(("invalid_consumption_kwh", invalid))
+            issues.append(("negative_consumption_kwh", kwh < 0))
+        else:
+            kwh = np.full(n, np.nan)
+        region = frame['region'] if 'region' in frame else pd.Series([None] * n, index=frame.index)
+        region = region.where(region.notna(), '').astype(str).str.strip()
+        ef_grid = region.map(self.EF_GRID).to_numpy(np.float64)
+        has_kwh = np.nan_to_num(kwh) != 0
+        issues.append(("missing_region", has_kwh & (region == '').to_numpy()))
+        issues.append(("unknown_region", has_kwh & (region != '').to_numpy() & np.isnan(ef_grid)))
+        scope2 = np.nan_to_num(kwh / 1000.0 * ef_grid)
+
+        flags = [[] for _ in range(n)]
+        for name, mask in issues:
+            for i in np.flatnonzero(mask):
+                flags[i].append(name)
+
+        result = pd.DataFrame(index=frame.index)
+        if 'name' in frame:
+            result['name'] = frame['name'].where(frame['name'].notna(), None)
+        result['total_emissions'] = np.round(scope1 + scope2, 4)
+        result['scope1_emissions'] = np.round(scope1, 4)
+        result['scope2_emissions'] = np.round(scope2, 4)
+        result['valid'] = [not f for f in flags]
+        result['flags'] = flags
+        return result
+
+    @staticmethod
+    def _numeric_column(values: pd.Series):
+        """返回 (float64 数组(空值与无法解析的值为 NaN), 有值但无法解析的行)"""
+        numbers = pd.to_numeric(values, errors='coerce').to_numpy(np.float64)
+        present = values.notna().to_numpy() & (values.astype(str).str.strip() != '').to_numpy()
+        return numbers, present & ~np.isfinite(numbers)
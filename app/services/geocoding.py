@@ -0,0 +1,116 @@
+# 文件路径: app/services/geocoding.py
+
+import os
+import re
+import threading
+import unicodedata
+
+from app.config import settings
+from app.services import shared_sqlite
+
+# --- 城市名 -> 经纬度 索引 ---
+# 城市坐标不会变化，查到后永久保存(不设过期时间)。城市名先规范化(全半角、大小写、空白、国家代码)，
+# 内置城市的中文名、拼音别名及其带"市"/"city"/"shi"后缀的写法指向同一条记录；
+# 其他城市不去除后缀(如 Mexico City 与 Mexico 是两个地点)。内置服务范围内城市的坐标，这些城市无需请求地理编码接口；
+# 其他城市由地理编码接口查询后写入各 worker 共享的 SQLite 索引。
+
+# 内置城市：(中文名, 纬度, 经度, 别名...)
+SEED_CITIES = (
+    ('太原', 37.8706, 112.5489, 'taiyuan'),
+    ('大同', 40.0768, 113.3001, 'datong'),
+    ('阳泉', 37.8569, 113.5805, 'yangquan'),
+    ('长治', 36.1954, 113.1163, 'changzhi'),
+    ('晋城', 35.4908, 112.8513, 'jincheng'),
+    ('朔州', 39.3317, 112.4330, 'shuozhou'),
+    ('晋中', 37.6871, 112.7527, 'jinzhong'),
+    ('运城', 35.0263, 111.0072, 'yuncheng'),
+    ('忻州', 38.4167, 112.7342, 'xinzhou'),
+    ('临汾', 36.0880, 111.5190, 'linfen'),
+    ('吕梁', 37.5177, 111.1443, 'lvliang', 'lüliang', 'luliang', 'lyuliang'),
+)
+
+# 去掉后能匹配内置城市别名时才去掉的后缀
+_ALIAS_SUFFIXES = ('市', 'city', 'shi')
+_COUNTRY_SUFFIX = re.compile(r',\s*(cn|chn|china|中国)$')
+_SEPARATORS = re.compile(r"[\s\-_'’·.]+")
+
+_memory = {}
+_memory_lock = threading.Lock()
+_conn = None
+_conn_pid = None
+_db_lock = threading.Lock()
+
+
+def normalize(name: str) -> str:
+    """
+    规范化城市名(不去除后缀)："Taiyuan"、" tai yuan "、"TAIYUAN,CN" 都得到 "taiyuan"，"Mexico City" 得到 "mexicocity"。
+    """
+    key = unicodedata.normalize('NFKC', name).strip().lower()
+    key = _COUNTRY_SUFFIX.sub('', key)
+    return _SEPARATORS.sub('', key)
+
+
+# 内置城市：{规范化的别名: 中文名}、{中文名: 坐标}
+_CANONICAL = {normalize(alias): name for name, _, _, *aliases in SEED_CITIES for alias in (name, *aliases)}
+_SEED = {name: {'lat': lat, 'lon': lon} for name, lat, lon, *_ in SEED_CITIES}
+
+
+def city_key(city: str) -> str:
+    """
+    城市的唯一标识：内置城市的各个别名(可带"市"/"city"/"shi"后缀)都对应其中文名，
+    其他城市为规范化后的名称。
+    """
+    key = normalize(city)
+    if key in _CANONICAL:
+        return _CANONICAL[key]
+    for suffix in _ALIAS_SUFFIXES:
+        if key.endswith(suffix) and key[:-len(suffix)] in _CANONICAL:
+            return _CANONICAL[key[:-len(suffix)]]
+    return key
+
+
+def _connection():
+    global _conn, _conn_pid
+    # gunicorn fork 出的子进程不能复用父进程的连接
+    if _conn is None or _conn_pid != os.getpid():
+        conn = shared_sqlite.connect(settings.GEOCODE_INDEX_PATH)
+        # geocode_v2：旧版 geocode 表的键去除了后缀，不同地点可能共用一个键，不再读取
+        conn.execute("CREATE TABLE IF NOT EXISTS geocode_v2 (name TEXT PRIMARY KEY, lat REAL NOT NULL, lon REAL NOT NULL)")
+        _conn, _conn_pid = conn, os.getpid()
+    return _conn
+
+
+def lookup(city: str) -> dict | None:
+    """按城市标识查询 {'lat', 'lon'}：内置城市、进程内缓存、共享索引依次查询；未收录返回 None"""
+    key = city_key(city)
+    coords = _SEED.get(key) or _memory.get(key)
+    if coords is not None or not settings.GEOCODE_INDEX_PATH:
+        return coords
+    try:
+        with _db_lock:
+            row = _connection().execute("SELECT lat, lon FROM geocode_v2 WHERE name = ?", (key,)).fetchone()
+    except Exception as e:
+        print(f"读取地理编码索引失败: {e}")
+        return None
+    if row is None:
+        return None
+    coords = {'lat': row[0], 'lon': row[1]}
+    with _memory_lock:
+        _memory[key] = coords
+    return coords
+
+
+def add(city: str, coords: dict):
+    """把地理编码接口查到的坐标写入索引"""
+    key = city_key(city)
+    coords = {'lat': coords['lat'], 'lon': coords['lon']}
+    with _memory_lock:
+        _memory[key] = coords
+    if not settings.GEOCODE_INDEX_PATH:
+        return
+    try:
+        with _db_lock:
+            _connection().execute("INSERT OR REPLACE INTO geocode_v2 (name, lat, lon) VALUES (?, ?, ?)",
+                                  (key, coords['lat'], coords['lon']))
+    except Exception as e:
+        print(f"写入地理编码索引失败: {e}")
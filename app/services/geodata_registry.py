@@ -0,0 +1,173 @@
+# 文件路径: app/services/geodata_registry.py
+
+import hashlib
+import os
+import threading
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from cachetools import LRUCache
+
+# --- 全局路径设置 ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROVINCE_DATA_PATH = os.path.join(os.path.dirname(BASE_DIR), 'shanxigeo')
+
+# --- 进程内地理数据注册表 ---
+# 键为GeoJSON文件的绝对路径，值为 _GeoLayer 对象。
+# 每个进程只解析一次文件，之后通过文件 mtime 判断是否需要重新加载。
+_layers = {}
+_layers_lock = threading.Lock()
+
+# 按 (路径, 版本, 范围, 容差) 缓存裁剪+简化后的结果，避免重复计算
+_view_cache = LRUCache(maxsize=64)
+
+# 按 (边界路径, 版本, 范围, 形状) 缓存边界栅格掩膜
+_mask_cache = LRUCache(maxsize=32)
+
+
+class _GeoLayer:
+    """
+    一个已解析的GeoJSON图层：GeoDataFrame + STRtree空间索引 + 加载时的mtime。
+    fingerprint 是文件内容的哈希，可作为缓存键的一部分。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as f:
+            self.fingerprint = hashlib.sha256(f.read()).hexdigest()
+        self.gdf = gpd.read_file(path)
+        self.tree = shapely.STRtree(self.gdf.geometry.values)
+
+    def query(self, bbox) -> gpd.GeoDataFrame:
+        """使用空间索引选出与 bbox=(xmin, ymin, xmax, ymax) 相交的要素"""
+        idx = self.tree.query(shapely.box(*bbox))
+        return self.gdf.iloc[np.sort(idx)]
+
+
+def city_data_path(city: str) -> str:
+    return os.path.join(PROVINCE_DATA_PATH, city)
+
+
+def _get_layer(path: str) -> _GeoLayer | None:
+    """从注册表获取图层；首次访问或文件被修改(mtime变化)时重新解析"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    layer = _layers.get(path)
+    if layer is not None and layer.mtime == mtime:
+        return layer
+
+    with _layers_lock:
+        layer = _layers.get(path)
+        if layer is None or layer.mtime != mtime:
+            layer = _GeoLayer(path)
+            _layers[path] = layer
+        return layer
+
+
+def _get_boundary_layer(city: str) -> _GeoLayer:
+    path = os.path.join(city_data_path(city), 'boundary.geojson')
+    layer = _get_layer(path)
+    if layer is None:
+        raise FileNotFoundError(path)
+    return layer
+
+
+def get_boundary(city: str) -> gpd.GeoDataFrame:
+    """获取城市边界(boundary.geojson)，文件不存在时抛出 FileNotFoundError"""
+    return _get_boundary_layer(city).gdf
+
+
+def get_clip_geometry(city: str):
+    """热力图的裁剪范围：边界文件中的第一个要素(包含其所有多边形部分)"""
+    return get_boundary(city).geometry.iloc[0]
+
+
+def get_boundary_mask(city: str, bounds, shape) -> np.ndarray:
+    """
+    城市边界的栅格掩膜。
+    在 bounds=(xmin, ymin, xmax, ymax) 范围内按 shape=(nx, ny) 等间距取点(含端点，与 np.linspace 一致)，
+    返回按 [x索引, y索引] 排列的布尔数组，点位于裁剪多边形内为 True。
+    结果按 (城市边界, 范围, 形状) 缓存，边界文件修改后自动失效。
+    """
+    layer = _get_boundary_layer(city)
+    nx, ny = int(shape[0]), int(shape[1])
+    bounds_key = tuple(round(float(v), 9) for v in bounds)
+    cache_key = (layer.path, layer.mtime, bounds_key, nx, ny)
+    mask = _mask_cache.get(cache_key)
+    if mask is not None:
+        return mask
+
+    xmin, ymin, xmax, ymax = bounds
+    mask = boundary_contains(city, np.linspace(xmin, xmax, nx), np.linspace(ymin, ymax, ny))
+    mask.flags.writeable = False  # 掩膜在多个请求间共享
+    _mask_cache[cache_key] = mask
+    return mask
+
+
+def boundary_contains(city: str, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """判断 xs × ys 规则网格上的点是否位于裁剪多边形内，返回形状 (len(xs), len(ys)) 的布尔数组(不缓存)"""
+    grid_x, grid_y = np.meshgrid(xs, ys, indexing='ij')
+    geom = get_clip_geometry(city)
+    shapely.prepare(geom)
+    return shapely.contains_xy(geom, grid_x, grid_y)
+
+
+def boundary_fingerprint(city: str) -> str:
+    """城市边界文件的内容哈希，边界数据变化时随之变化"""
+    return _get_boundary_layer(city).fingerprint
+
+
+def get_layer(city: str, layer_name: str, bbox=None, tolerance: float = 0.0) -> gpd.GeoDataFrame | None:
+    """
+    获取城市底图图层。
+    - bbox: (xmin, ymin, xmax, ymax)，只返回与该范围相交的要素，并裁剪到该范围内。
+    - tolerance: 简化容差(经纬度单位)，通常取输出图像中半个像素对应的距离。
+    图层文件不存在时返回 None。
+    """
+    path = os.path.join(city_data_path(city), f"{layer_name}.geojson")
+    layer = _get_layer(path)
+    if layer is None:
+        return None
+    if bbox is None and not tolerance:
+        return layer.gdf
+
+    bbox_key = tuple(round(float(v), 6) for v in bbox) if bbox is not None else None
+    cache_key = (path, layer.mtime, bbox_key, round(float(tolerance), 9))
+    cached = _view_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if bbox is not None:
+        gdf = layer.query(bbox)
+        geoms = shapely.clip_by_rect(gdf.geometry.values, *bbox)
+    else:
+        gdf = layer.gdf
+        geoms = gdf.geometry.values
+    if tolerance:
+        geoms = shapely.simplify(geoms, tolerance, preserve_topology=True)
+
+    view = gdf.set_geometry(gpd.GeoSeries(geoms, index=gdf.index, crs=gdf.crs))
+    view = view[~view.geometry.is_empty]
+    _view_cache[cache_key] = view
+    return view
+
+
+def layer_version(city: str, layer_name: str) -> int | None:
+    """图层文件的 mtime，用作派生缓存(如栅格叠加层)的版本号；文件不存在时返回 None"""
+    try:
+        return os.stat(os.path.join(city_data_path(city), f"{layer_name}.geojson")).st_mtime_ns
+    except OSError:
+        return None
+
+
+def pixel_tolerance(xmin: float, xmax: float, pixel_width: int) -> float:
+    """
+    根据显示范围与输出像素宽度计算简化容差：半个像素对应的经纬度距离。
+    小于这个尺度的顶点在输出图像上不可见。
+    """
+    return abs(xmax - xmin) / max(int(pixel_width), 1) * 0.5
@@ -0,0 +1,96 @@
+# 文件路径: app/services/grid_cache.py
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+from cachetools import LRUCache
+from app.config import settings
+
+# --- 插值结果缓存 ---
+# 内存层：按数组字节数计费的LRU，超出预算时淘汰最久未使用的网格
+_memory_cache = LRUCache(maxsize=settings.HEATMAP_GRID_CACHE_BYTES, getsizeof=lambda arr: arr.nbytes)
+_memory_lock = threading.Lock()
+
+
+def make_key(points: np.ndarray, values: np.ndarray, **params) -> str:
+    """
+    根据点位/浓度数组内容和插值参数生成内容寻址的缓存键。
+    params 中的参数(插值方法、网格分辨率、边界指纹等)按名称排序后参与哈希。
+    """
+    h = hashlib.sha256()
+    for arr in (points, values):
+        arr = np.ascontiguousarray(arr, dtype=np.float64)
+        h.update(str(arr.shape).encode())
+        h.update(arr.tobytes())
+    for name in sorted(params):
+        h.update(f"|{name}={params[name]}".encode())
+    return h.hexdigest()
+
+
+def _disk_path(key: str) -> str | None:
+    cache_dir = settings.HEATMAP_GRID_CACHE_DIR
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, f"{key}.npy")
+
+
+def _read_disk(key: str) -> np.ndarray | None:
+    path = _disk_path(key)
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return np.load(path, allow_pickle=False)
+    except (OSError, ValueError) as e:
+        print(f"读取插值缓存文件失败: {e}")
+        return None
+
+
+def _write_disk(key: str, grid: np.ndarray):
+    path = _disk_path(key)
+    if not path:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换，避免其他进程读到写了一半的文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, grid, allow_pickle=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"写入插值缓存文件失败: {e}")
+
+
+def _remember(key: str, grid: np.ndarray) -> np.ndarray:
+    grid.flags.writeable = False  # 缓存中的数组被多个请求共享，禁止原地修改
+    if grid.nbytes <= _memory_cache.maxsize:
+        with _memory_lock:
+            _memory_cache[key] = grid
+    return grid
+
+
+def get(key: str) -> np.ndarray | None:
+    """依次查询内存层和磁盘层，命中磁盘层时回填内存层"""
+    with _memory_lock:
+        grid = _memory_cache.get(key)
+    if grid is not None:
+        return grid
+    grid = _read_disk(key)
+    if grid is not None:
+        return _remember(key, grid)
+    return None
+
+
+def put(key: str, grid: np.ndarray) -> np.ndarray:
+    grid = _remember(key, np.asarray(grid))
+    _write_disk(key, grid)
+    return grid
+
+
+def get_or_compute(key: str, compute) -> np.ndarray:
+    """命中缓存直接返回，否则调用 compute() 计算并写入缓存"""
+    grid = get(key)
+    if grid is None:
+        grid = put(key, compute())
+    return grid
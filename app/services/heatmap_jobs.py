@@ -0,0 +1,246 @@
+# 文件路径: app/services/heatmap_jobs.py
+
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.config import settings
+
+# --- 热力图任务进程池 ---
+# 克里金插值与绘图是CPU密集型任务，放到独立的进程池中执行，
+# 避免阻塞 gevent worker 的事件循环(以及同一进程上的天气、地图等轻量请求)。
+# 任务ID由上传文件内容和选项计算得到，相同的请求共用同一个任务。
+# 任务状态与结果写在各Web进程共享的目录中，轮询请求落到哪个进程都能查到。
+_executor = None
+_executor_lock = threading.Lock()
+_inflight = {}  # 本进程提交且尚未完成的任务: job_id -> Future
+_tasks = {}  # 本进程提交且尚未完成的轻量任务(如瓦片细化): key -> Future
+_last_cleanup = 0.0
+
+# 其他进程留下的"执行中"标记超过这个时间仍未完成，视为该进程已异常退出
+_PENDING_STALE_SECONDS = settings.HEATMAP_JOB_TIMEOUT * 2
+
+
+class QueueFullError(Exception):
+    """本进程排队中的热力图任务数已达上限"""
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 使用 spawn 启动子进程，不继承 gevent 已打补丁的运行状态
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.HEATMAP_POOL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def job_id_for(file_bytes: bytes, options: dict) -> str:
+    """相同的文件内容 + 相同的选项 => 相同的任务ID"""
+    h = hashlib.sha256(file_bytes)
+    h.update(json.dumps(options, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _job_path(job_id: str, suffix: str) -> str:
+    return os.path.join(settings.HEATMAP_JOB_DIR, f"{job_id}.{suffix}")
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _run_job(job_id: str, file_bytes: bytes, options: dict):
+    """在进程池子进程中执行：生成热力图并把结果写入共享目录"""
+    from app.services.heatmap_service import render_heatmap
+    from app.services.raster_renderer import IMAGE_FORMATS
+
+    result = render_heatmap(file_bytes, options)
+    if result is None:
+        _write_atomic(_job_path(job_id, 'error'), "后端生成热力图失败，请检查服务器日志".encode('utf-8'))
+    else:
+        meta = {
+            'format': result['format'],
+            'mimetype': IMAGE_FORMATS[result['format']][1],
+            'value_range': list(result['value_range']),
+            # 图片内容哈希，作为 HTTP ETag
+            'etag': hashlib.sha256(result['image']).hexdigest()[:32],
+            'surface_id': result['surface_id'],
+        }
+        _write_atomic(_job_path(job_id, 'image'), result['image'])
+        _write_atomic(_job_path(job_id, 'json'), json.dumps(meta).encode('utf-8'))
+    try:
+        os.remove(_job_path(job_id, 'pending'))
+    except OSError:
+        pass
+    return result
+
+
+def _cleanup_expired():
+    """删除超过保留时间的任务文件，最多每分钟扫描一次"""
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < 60:
+        return
+    _last_cleanup = now
+    try:
+        for name in os.listdir(settings.HEATMAP_JOB_DIR):
+            path = os.path.join(settings.HEATMAP_JOB_DIR, name)
+            if now - os.path.getmtime(path) > settings.HEATMAP_JOB_RESULT_TTL:
+                os.remove(path)
+    except OSError as e:
+        print(f"清理热力图任务文件失败: {e}")
+
+
+def _on_done(job_id: str, future):
+    _inflight.pop(job_id, None)
+    exc = future.exception()
+    if exc is not None:
+        print(f"热力图任务 {job_id} 执行失败: {exc}")
+        if isinstance(exc, BrokenProcessPool):
+            _reset_executor()
+        try:
+            _write_atomic(_job_path(job_id, 'error'), "热力图任务执行失败".encode('utf-8'))
+            os.remove(_job_path(job_id, 'pending'))
+        except OSError:
+            pass
+
+
+def submit(file_bytes: bytes, options: dict) -> str:
+    """
+    提交热力图任务并返回任务ID。
+    已有结果或相同任务正在执行(本进程或其他进程)时不会重复提交；
+    本进程排队任务数达到 HEATMAP_QUEUE_LIMIT 时抛出 QueueFullError。
+    """
+    os.makedirs(settings.HEATMAP_JOB_DIR, exist_ok=True)
+    _cleanup_expired()
+
+    job_id = job_id_for(file_bytes, options)
+    if job_id in _inflight or os.path.exists(_job_path(job_id, 'json')):
+        return job_id
+    pending_path = _job_path(job_id, 'pending')
+    if os.path.exists(pending_path) and time.time() - os.path.getmtime(pending_path) < _PENDING_STALE_SECONDS:
+        return job_id
+
+    if len(_inflight) >= settings.HEATMAP_QUEUE_LIMIT:
+        raise QueueFullError()
+
+    # 重新提交时清除上一次失败留下的错误标记
+    try:
+        os.remove(_job_path(job_id, 'error'))
+    except OSError:
+        pass
+    _write_atomic(pending_path, b'')
+
+    try:
+        try:
+            future = _get_executor().submit(_run_job, job_id, file_bytes, options)
+        except BrokenProcessPool:
+            _reset_executor()
+            future = _get_executor().submit(_run_job, job_id, file_bytes, options)
+    except BaseException:
+        # 提交失败(进程池已关闭等)时清除"执行中"标记，否则任务会一直显示为 pending 且无法重新提交
+        try:
+            os.remove(pending_path)
+        except OSError:
+            pass
+        raise
+    _inflight[job_id] = future
+    future.add_done_callback(lambda f: _on_done(job_id, f))
+    return job_id
+
+
+def submit_task(key, fn, *args):
+    """
+    在进程池中执行 fn(*args)，用于瓦片细化等结果只在本进程使用、不需要写入共享目录的小任务。
+    相同 key 的任务正在执行时返回同一个 Future；本进程排队的小任务数达到 HEATMAP_QUEUE_LIMIT 时返回 None。
+    fn 必须是模块级函数(子进程以 spawn 方式启动，按名称导入)。
+    """
+    future = _tasks.get(key)
+    if future is not None:
+        return future
+    if len(_tasks) >= settings.HEATMAP_QUEUE_LIMIT:
+        return None
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        _reset_executor()
+        future = _get_executor().submit(fn, *args)
+    _tasks[key] = future
+    future.add_done_callback(lambda f: _on_task_done(key, f))
+    return future
+
+
+def _on_task_done(key, future):
+    _tasks.pop(key, None)
+    exc = future.exception()
+    if exc is not None:
+        print(f"进程池任务 {key} 执行失败: {exc}")
+        if isinstance(exc, BrokenProcessPool):
+            _reset_executor()
+
+
+def get_status(job_id: str) -> dict:
+    """
+    查询任务状态：
+    {'status': 'done', 'image': bytes, 'format': ..., 'mimetype': ..., 'value_range': ..., 'etag': ...,
+     'surface_id': ...}
+    {'status': 'pending'} / {'status': 'failed', 'message': ...} / {'status': 'unknown'}
+    """
+    if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+        return {'status': 'unknown'}
+    try:
+        with open(_job_path(job_id, 'json'), 'rb') as f:
+            meta = json.loads(f.read())
+        with open(_job_path(job_id, 'image'), 'rb') as f:
+            return {'status': 'done', 'image': f.read(), **meta}
+    except FileNotFoundError:
+        pass
+    if job_id in _inflight or os.path.exists(_job_path(job_id, 'pending')):
+        return {'status': 'pending'}
+    try:
+        with open(_job_path(job_id, 'error'), 'rb') as f:
+            return {'status': 'failed', 'message': f.read().decode('utf-8')}
+    except FileNotFoundError:
+        return {'status': 'unknown'}
+
+
+def run(file_bytes: bytes, options: dict, timeout: float | None = None) -> dict:
+    """
+    同步模式：提交任务并等待完成，返回值同 get_status，并附带 job_id。
+    超时仍未完成时返回 {'status': 'pending', 'job_id': ...}，可继续轮询。
+    在 gevent 下等待是协作式的，不会阻塞同一进程上的其他请求。
+    """
+    timeout = settings.HEATMAP_JOB_TIMEOUT if timeout is None else timeout
+    job_id = submit(file_bytes, options)
+    deadline = time.monotonic() + timeout
+
+    future = _inflight.get(job_id)
+    if future is not None:
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            pass  # 失败信息已由 _on_done 写入共享目录
+
+    while True:
+        status = get_status(job_id)
+        if status['status'] != 'pending' or time.monotonic() >= deadline:
+            return {**status, 'job_id': job_id}
+        # 任务由其他进程执行，轮询共享目录
+        time.sleep(0.2)
@@ -1,149 +1,273 @@
 # 文件路径: app/services/heatmap_service.py
 
-import pandas as pd
-import geopandas as gpd
-import numpy as np
 import matplotlib
 
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import matplotlib as mpl  # 新增导入mpl
-from scipy.interpolate import Rbf
-from pykrige.ok import OrdinaryKriging
-from shapely.geometry import Polygon, MultiPolygon
+from scipy import ndimage
+import numpy as np
 import io
 import base64
-import os
+from app.config import settings
+from app.services import geodata_registry, grid_cache, ingestion, overlay_cache, raster_renderer, surface_store
+from app.services.interpolation import interpolate_grid, resample_grid
 
 plt.rcParams['font.sans-serif'] = ['SimHei']
 plt.rcParams['axes.unicode_minus'] = False
-# --- 全局路径设置 ---
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PROVINCE_DATA_PATH = os.path.join(os.path.dirname(BASE_DIR), 'shanxigeo')
 
+# --- 输出尺寸设置 ---
+FIGURE_SIZE_INCHES = 12
+FIGURE_DPI = 150
+# 默认显示范围 (xmin, xmax, ymin, ymax)
+DEFAULT_VIEW_EXTENT = (111.4, 113.3, 37.2, 38.5)
+# 栅格渲染模式(render_mode='raster')的默认输出宽度(像素)
+DEFAULT_RASTER_WIDTH = 1200
+# 插值掩膜向边界外扩展的网格数，保证边界附近的像素在双线性重采样时有完整的邻点
+MASK_HALO_CELLS = 2
 
-def create_heatmap_image(excel_file, options):
+
+def _resolve_view_extent(options) -> tuple:
+    """解析用户自定义的显示范围，未提供或不完整时使用默认范围"""
+    extent = options.get('extent')
+    if extent and all(k in extent for k in ['xmin', 'xmax', 'ymin', 'ymax']):
+        return extent['xmin'], extent['xmax'], extent['ymin'], extent['ymax']
+    return DEFAULT_VIEW_EXTENT
+
+
+def compute_grid(points, values, options):
+    """
+    插值阶段：在裁剪多边形(边界文件的第一个要素)外接矩形范围的规则网格上插值。
+    只计算位于城市边界内(外扩 MASK_HALO_CELLS 格)的网格点，其余为 NaN。
+    结果以点位/浓度数据、插值方法、网格分辨率、网格范围和城市边界为键缓存，
+    并保存为可供瓦片/导出接口复用的插值曲面。
+    返回 (grid_z, bounds, surface_id)，bounds 为 (xmin, ymin, xmax, ymax)。
+    """
+    city_folder = options.get('city', 'taiyuangeo')
+    # 网格只覆盖裁剪多边形；边界文件中的其他要素在裁剪范围之外，不参与插值
+    bounds = tuple(float(v) for v in geodata_registry.get_clip_geometry(city_folder).bounds)
+    resolution = int(options.get('grid_resolution', 200))
+    interp_method = options.get('interpolation_method', 'kriging')
+
+    key = grid_cache.make_key(
+        points, values,
+        method=interp_method,
+        resolution=resolution,
+        bounds=bounds,
+        boundary=geodata_registry.boundary_fingerprint(city_folder),
+        masked=MASK_HALO_CELLS,
+    )
+
+    def _solve():
+        mask = geodata_registry.get_boundary_mask(city_folder, bounds, (resolution, resolution))
+        mask = ndimage.binary_dilation(mask, iterations=MASK_HALO_CELLS)
+        return interpolate_grid(points, values, bounds, resolution, interp_method, mask=mask)
+
+    grid_z = grid_cache.get_or_compute(key, _solve)
+    surface_store.save_surface(key, grid_z, bounds, points, values, city_folder, interp_method)
+    return grid_z, bounds, key
+
+
+def _value_range(grid_z, bounds, city_folder) -> tuple:
+    """
+    色标的数值范围：插值网格中位于裁剪多边形内的有效值的最小/最大值，图表与栅格两种模式共用
+    (同一曲面的图例一致)。没有有效值时为 (0.0, 1.0)。
+    """
+    values = grid_z[geodata_registry.get_boundary_mask(city_folder, bounds, grid_z.shape)]
+    values = values[np.isfinite(values)]
+    if not values.size:
+        return 0.0, 1.0
+    return float(values.min()), float(values.max())
+
+
+def _view_raster(grid_z, bounds, city_folder, view_extent, pixel_width):
+    """
+    将插值网格重采样为显示范围内、接近输出像素分辨率的栅格，并用同分辨率的边界掩膜裁剪
+    (边界外为 NaN，绘制时透明)。栅格只覆盖显示范围与裁剪多边形外接矩形的交集。
+    返回 (raster, imshow_extent)，两者不相交时返回 (None, None)。
+    """
+    view_xmin, view_xmax, view_ymin, view_ymax = view_extent
+    cxmin, cymin, cxmax, cymax = geodata_registry.get_clip_geometry(city_folder).bounds
+    rxmin, rxmax = max(view_xmin, cxmin, bounds[0]), min(view_xmax, cxmax, bounds[2])
+    rymin, rymax = max(view_ymin, cymin, bounds[1]), min(view_ymax, cymax, bounds[3])
+    if rxmin >= rxmax or rymin >= rymax:
+        return None, None
+
+    pixel_size = (view_xmax - view_xmin) / pixel_width
+    shape = (max(int(round((rxmax - rxmin) / pixel_size)), 2), max(int(round((rymax - rymin) / pixel_size)), 2))
+    raster_bounds = (rxmin, rymin, rxmax, rymax)
+
+    raster = resample_grid(grid_z, bounds, raster_bounds, shape)
+    raster[~geodata_registry.get_boundary_mask(city_folder, raster_bounds, shape)] = np.nan
+
+    # 栅格值位于像素中心，imshow 的范围向外扩半个像素
+    half_x = (rxmax - rxmin) / (shape[0] - 1) / 2
+    half_y = (rymax - rymin) / (shape[1] - 1) / 2
+    return raster, (rxmin - half_x, rxmax + half_x, rymin - half_y, rymax + half_y)
+
+
+def _render_raster(points, values, options) -> dict:
+    """
+    栅格渲染模式：不经过 pyplot，直接用 NumPy 生成图像。
+    插值网格按输出像素重采样 -> 256 级色标查找表着色 -> 边界掩膜裁剪 -> 混合缓存的底图叠加层
+    -> 描边 -> 叠加监测点 -> 直接编码PNG。
+    不含色标条，色标对应的数值范围通过 value_range 返回。
+    """
+    city_folder = options.get('city', 'taiyuangeo')
+    grid_z, grid_bounds, surface_id = compute_grid(points, values, options)
+    view_xmin, view_xmax, view_ymin, view_ymax = _resolve_view_extent(options)
+
+    # 接口已校验 image_width 为整数；这里再截断一次，直接调用时同样不会生成过大的栅格
+    width = min(max(int(options.get('image_width', DEFAULT_RASTER_WIDTH)), settings.HEATMAP_RASTER_MIN_WIDTH),
+                settings.HEATMAP_RASTER_MAX_WIDTH)
+    pixel_size = (view_xmax - view_xmin) / width
+    height = max(int(round((view_ymax - view_ymin) / pixel_size)), 1)
+    # 像素中心坐标范围
+    pixel_bounds = (view_xmin + pixel_size / 2, view_ymin + pixel_size / 2,
+                    view_xmax - pixel_size / 2, view_ymax - pixel_size / 2)
+
+    raster = resample_grid(grid_z, grid_bounds, pixel_bounds, (width, height))
+    mask = geodata_registry.get_boundary_mask(city_folder, pixel_bounds, (width, height))
+    raster[~mask] = np.nan
+
+    vmin, vmax = _value_range(grid_z, grid_bounds, city_folder)
+    lut = raster_renderer.get_colormap_lut(options.get('colormap', 'classic_custom'))
+    rgba = raster_renderer.apply_colormap(raster, lut, vmin, vmax)
+
+    # 线宽、点大小与图表模式保持相同的物理尺寸：整幅宽度对应 FIGURE_SIZE_INCHES 英寸
+    dpi = width / FIGURE_SIZE_INCHES
+    layer_names = options.get('map_layers', [])
+    if layer_names:
+        overlay = overlay_cache.get_overlay(
+            city_folder, layer_names, (view_xmin, view_xmax, view_ymin, view_ymax), (width, height), dpi
+        )
+        overlay_cache.composite(rgba, overlay)
+    raster_renderer.draw_outline(rgba, mask)
+
+    if options.get('show_points', False):
+        # point_size 单位为 pt²
+        radius = max(int(round(np.sqrt(options.get('point_size', 20)) / 2 * dpi / 72)), 1)
+        cols = np.floor((points[:, 0] - view_xmin) / pixel_size).astype(int)
+        rows = np.floor((view_ymax - points[:, 1]) / pixel_size).astype(int)
+        raster_renderer.draw_points(rgba, np.column_stack([cols, rows]), radius)
+
+    image_format = options.get('image_format', 'png')
+    image = raster_renderer.encode_image(
+        rgba, image_format, options.get('quality', raster_renderer.DEFAULT_WEBP_QUALITY)
+    )
+    return {'image': image, 'format': image_format, 'value_range': (vmin, vmax), 'surface_id': surface_id}
+
+
+def _render_figure(points, values, options) -> dict:
     """
     【最终样式优化版】
     - 移除所有标题和标签文字。
     - 新增并支持一个名为'classic_custom'的自定义色标。
     """
+    # --- 2. 底图加载 (从进程内注册表读取，不再每次解析GeoJSON) ---
+    city_folder = options.get('city', 'taiyuangeo')
+    boundary_gdf = geodata_registry.get_boundary(city_folder)
+
+    # --- 3. 空间插值计算 (结果按内容缓存，仅修改样式时跳过求解) ---
+    grid_z, grid_bounds, surface_id = compute_grid(points, values, options)
+    view_xmin, view_xmax, view_ymin, view_ymax = _resolve_view_extent(options)
+
+    # --- 4. 开始绘图 ---
+    fig, ax = plt.subplots(figsize=(FIGURE_SIZE_INCHES, FIGURE_SIZE_INCHES), dpi=FIGURE_DPI)
+    ax.set_aspect('equal')
+
+    # --- 【修改点1】色标处理逻辑 ---
+    # 默认使用'经典色标'(classic_custom)，也支持Matplotlib的内置色标
+    colormap = raster_renderer.get_colormap(options.get('colormap', 'classic_custom'))
+
+    # --- 5. 裁剪与图层绘制 ---
+    # 插值网格按输出像素重采样，并用边界栅格掩膜裁剪(包含多边形的所有部分)，
+    # 不再在绘制时使用矢量裁剪路径
+    raster, raster_extent = _view_raster(
+        grid_z, grid_bounds, city_folder, (view_xmin, view_xmax, view_ymin, view_ymax),
+        FIGURE_SIZE_INCHES * FIGURE_DPI
+    )
+    if raster is None:
+        # 显示范围与城市边界不相交时，仍绘制空图层以保留色标条
+        raster, raster_extent = np.full((2, 2), np.nan), (view_xmin, view_xmax, view_ymin, view_ymax)
+    vmin, vmax = _value_range(grid_z, grid_bounds, city_folder)
+    heatmap = ax.imshow(
+        raster.T, extent=raster_extent, origin='lower',
+        cmap=colormap, interpolation='nearest', vmin=vmin, vmax=vmax
+    )
+
+    # 图层只取显示范围内的要素，并按输出分辨率简化，不绘制看不见的顶点
+    view_bbox = (view_xmin, view_ymin, view_xmax, view_ymax)
+    tolerance = geodata_registry.pixel_tolerance(view_xmin, view_xmax, FIGURE_SIZE_INCHES * FIGURE_DPI)
+    for layer_name in options.get('map_layers', []):
+        layer_gdf = geodata_registry.get_layer(city_folder, layer_name, bbox=view_bbox, tolerance=tolerance)
+        if layer_gdf is not None and not layer_gdf.empty:
+            layer_gdf.plot(ax=ax, **overlay_cache.layer_style(layer_name))
+    boundary_gdf.plot(ax=ax, edgecolor='black', facecolor='none', linewidth=1.5, zorder=5)
+    if options.get('show_points', False):
+        point_size = options.get('point_size', 20)
+        ax.scatter(points[:, 0], points[:, 1], s=point_size, c='black', edgecolors='white', linewidths=0.5,
+                   zorder=10)
+
+    # --- 6. 设置图表样式 (【修改点2】移除所有文本) ---
+    # ax.set_title("污染物浓度空间插值热力图", fontsize=18) # 移除标题
+    fig.colorbar(heatmap, ax=ax, shrink=0.75)  # 保留色标条，但移除标签文字
+
+    # 使用固定的默认显示范围 (除非用户自定义)
+    ax.set_xlim(view_xmin, view_xmax)
+    ax.set_ylim(view_ymin, view_ymax)
+
+    # 移除坐标轴的刻度和标签
+    ax.set_xticks([])
+    ax.set_yticks([])
+    ax.set_xlabel("")
+    ax.set_ylabel("")
+
+    ax.set_facecolor('white')
+    fig.set_facecolor('white')
+
+    # --- 7. 输出图片 (不变) ---
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0.05)  # pad_inches=0.0 尽可能减少白边
+    plt.close(fig)
+
+    image_format = options.get('image_format', 'png')
+    image = raster_renderer.reencode_png(
+        buf.getvalue(), image_format, options.get('quality', raster_renderer.DEFAULT_WEBP_QUALITY)
+    )
+    return {
+        'image': image, 'format': image_format,
+        'value_range': (vmin, vmax), 'surface_id': surface_id,
+    }
+
+
+def render_heatmap(excel_file, options) -> dict | None:
+    """
+    生成热力图，返回 {'image': 图片字节, 'format': 图片格式, 'value_range': (vmin, vmax), 'surface_id': 插值曲面ID}，
+    失败时返回 None。
+    options['image_format']: 'png' (默认) / 'png8' (调色板PNG) / 'webp' (配合 options['quality'] 使用)。
+    options['render_mode']:
+    - 'figure' (默认): Matplotlib 图表，带色标条，支持全部底图图层。
+    - 'raster': NumPy 直接渲染，速度快、内存小、不依赖 pyplot 全局状态；
+      底图图层(map_layers)预先栅格化并缓存，每次请求只做 alpha 混合。
+    """
     try:
-        # --- 1. 数据读取与准备 (不变) ---
-        df = pd.read_excel(excel_file)
-        points = df[['经度', '纬度']].values
-        values = df['污染物浓度'].values
-
-        # --- 2. 路径与底图加载 (不变) ---
-        city_folder = options.get('city', 'taiyuangeo')
-        CITY_DATA_PATH = os.path.join(PROVINCE_DATA_PATH, city_folder)
-        boundary_gdf = gpd.read_file(os.path.join(CITY_DATA_PATH, 'boundary.geojson'))
-
-        # --- 3. 空间插值计算 (不变) ---
-        xmin, ymin, xmax, ymax = boundary_gdf.total_bounds
-        resolution = options.get('grid_resolution', 200)
-        grid_x, grid_y = np.mgrid[xmin:xmax:complex(0, resolution), ymin:ymax:complex(0, resolution)]
-        interp_method = options.get('interpolation_method', 'kriging')
-        # (插值逻辑不变)
-        if interp_method == 'kriging':
-            OK = OrdinaryKriging(points[:, 0], points[:, 1], values, variogram_model='linear', verbose=False,
-                                 enable_plotting=False)
-            gridx_1d = np.linspace(xmin, xmax, resolution)
-            gridy_1d = np.linspace(ymin, ymax, resolution)
-            grid_z, ss = OK.execute('grid', gridx_1d, gridy_1d)
-            grid_z = grid_z.T
-        elif interp_method == 'rbf':
-            rbfi = Rbf(points[:, 0], points[:, 1], values, function='multiquadric', smooth=0)
-            grid_z = rbfi(grid_x, grid_y)
-        else:
-            OK = OrdinaryKriging(points[:, 0], points[:, 1], values, variogram_model='linear', verbose=False,
-                                 enable_plotting=False)
-            gridx_1d = np.linspace(xmin, xmax, resolution)
-            gridy_1d = np.linspace(ymin, ymax, resolution)
-            grid_z, ss = OK.execute('grid', gridx_1d, gridy_1d)
-            grid_z = grid_z.T
-
-        # --- 4. 开始绘图 ---
-        fig, ax = plt.subplots(figsize=(12, 12), dpi=150)
-        ax.set_aspect('equal')
-
-        # --- 【修改点1】色标处理逻辑 ---
-        colormap_name = options.get('colormap', 'classic_custom')  # 将'经典色标'设为默认
-
-        if colormap_name == 'classic_custom':
-            # 定义并使用您的自定义色标
-            custom_colors = [(0, '#00FFFF'), (0.2, '#9FFF56'), (0.35, '#FFDD00'), (0.7, "#FE2801"), (1, '#8B0000')]
-            colormap = mpl.colors.LinearSegmentedColormap.from_list('classic_custom', custom_colors, N=256)
-        else:
-            # 使用Matplotlib的内置色标
-            colormap = plt.get_cmap(colormap_name)
-
-        heatmap = ax.imshow(
-            grid_z.T, extent=(xmin, xmax, ymin, ymax), origin='lower',
-            cmap=colormap, interpolation='bilinear'
-        )
+        # --- 1. 数据读取与准备 ---
+        df = ingestion.load_points(excel_file)
+        points = df[['lng', 'lat']].values
+        values = df['concentration'].values
 
-        # --- 5. 裁剪与图层绘制 (不变) ---
-        # (此部分裁剪和绘制逻辑与上一版完全相同，无需修改)
-        clip_geom = boundary_gdf.geometry.iloc[0]
-        clipping_path_polygon = None
-        if isinstance(clip_geom, Polygon):
-            clipping_path_polygon = plt.Polygon(clip_geom.exterior.coords, transform=ax.transData)
-        elif isinstance(clip_geom, MultiPolygon):
-            largest_polygon = max(clip_geom.geoms, key=lambda p: p.area)
-            clipping_path_polygon = plt.Polygon(largest_polygon.exterior.coords, transform=ax.transData)
-        if clipping_path_polygon:
-            heatmap.set_clip_path(clipping_path_polygon)
-        for layer_name in options.get('map_layers', []):
-            layer_path = os.path.join(CITY_DATA_PATH, f"{layer_name}.geojson")
-            if os.path.exists(layer_path):
-                layer_gdf = gpd.read_file(layer_path)
-                if 'road' in layer_name or 'highway' in layer_name:
-                    layer_gdf.plot(ax=ax, edgecolor='#4a4a4a', linewidth=0.4, alpha=0.7, zorder=3)
-                elif 'water' in layer_name or 'river' in layer_name:
-                    layer_gdf.plot(ax=ax, edgecolor='#3498db', facecolor='#3498db', linewidth=0.8, alpha=0.6, zorder=2)
-                elif 'rail' in layer_name:
-                    layer_gdf.plot(ax=ax, edgecolor='#5e5e5e', linewidth=0.4, linestyle='--', zorder=3)
-                else:
-                    layer_gdf.plot(ax=ax, edgecolor='white', facecolor='none', linewidth=0.6, linestyle=':', zorder=2)
-        boundary_gdf.plot(ax=ax, edgecolor='black', facecolor='none', linewidth=1.5, zorder=5)
-        if options.get('show_points', False):
-            point_size = options.get('point_size', 20)
-            ax.scatter(points[:, 0], points[:, 1], s=point_size, c='black', edgecolors='white', linewidths=0.5,
-                       zorder=10)
-
-        # --- 6. 设置图表样式 (【修改点2】移除所有文本) ---
-        # ax.set_title("污染物浓度空间插值热力图", fontsize=18) # 移除标题
-        fig.colorbar(heatmap, ax=ax, shrink=0.75)  # 保留色标条，但移除标签文字
-
-        # 使用固定的默认显示范围 (除非用户自定义)
-        if 'extent' in options and options.get('extent'):
-            extent = options['extent']
-            if all(k in extent for k in ['xmin', 'xmax', 'ymin', 'ymax']):
-                ax.set_xlim(extent['xmin'], extent['xmax'])
-                ax.set_ylim(extent['ymin'], extent['ymax'])
-        else:
-            ax.set_xlim(111.4, 113.3)
-            ax.set_ylim(37.2, 38.5)
-
-        # 移除坐标轴的刻度和标签
-        ax.set_xticks([])
-        ax.set_yticks([])
-        ax.set_xlabel("")
-        ax.set_ylabel("")
-
-        ax.set_facecolor('white')
-        fig.set_facecolor('white')
-
-        # --- 7. 输出图片 (不变) ---
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0.05)  # pad_inches=0.0 尽可能减少白边
-        buf.seek(0)
-        image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-        plt.close(fig)
-
-        return image_base64
+        if options.get('render_mode') == 'raster':
+            return _render_raster(points, values, options)
+        return _render_figure(points, values, options)
 
     except Exception as e:
         print(f"ERROR in heatmap_service: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def create_heatmap_image(excel_file, options):
+    """生成热力图并返回 base64 编码的图片，失败时返回 None"""
+    result = render_heatmap(excel_file, options)
+    if result is None:
+        return None
+    return base64.b64encode(result['image']).decode('utf-8')
\ No newline at end of file
@@ -0,0 +1,152 @@
+# 文件路径: app/services/heatmap_tiles.py
+
+import math
+import threading
+from functools import lru_cache
+
+import numpy as np
+from cachetools import LRUCache
+from scipy import ndimage
+from app.config import settings
+from app.services import geodata_registry, heatmap_jobs, raster_renderer, surface_store
+from app.services.interpolation import interpolate_grid, sample_grid
+
+# --- XYZ 瓦片 ---
+# 与天气图层代理相同的 Web Mercator 瓦片方案 (z/x/y，256×256 像素)。
+# 瓦片从已保存的插值曲面上采样；缩放级别足够深、基础网格过于粗糙时，
+# 只对该瓦片范围重新插值(惰性细化)，不需要重新计算整张热力图。
+# 细化在热力图进程池中执行，不阻塞 gevent worker：完成前先返回从基础网格采样的粗略瓦片(不缓存)，
+# 完成后细化网格保存在本进程的缓存中，之后的请求返回细化瓦片。
+TILE_SIZE = 256
+MAX_ZOOM = 20
+# 一个瓦片横跨的基础网格数少于该值时，在瓦片范围内按 REFINE_NODES×REFINE_NODES 网格重新插值
+REFINE_NODES = 64
+# 全局插值方法在点数不超过该值时用原方法细化，否则换用对应的局部方法
+REFINE_GLOBAL_MAX_POINTS = 500
+TRANSPARENT = (0, 0, 0, 0)
+
+_tile_cache = LRUCache(maxsize=settings.HEATMAP_TILE_CACHE_BYTES, getsizeof=len)
+# 已完成的细化网格: (surface_id, z, x, y) -> (网格, 网格范围)；网格为 None 表示瓦片范围全部在边界外
+_refined_cache = LRUCache(maxsize=settings.HEATMAP_TILE_CACHE_BYTES, getsizeof=lambda entry: (
+    entry[0].nbytes if entry[0] is not None else 1))
+_tile_lock = threading.Lock()
+
+
+def is_valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _tile_lat(y_frac: np.ndarray, z: int) -> np.ndarray:
+    """瓦片行坐标(可为小数) -> 纬度"""
+    return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y_frac / 2 ** z))))
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple:
+    """瓦片的经纬度范围 (lon_min, lat_min, lon_max, lat_max)"""
+    n = 2 ** z
+    lat_max, lat_min = _tile_lat(np.array([y, y + 1]), z)
+    return x / n * 360.0 - 180.0, float(lat_min), (x + 1) / n * 360.0 - 180.0, float(lat_max)
+
+
+def _pixel_centres(z: int, x: int, y: int):
+    """瓦片像素中心的经度(从西到东)和纬度(从南到北)"""
+    offsets = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    lons = (x + offsets) / 2 ** z * 360.0 - 180.0
+    lats = _tile_lat(y + offsets, z)[::-1]
+    return lons, lats
+
+
+@lru_cache(maxsize=1)
+def empty_tile() -> bytes:
+    return raster_renderer.encode_image(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+def _refine_method(method: str, n_points: int) -> str | None:
+    if n_points <= REFINE_GLOBAL_MAX_POINTS or method in ('local_kriging', 'idw'):
+        return method
+    return {'kriging': 'local_kriging'}.get(method)
+
+
+def refine_tile(points: np.ndarray, values: np.ndarray, city: str, method: str, z: int, x: int, y: int):
+    """
+    惰性细化(在进程池子进程中执行)：在瓦片范围(外扩一个节点)内重新插值，只计算边界内的节点。
+    返回 (细化网格, 网格范围)；瓦片范围全部在边界外时网格为 None。
+    """
+    lon_min, lat_min, lon_max, lat_max = tile_bounds(z, x, y)
+    step_x = (lon_max - lon_min) / (REFINE_NODES - 3)
+    step_y = (lat_max - lat_min) / (REFINE_NODES - 3)
+    node_bounds = (lon_min - step_x, lat_min - step_y, lon_max + step_x, lat_max + step_y)
+    mask = geodata_registry.get_boundary_mask(city, node_bounds, (REFINE_NODES, REFINE_NODES))
+    if not mask.any():
+        return None, node_bounds
+    mask = ndimage.binary_dilation(mask, iterations=2)
+    return interpolate_grid(points, values, node_bounds, REFINE_NODES, method, mask=mask), node_bounds
+
+
+def _store_refined(key, future):
+    if future.exception() is None:
+        with _tile_lock:
+            _refined_cache[key] = future.result()
+
+
+def _sample_tile(surface_id, surface, z, x, y, lons, lats) -> tuple[np.ndarray, bool]:
+    """返回 (像素值, 是否为最终结果)；细化尚未完成时返回从基础网格采样的粗略结果"""
+    grid_z, bounds = surface['grid_z'], surface['bounds']
+    lon_min, lat_min, lon_max, lat_max = tile_bounds(z, x, y)
+    cell_width = (bounds[2] - bounds[0]) / (grid_z.shape[0] - 1)
+    method = _refine_method(surface['method'], len(surface['points']))
+
+    if method is None or (lon_max - lon_min) / cell_width >= REFINE_NODES:
+        return sample_grid(grid_z, bounds, lons, lats), True
+
+    key = (surface_id, z, x, y)
+    with _tile_lock:
+        refined = _refined_cache.get(key)
+    if refined is not None:
+        refined_z, node_bounds = refined
+        if refined_z is None:
+            return np.full((len(lons), len(lats)), np.nan), True
+        return sample_grid(refined_z, node_bounds, lons, lats), True
+
+    future = heatmap_jobs.submit_task(('refine', *key), refine_tile, surface['points'], surface['values'],
+                                      surface['city'], method, z, x, y)
+    if future is not None:
+        future.add_done_callback(lambda f: _store_refined(key, f))
+    return sample_grid(grid_z, bounds, lons, lats), False
+
+
+def render_tile(surface_id: str, z: int, x: int, y: int, colormap: str = 'classic_custom',
+                value_range=None) -> tuple[bytes, bool] | None:
+    """
+    渲染插值曲面的一个 PNG 瓦片(边界外透明)，返回 (PNG 字节, 是否为最终结果)。
+    需要细化的瓦片在细化完成前返回粗略瓦片(不是最终结果，调用方不应长期缓存)。
+    value_range 默认使用整个曲面的数值范围，保证不同缩放级别、不同瓦片之间颜色一致。
+    曲面不存在(或已过期)时返回 None。
+    """
+    surface = surface_store.load_surface(surface_id)
+    if surface is None:
+        return None
+    vmin, vmax = value_range if value_range is not None else surface['value_range']
+
+    key = (surface_id, z, x, y, colormap, float(vmin), float(vmax))
+    with _tile_lock:
+        tile = _tile_cache.get(key)
+    if tile is not None:
+        return tile, True
+
+    lon_min, lat_min, lon_max, lat_max = tile_bounds(z, x, y)
+    cxmin, cymin, cxmax, cymax = geodata_registry.get_clip_geometry(surface['city']).bounds
+    if lon_min > cxmax or lon_max < cxmin or lat_min > cymax or lat_max < cymin:
+        return empty_tile(), True
+
+    lons, lats = _pixel_centres(z, x, y)
+    raster, final = _sample_tile(surface_id, surface, z, x, y, lons, lats)
+    raster[~geodata_registry.boundary_contains(surface['city'], lons, lats)] = np.nan
+
+    lut = raster_renderer.get_colormap_lut(colormap)
+    rgba = raster_renderer.apply_colormap(raster, lut, vmin, vmax, background=TRANSPARENT)
+    tile = raster_renderer.encode_image(rgba)
+    if final:
+        with _tile_lock:
+            _tile_cache[key] = tile
+    return tile, final
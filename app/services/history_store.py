@@ -0,0 +1,57 @@
+# 文件路径: app/services/history_store.py
+
+import os
+import threading
+
+import orjson
+from app.config import settings
+from app.services import shared_sqlite
+
+# --- 已结束日期的历史天气存储 ---
+# 已经完全过去的某一天，其历史天气不会再变化，因此永久保存(不设过期时间)在各 worker 共享的 SQLite 文件中，
+# 按 (规范化的城市名, 日期) 存取。
+
+_conn = None
+_conn_pid = None
+_db_lock = threading.Lock()
+
+
+def _connection():
+    global _conn, _conn_pid
+    # gunicorn fork 出的子进程不能复用父进程的连接
+    if _conn is None or _conn_pid != os.getpid():
+        conn = shared_sqlite.connect(settings.WEATHER_HISTORY_PATH)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS weather_history ("
+            " city TEXT NOT NULL, date TEXT NOT NULL, value BLOB NOT NULL, PRIMARY KEY (city, date))"
+        )
+        _conn, _conn_pid = conn, os.getpid()
+    return _conn
+
+
+def get_many(city: str, dates: list) -> dict:
+    """返回已保存的 {日期: 历史天气}，未保存的日期不出现在结果中"""
+    if not settings.WEATHER_HISTORY_PATH or not dates:
+        return {}
+    placeholders = ','.join('?' * len(dates))
+    try:
+        with _db_lock:
+            rows = _connection().execute(
+                f"SELECT date, value FROM weather_history WHERE city = ? AND date IN ({placeholders})",
+                (city, *dates),
+            ).fetchall()
+    except Exception as e:
+        print(f"读取历史天气存储失败: {e}")
+        return {}
+    return {date: orjson.loads(value) for date, value in rows}
+
+
+def put(city: str, date: str, value: dict):
+    if not settings.WEATHER_HISTORY_PATH:
+        return
+    try:
+        with _db_lock:
+            _connection().execute("INSERT OR REPLACE INTO weather_history (city, date, value) VALUES (?, ?, ?)",
+                                  (city, date, orjson.dumps(value)))
+    except Exception as e:
+        print(f"写入历史天气存储失败: {e}")
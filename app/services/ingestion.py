@@ -0,0 +1,314 @@
+# 文件路径: app/services/ingestion.py
+
+import hashlib
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+from openpyxl import load_workbook
+from app.config import settings
+
+# --- 上传数据读取 ---
+# 地图点位上传与热力图生成共用的表格读取层：
+# 只读取需要的四列，并在读取时统一数据类型；解析结果按文件内容哈希缓存
+# (本进程内存 + 各进程共享的目录)，同一文件上传给地图和热力图只解析一次。
+# 支持 xlsx(openpyxl 只读流式)、xls、CSV(UTF-8/GBK)、Parquet 与 Arrow(需要 pyarrow)，
+# 按 BATCH_ROWS 行一批解析；传入文件路径时(如分块上传落盘的文件)不会把整个文件读入内存。
+# iter_tables 以同样的方式逐批读取其他表格(如企业碳排放清单)，列名映射由调用方提供。
+
+# 源文件列名 -> 内部列名
+COLUMNS = {'经度': 'lng', '纬度': 'lat', '污染物浓度': 'concentration', '标记名称': 'name'}
+NUMERIC_COLUMNS = ('lng', 'lat', 'concentration')
+# 按文本读取的 CSV 列
+_TEXT_DTYPE = {'标记名称': str}
+# 流式解析时每批的行数
+BATCH_ROWS = 50000
+# 解析逻辑变化时修改版本号，使旧的缓存失效
+_PARSER_VERSION = 1
+
+_memory_cache = LRUCache(
+    maxsize=settings.UPLOAD_PARSE_CACHE_BYTES,
+    getsizeof=lambda columns: sum(arr.nbytes for arr in columns.values()),
+)
+_memory_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+class MissingColumnsError(ValueError):
+    """上传文件缺少必要的列；missing 为缺少的内部列名"""
+
+    def __init__(self, missing):
+        self.missing = list(missing)
+        super().__init__(f"缺少必要的列: {', '.join(self.missing)}")
+
+
+def content_key(data: bytes) -> str:
+    h = hashlib.sha256(f"v{_PARSER_VERSION}|".encode())
+    h.update(data)
+    return h.hexdigest()
+
+
+def _detect_format(data: bytes) -> str:
+    """按文件头识别格式，无法识别的按 CSV 处理"""
+    if data[:4] == b'PK\x03\x04':
+        return 'xlsx'
+    if data[:8] == b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1':
+        return 'xls'
+    if data[:4] == b'PAR1':
+        return 'parquet'
+    if data[:6] == b'ARROW1':
+        return 'arrow'
+    if data[:4] == b'\xff\xff\xff\xff':
+        return 'arrow_stream'
+    return 'csv'
+
+
+def _source_columns(names, mapping: dict = COLUMNS) -> dict:
+    """源文件列名 -> 内部列名(只保留需要的列，忽略列名两端空白)"""
+    return {name: mapping[str(name).strip()] for name in names if name is not None and str(name).strip() in mapping}
+
+
+def _iter_xlsx(source, mapping: dict = COLUMNS):
+    """openpyxl 只读模式逐行读取第一个工作表，首行为表头，只取需要的列，每 BATCH_ROWS 行产出一批"""
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        wanted = _source_columns(header, mapping)
+        indices = {wanted[name]: i for i, name in enumerate(header) if name in wanted}
+        columns = {target: [] for target in indices}
+        count = 0
+        for row in rows:
+            cells = {target: row[i] if i < len(row) else None for target, i in indices.items()}
+            if all(v is None for v in cells.values()):
+                continue  # 跳过空行
+            for target, value in cells.items():
+                columns[target].append(value)
+            count += 1
+            if count == BATCH_ROWS:
+                yield columns
+                columns, count = {target: [] for target in indices}, 0
+        yield columns
+    finally:
+        workbook.close()
+
+
+def _read_pandas(frame: pd.DataFrame, mapping: dict = COLUMNS) -> dict:
+    return {mapping[str(name).strip()]: frame[name] for name in frame.columns}
+
+
+def _iter_csv(source, encoding: str, mapping: dict = COLUMNS, dtype=_TEXT_DTYPE):
+    usecols = lambda name: str(name).strip() in mapping
+    with pd.read_csv(source, usecols=usecols, encoding=encoding, dtype=dtype, chunksize=BATCH_ROWS) as reader:
+        for frame in reader:
+            yield _read_pandas(frame, mapping)
+
+
+def _iter_arrow(source, fmt: str, mapping: dict = COLUMNS):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("读取 Parquet/Arrow 文件需要安装 pyarrow")
+
+    if fmt == 'parquet':
+        parquet_file = pq.ParquetFile(source)
+        schema = parquet_file.schema_arrow
+        batches = parquet_file.iter_batches(batch_size=BATCH_ROWS, columns=list(_source_columns(schema.names, mapping)))
+    else:
+        reader = pa.ipc.open_file(source) if fmt == 'arrow' else pa.ipc.open_stream(source)
+        schema = reader.schema
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches)) if fmt == 'arrow' else reader
+    names = list(_source_columns(schema.names, mapping))
+    produced = False
+    for batch in batches:
+        produced = True
+        yield _read_pandas(pa.Table.from_batches([batch]).select(names).to_pandas(), mapping)
+    if not produced:
+        yield {mapping[str(name).strip()]: [] for name in names}
+
+
+def _iter_batches(source, fmt: str, encoding: str = 'utf-8-sig', mapping: dict = COLUMNS, dtype=_TEXT_DTYPE):
+    """按格式逐批读取原始列，每批为 {内部列名: 值序列}，至少产出一批(可能为空)"""
+    if fmt == 'xlsx':
+        return _iter_xlsx(source, mapping)
+    if fmt == 'xls':
+        usecols = lambda name: str(name).strip() in mapping
+        return iter([_read_pandas(pd.read_excel(source, usecols=usecols), mapping)])
+    if fmt == 'csv':
+        return _iter_csv(source, encoding, mapping, dtype)
+    return _iter_arrow(source, fmt, mapping)
+
+
+def _coerce(columns: dict) -> dict:
+    """数值列转为 float64(无法解析的值为 NaN)，名称列转为字符串；丢弃坐标或浓度缺失的行"""
+    result = {}
+    for target, values in columns.items():
+        if target in NUMERIC_COLUMNS:
+            result[target] = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(np.float64)
+        else:
+            names = pd.Series(values, dtype=object)
+            result[target] = np.asarray(names.where(names.notna(), '').astype(str).to_numpy(), dtype=str)
+
+    valid = None
+    for target in NUMERIC_COLUMNS:
+        if target in result:
+            finite = np.isfinite(result[target])
+            valid = finite if valid is None else valid & finite
+    if valid is not None and not valid.all():
+        result = {target: arr[valid] for target, arr in result.items()}
+    return result
+
+
+def _concat(batches: list) -> dict:
+    return {target: np.concatenate([batch[target] for batch in batches]) for target in batches[0]}
+
+
+def _parse(open_source) -> dict:
+    """
+    逐批解析并统一类型后拼接；open_source() 每次返回一个新的二进制文件对象(或文件路径)。
+    原始值只在单个批次内以 Python 对象存在，内存占用与文件大小无关。
+    """
+    with _opened(open_source()) as f:
+        fmt = _detect_format(f.read(8))
+    try:
+        with _opened(open_source()) as f:
+            return _concat([_coerce(batch) for batch in _iter_batches(f, fmt)])
+    except UnicodeDecodeError:
+        if fmt != 'csv':
+            raise
+    # Excel 导出的中文 CSV 常为 GBK 编码
+    with _opened(open_source()) as f:
+        return _concat([_coerce(batch) for batch in _iter_batches(f, fmt, encoding='gb18030')])
+
+
+def _opened(source):
+    return open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+
+
+def _disk_path(key: str) -> str:
+    return os.path.join(settings.UPLOAD_PARSE_CACHE_DIR, f"{key}.npz")
+
+
+def _cleanup_expired():
+    """删除超过保留时间的解析结果文件，最多每分钟扫描一次"""
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < 60:
+        return
+    _last_cleanup = now
+    try:
+        for name in os.listdir(settings.UPLOAD_PARSE_CACHE_DIR):
+            path = os.path.join(settings.UPLOAD_PARSE_CACHE_DIR, name)
+            if os.path.isfile(path) and now - os.path.getmtime(path) > settings.UPLOAD_PARSE_CACHE_TTL:
+                os.remove(path)
+    except OSError as e:
+        print(f"清理上传解析缓存失败: {e}")
+
+
+def _read_disk(key: str) -> dict | None:
+    path = _disk_path(key)
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            columns = {target: data[target] for target in data.files}
+        os.utime(path)  # 延长保留期
+        return columns
+    except (OSError, ValueError):
+        return None
+
+
+def _write_disk(key: str, columns: dict):
+    path = _disk_path(key)
+    try:
+        os.makedirs(settings.UPLOAD_PARSE_CACHE_DIR, exist_ok=True)
+        _cleanup_expired()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"写入上传解析缓存失败: {e}")
+
+
+def _get_columns(key: str, open_source) -> dict:
+    with _memory_lock:
+        columns = _memory_cache.get(key)
+    if columns is not None:
+        return columns
+
+    columns = _read_disk(key)
+    if columns is None:
+        columns = _parse(open_source)
+        _write_disk(key, columns)
+    for arr in columns.values():
+        arr.flags.writeable = False  # 缓存中的数组被多个请求共享
+    # 单个解析结果超过内存缓存的总预算时只保存在磁盘层
+    if _memory_cache.getsizeof(columns) <= _memory_cache.maxsize:
+        with _memory_lock:
+            _memory_cache[key] = columns
+    return columns
+
+
+def _file_key(path) -> str:
+    """分块计算文件内容哈希(与 content_key 结果相同)，不把整个文件读入内存"""
+    h = hashlib.sha256(f"v{_PARSER_VERSION}|".encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _resolve_source(source):
+    """文件内容(bytes)、文件对象或文件路径 -> (缓存键, open_source)"""
+    if isinstance(source, (str, os.PathLike)):
+        return _file_key(source), lambda: source
+    data = source.read() if hasattr(source, 'read') else bytes(source)
+    return content_key(data), lambda: io.BytesIO(data)
+
+
+def load_columns(source, required=NUMERIC_COLUMNS) -> dict:
+    """
+    读取上传的点位表格(source 可以是文件内容、文件对象或路径)，
+    返回 {内部列名: 只读 NumPy 数组}，只包含文件中存在的列；坐标或浓度缺失、无法解析的行会被丢弃。
+    缺少 required 中的列时抛出 MissingColumnsError，文件无法解析时抛出其他异常。
+    """
+    columns = _get_columns(*_resolve_source(source))
+    missing = [target for target in required if target not in columns]
+    if missing:
+        raise MissingColumnsError(missing)
+    return {target: columns[target] for target in COLUMNS.values() if target in columns}
+
+
+def load_points(source, required=NUMERIC_COLUMNS) -> pd.DataFrame:
+    """同 load_columns，返回 DataFrame(列为 lng/lat/concentration/name)"""
+    return pd.DataFrame(load_columns(source, required))
+
+
+def _sniff_encoding(f) -> str:
+    """CSV 的编码：文件开头不是合法的 UTF-8 时按 GB18030 读取"""
+    head = f.read(64 * 1024)
+    f.seek(0)
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 3:  # 末尾被截断的多字节字符不算
+            return 'gb18030'
+    return 'utf-8-sig'
+
+
+def iter_tables(source, mapping: dict):
+    """
+    逐批读取任意表格(source 为文件路径或可 seek 的二进制文件对象)，不缓存解析结果。
+    mapping 为 {源文件列名: 内部列名}；每批产出一个 DataFrame(列为文件中存在的内部列名，值未做类型转换)，
+    至少产出一批(可能为空)。内存占用与文件大小无关。
+    """
+    with _opened(source) as f:
+        fmt = _detect_format(f.read(8))
+        f.seek(0)
+        encoding = _sniff_encoding(f) if fmt == 'csv' else None
+        for batch in _iter_batches(f, fmt, encoding, mapping, dtype=str):
+            yield pd.DataFrame(batch)
@@ -0,0 +1,111 @@
+# 文件路径: app/services/map_sessions.py
+
+import fcntl
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from app.config import settings
+from app.services import payload_codec, spatial_index
+from app.services.session_store import store
+
+# --- 地图会话数据写入 ---
+# 上传的点位写入会话存储：replace 替换会话的全部数据；append 追加；
+# upsert 按标记名称(key='name')或坐标(key='coords'，精确到 1e-6 度)合并，已有的点位更新数值并保留ID。
+# 追加/合并只处理新上传的行，并增量更新空间索引。
+POINT_COLUMNS = ('lng', 'lat', 'concentration', 'name')
+MERGE_MODES = ('replace', 'append', 'upsert')
+UPSERT_KEYS = ('name', 'coords')
+
+# 同一会话的合并需要"读取-修改-写入"，用文件锁在各 worker 之间串行化
+_LOCK_TIMEOUT = 30
+
+
+def point_records(columns: dict, positions) -> list:
+    """把列数组中指定位置的点位组装为 [{lng, lat, concentration, name, id}, ...]"""
+    fields = POINT_COLUMNS + ('id',)
+    return [dict(zip(fields, row)) for row in zip(*(columns[name][positions].tolist() for name in fields))]
+
+
+@contextmanager
+def _session_lock(session_id: str):
+    lock_dir = os.path.join(settings.UPLOAD_SPOOL_DIR, 'locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    path = os.path.join(lock_dir, hashlib.sha256(session_id.encode('utf-8')).hexdigest()[:32])
+    with open(path, 'a') as f:
+        deadline = time.monotonic() + _LOCK_TIMEOUT
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("会话正在被其他请求更新，请稍后重试")
+                time.sleep(0.05)  # gevent 下为协作式等待
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _keys(columns: dict, key: str) -> np.ndarray:
+    if key == 'name':
+        return columns['name']
+    # 坐标按 1e-6 度取整后打包为一个 int64
+    lng = np.rint(columns['lng'] * 1e6).astype(np.int64) + (1 << 28)
+    lat = np.rint(columns['lat'] * 1e6).astype(np.int64) + (1 << 27)
+    return (lng << 28) | lat
+
+
+def _merge(indexed: dict, delta: dict, mode: str, key: str):
+    """返回 (合并后的索引列, 新增数, 更新数)"""
+    ids = indexed['id']
+    next_id = int(ids.max()) + 1 if len(ids) else 0
+    if mode == 'append':
+        delta_ids = np.arange(next_id, next_id + len(delta['lng']))
+        return spatial_index.update(indexed, np.zeros(0, dtype=np.int64), delta, delta_ids), len(delta_ids), 0
+
+    # upsert：同一批数据中重复的键以最后一行为准；已有数据中重复的键匹配最后一个点位
+    delta_keys = _keys(delta, key)
+    keep = ~pd.Index(delta_keys).duplicated(keep='last')
+    delta = {name: arr[keep] for name, arr in delta.items()}
+    delta_keys = delta_keys[keep]
+
+    lookup = pd.Series(np.arange(len(ids)), index=_keys(indexed, key))
+    lookup = lookup[~lookup.index.duplicated(keep='last')]
+    matched = lookup.reindex(delta_keys).to_numpy()
+    is_match = ~np.isnan(matched)
+    drop = matched[is_match].astype(np.int64)
+
+    delta_ids = np.empty(len(delta_keys), dtype=np.int64)
+    delta_ids[is_match] = ids[drop]
+    added = int((~is_match).sum())
+    delta_ids[~is_match] = np.arange(next_id, next_id + added)
+    return spatial_index.update(indexed, drop, delta, delta_ids), added, len(drop)
+
+
+def save(session_id: str, columns: dict, mode: str = 'replace', key: str = 'name') -> dict:
+    """
+    写入会话数据，并预先序列化、压缩完整点位列表(get-data 直接返回这些字节)。
+    返回 {'total': 会话点位总数, 'added': 新增数, 'updated': 更新数}。
+    合并后的会话超过存储上限时抛出 SessionTooLargeError(原有数据不变)。
+    """
+    if mode not in MERGE_MODES:
+        raise ValueError(f"不支持的上传模式: {mode}")
+    if key not in UPSERT_KEYS:
+        raise ValueError(f"不支持的合并键: {key}")
+    columns = {name: columns[name] for name in POINT_COLUMNS}
+
+    with _session_lock(session_id):
+        existing = store.get(session_id) if mode != 'replace' else None
+        if existing is None:
+            indexed, added, updated = spatial_index.build(columns), len(columns['lng']), 0
+        else:
+            indexed, added, updated = _merge(existing, columns, mode, key)
+
+        payload = payload_codec.encode_json({'success': True, 'points': point_records(indexed, np.argsort(indexed['id']))})
+        store.put(session_id, indexed, payload_codec.compress_variants(payload), payload_codec.content_etag(payload))
+    return {'total': len(indexed['id']), 'added': added, 'updated': updated}
@@ -0,0 +1,89 @@
+# 文件路径: app/services/overlay_cache.py
+
+import threading
+
+import numpy as np
+from cachetools import LRUCache
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from app.config import settings
+from app.services import geodata_registry
+
+# --- 底图叠加层缓存 ---
+# 道路/水系/铁路等图层是静态的：每个 (城市, 图层组合, 显示范围, 像素尺寸) 只栅格化一次，
+# 之后的请求只需一次 alpha 混合。按 RGBA 数组字节数计费的LRU。
+_overlay_cache = LRUCache(maxsize=settings.HEATMAP_OVERLAY_CACHE_BYTES, getsizeof=lambda arr: arr.nbytes)
+_overlay_lock = threading.Lock()
+
+
+def layer_style(layer_name: str) -> dict:
+    """图层绘制样式规则(道路/水系/铁路/其他)，图表模式与栅格叠加层共用"""
+    if 'road' in layer_name or 'highway' in layer_name:
+        return dict(edgecolor='#4a4a4a', linewidth=0.4, alpha=0.7, zorder=3)
+    elif 'water' in layer_name or 'river' in layer_name:
+        return dict(edgecolor='#3498db', facecolor='#3498db', linewidth=0.8, alpha=0.6, zorder=2)
+    elif 'rail' in layer_name:
+        return dict(edgecolor='#5e5e5e', linewidth=0.4, linestyle='--', zorder=3)
+    else:
+        return dict(edgecolor='white', facecolor='none', linewidth=0.6, linestyle=':', zorder=2)
+
+
+def _rasterize(city: str, layer_names, view_extent, shape, dpi: float) -> np.ndarray:
+    """用 Agg 画布(不经过 pyplot)把矢量图层绘制为透明背景的 RGBA 数组 (高, 宽, 4)"""
+    view_xmin, view_xmax, view_ymin, view_ymax = view_extent
+    width, height = shape
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    fig.patch.set_alpha(0.0)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.patch.set_alpha(0.0)
+
+    view_bbox = (view_xmin, view_ymin, view_xmax, view_ymax)
+    tolerance = geodata_registry.pixel_tolerance(view_xmin, view_xmax, width)
+    for layer_name in layer_names:
+        layer_gdf = geodata_registry.get_layer(city, layer_name, bbox=view_bbox, tolerance=tolerance)
+        if layer_gdf is not None and not layer_gdf.empty:
+            layer_gdf.plot(ax=ax, **layer_style(layer_name))
+
+    ax.set_xlim(view_xmin, view_xmax)
+    ax.set_ylim(view_ymin, view_ymax)
+    canvas.draw()
+    overlay = np.array(canvas.buffer_rgba())
+    overlay.flags.writeable = False  # 缓存中的数组被多个请求共享
+    return overlay
+
+
+def get_overlay(city: str, layer_names, view_extent, shape, dpi: float) -> np.ndarray:
+    """
+    获取底图叠加层，形状 (高, 宽, 4) 的 RGBA 数组(非预乘alpha，首行为北)。
+    view_extent 为 (xmin, xmax, ymin, ymax)，shape 为 (宽, 高) 像素，dpi 决定线宽对应的像素数。
+    图层文件修改后(mtime变化)自动重新栅格化。
+    """
+    layer_names = tuple(layer_names)
+    key = (
+        city, layer_names,
+        tuple(geodata_registry.layer_version(city, name) for name in layer_names),
+        tuple(round(float(v), 9) for v in view_extent),
+        tuple(int(v) for v in shape), round(float(dpi), 6),
+    )
+    with _overlay_lock:
+        overlay = _overlay_cache.get(key)
+    if overlay is None:
+        overlay = _rasterize(city, layer_names, view_extent, shape, dpi)
+        if overlay.nbytes <= _overlay_cache.maxsize:
+            with _overlay_lock:
+                _overlay_cache[key] = overlay
+    return overlay
+
+
+def composite(rgba: np.ndarray, overlay: np.ndarray):
+    """把叠加层 alpha 混合到不透明的底图 rgba 上(原地修改)"""
+    alpha = overlay[..., 3:4].astype(np.uint16)
+    covered = alpha[..., 0] > 0
+    if not covered.any():
+        return
+    src = overlay[..., :3][covered].astype(np.uint16)
+    dst = rgba[..., :3][covered].astype(np.uint16)
+    a = alpha[covered]
+    rgba[..., :3][covered] = ((src * a + dst * (255 - a) + 127) // 255).astype(np.uint8)
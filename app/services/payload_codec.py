@@ -0,0 +1,62 @@
+# 文件路径: app/services/payload_codec.py
+
+import gzip
+import hashlib
+
+import orjson
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只提供 gzip
+    brotli = None
+
+# --- 预序列化响应 ---
+# 内容不常变化的 JSON 响应只序列化、压缩一次，之后按 Accept-Encoding 直接返回对应的字节，
+# 并以内容哈希作为 ETag。
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# 小于该字节数的响应不压缩
+MIN_COMPRESS_BYTES = 1024
+
+
+def encode_json(obj) -> bytes:
+    """快速 JSON 序列化(NumPy 数组/标量可直接序列化，NaN 输出为 null)"""
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def content_etag(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def available_encodings() -> tuple:
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return data
+
+
+def compress_variants(data: bytes) -> dict:
+    """返回 {编码: 字节}，identity 为原始内容，另附 gzip 与 brotli(已安装时)"""
+    variants = {'identity': data}
+    if len(data) >= MIN_COMPRESS_BYTES:
+        for encoding in available_encodings():
+            variants[encoding] = compress(data, encoding)
+    return variants
+
+
+def choose_encoding(accept_encodings, available) -> str:
+    """
+    按客户端的 Accept-Encoding (werkzeug 的 request.accept_encodings) 选择压缩编码，
+    同等情况下优先 br，其次 gzip，都不可用时返回 identity。
+    """
+    best, best_quality = 'identity', 0
+    for encoding in ('br', 'gzip'):
+        quality = accept_encodings[encoding]
+        if encoding in available and quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
@@ -0,0 +1,123 @@
+# 文件路径: app/services/raster_renderer.py
+
+import io
+from functools import lru_cache
+
+import numpy as np
+import matplotlib
+from matplotlib.colors import LinearSegmentedColormap
+from PIL import Image
+from scipy import ndimage
+
+# --- 自定义色标 ---
+# (位置, 颜色) 锚点，使用 LinearSegmentedColormap.from_list 生成 256 级色带
+CUSTOM_COLORMAPS = {
+    'classic_custom': [(0, '#00FFFF'), (0.2, '#9FFF56'), (0.35, '#FFDD00'), (0.7, "#FE2801"), (1, '#8B0000')],
+}
+
+LUT_SIZE = 256
+BACKGROUND_RGBA = (255, 255, 255, 255)
+BOUNDARY_RGBA = (0, 0, 0, 255)
+
+
+def get_colormap(name: str):
+    """按名称获取色标：优先使用自定义色标，否则使用Matplotlib内置色标(名称无效时抛出 KeyError)"""
+    if name in CUSTOM_COLORMAPS:
+        return LinearSegmentedColormap.from_list(name, CUSTOM_COLORMAPS[name], N=LUT_SIZE)
+    return matplotlib.colormaps[name]
+
+
+@lru_cache(maxsize=32)
+def get_colormap_lut(name: str) -> np.ndarray:
+    """预计算 256 级 RGBA 查找表，形状 (256, 4)，dtype uint8"""
+    lut = get_colormap(name)(np.linspace(0.0, 1.0, LUT_SIZE), bytes=True)
+    lut.flags.writeable = False
+    return lut
+
+
+def apply_colormap(raster: np.ndarray, lut: np.ndarray, vmin: float, vmax: float,
+                   background=BACKGROUND_RGBA) -> np.ndarray:
+    """
+    将按 [x索引, y索引] 排列的数值栅格映射为图像方向(首行为北)的 RGBA 数组 (高, 宽, 4)。
+    NaN 像素填充为背景色。
+    """
+    valid = np.isfinite(raster)
+    # 与 Matplotlib 的 Colormap 一致：归一化后乘以 N 再取整，上端截断到 N-1
+    scale = LUT_SIZE / (vmax - vmin) if vmax > vmin else 0.0
+    scaled = (raster - vmin) * scale
+    scaled[~valid] = 0.0
+    idx = np.clip(scaled, 0, LUT_SIZE - 1, out=scaled).astype(np.uint8)
+
+    # 以 uint32 视图查表，一次取出整个 RGBA 像素
+    lut32 = np.ascontiguousarray(lut).view(np.uint32).ravel()
+    pixels = lut32[idx]
+    pixels[~valid] = np.array(background, dtype=np.uint8).view(np.uint32)[0]
+    rgba = pixels.view(np.uint8).reshape(raster.shape + (4,))
+    # [x, y] -> [行, 列]，并让北方朝上
+    return rgba.transpose(1, 0, 2)[::-1]
+
+
+def draw_outline(rgba: np.ndarray, mask: np.ndarray, width: int = 2, color=BOUNDARY_RGBA):
+    """在 RGBA 图像上沿掩膜边缘描出宽度为 width 像素的边界线(原地修改)"""
+    mask_img = mask.T[::-1]
+    edge = mask_img & ~ndimage.binary_erosion(mask_img, iterations=width, border_value=0)
+    rgba[edge] = color
+
+
+def draw_points(rgba: np.ndarray, pixel_xy: np.ndarray, radius: int,
+                fill=(0, 0, 0, 255), edge=(255, 255, 255, 255)):
+    """
+    在 RGBA 图像上以 (列, 行) 像素坐标绘制实心圆点，带 1 像素描边(原地修改)。
+    """
+    height, width = rgba.shape[:2]
+    for r, color in ((radius + 1, edge), (radius, fill)):
+        offsets = np.argwhere(np.hypot(*np.mgrid[-r:r + 1, -r:r + 1]) <= r) - r
+        cols = (pixel_xy[:, None, 0] + offsets[None, :, 1]).ravel()
+        rows = (pixel_xy[:, None, 1] + offsets[None, :, 0]).ravel()
+        inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+        rgba[rows[inside], cols[inside]] = color
+
+
+# --- 输出编码 ---
+# image_format -> (Pillow格式, MIME类型)
+IMAGE_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'png8': ('PNG', 'image/png'),  # 256色调色板PNG，色标栅格量化后几乎无可见损失
+    'webp': ('WEBP', 'image/webp'),
+}
+DEFAULT_WEBP_QUALITY = 80
+
+
+def encode_image(rgba: np.ndarray, image_format: str = 'png', quality: int = DEFAULT_WEBP_QUALITY) -> bytes:
+    """
+    将 RGBA 数组编码为图片。图像完全不透明时按 RGB 编码以减小体积。
+    - png: 全彩PNG
+    - png8: 调色板量化PNG(最多256色)
+    - webp: 有损WebP，quality 取 1~100
+    不支持的格式抛出 ValueError。
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的图片格式: {image_format}")
+
+    if np.all(rgba[..., 3] == 255):
+        image = Image.fromarray(np.ascontiguousarray(rgba[..., :3]), 'RGB')
+    else:
+        image = Image.fromarray(np.ascontiguousarray(rgba), 'RGBA')
+
+    buf = io.BytesIO()
+    if image_format == 'png8':
+        method = Image.Quantize.MEDIANCUT if image.mode == 'RGB' else Image.Quantize.FASTOCTREE
+        image.quantize(colors=256, method=method).save(buf, format='PNG', optimize=True)
+    elif image_format == 'webp':
+        image.save(buf, format='WEBP', quality=max(1, min(int(quality), 100)), method=4)
+    else:
+        image.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def reencode_png(png_bytes: bytes, image_format: str, quality: int = DEFAULT_WEBP_QUALITY) -> bytes:
+    """把已有的PNG图片转换为其他输出格式"""
+    if image_format == 'png':
+        return png_bytes
+    rgba = np.asarray(Image.open(io.BytesIO(png_bytes)).convert('RGBA'))
+    return encode_image(rgba, image_format, quality)
@@ -0,0 +1,243 @@
+# 文件路径: app/services/session_store.py
+
+import abc
+import io
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from cachetools import TTLCache
+from app.config import settings
+from app.services import shared_sqlite
+
+# --- 地图会话数据存储 ---
+# 每个会话的点位以 NumPy 列数组 {列名: 数组} 保存，而不是 list[dict]。
+# 默认使用 SQLite 文件(各 gunicorn worker 共享，无需外部服务)，
+# 过期(TTL，按最近访问时间计算)或总字节数超出上限时淘汰最久未访问的会话。
+# SESSION_STORE_BACKEND=memory 时使用进程内缓存(仅适用于单进程的本地调试)。
+# 每个会话还可以附带预序列化的响应字节(按压缩编码区分)及其 ETag，与点位数据一同写入、一同淘汰。
+
+# 最近访问时间的刷新间隔(秒)，避免每次读取都写库
+_TOUCH_INTERVAL = 60
+
+
+def _serialize(columns: dict) -> bytes:
+    buf = io.BytesIO()
+    np.savez(buf, **{name: np.asarray(arr, dtype=str if arr.dtype == object else arr.dtype)
+                     for name, arr in columns.items()})
+    return buf.getvalue()
+
+
+def _deserialize(blob: bytes) -> dict:
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        columns = {name: data[name] for name in data.files}
+    for arr in columns.values():
+        arr.flags.writeable = False
+    return columns
+
+
+class SessionTooLargeError(Exception):
+    """单个会话的数据(含预序列化响应)超过 SESSION_STORE_MAX_BYTES，不会被写入"""
+
+
+class SessionStore(abc.ABC):
+    """
+    会话存储接口：put 保存会话的列数组(以及可选的预序列化响应 payloads={编码: 字节} 和 etag)，
+    超过容量上限时抛出 SessionTooLargeError；get / get_etag 读取(不存在或已过期时返回 None)，
+    get_with_etag / get_payload 在同一次读取中返回数据及其对应的 etag，避免与并发的 put 交错；delete 删除
+    """
+
+    @abc.abstractmethod
+    def get(self, session_id: str) -> dict | None:
+        ...
+
+    @abc.abstractmethod
+    def get_etag(self, session_id: str) -> str | None:
+        ...
+
+    @abc.abstractmethod
+    def get_with_etag(self, session_id: str) -> tuple[dict, str | None] | None:
+        ...
+
+    @abc.abstractmethod
+    def get_payload(self, session_id: str, encoding: str) -> tuple[bytes, str | None] | None:
+        ...
+
+    @abc.abstractmethod
+    def put(self, session_id: str, columns: dict, payloads: dict | None = None, etag: str | None = None):
+        ...
+
+    @abc.abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+
+class MemorySessionStore(SessionStore):
+    """进程内存储：按字节数计费的 TTL + LRU 缓存，只对当前进程可见"""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        # 缓存值为 (列数组, 预序列化响应, etag)
+        self._cache = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=lambda entry: (
+            sum(arr.nbytes for arr in entry[0].values()) + sum(len(data) for data in entry[1].values())))
+        self._lock = threading.Lock()
+
+    def _entry(self, session_id):
+        with self._lock:
+            return self._cache.get(session_id)
+
+    def get(self, session_id):
+        entry = self._entry(session_id)
+        return entry[0] if entry is not None else None
+
+    def get_etag(self, session_id):
+        entry = self._entry(session_id)
+        return entry[2] if entry is not None else None
+
+    def get_with_etag(self, session_id):
+        entry = self._entry(session_id)
+        return (entry[0], entry[2]) if entry is not None else None
+
+    def get_payload(self, session_id, encoding):
+        entry = self._entry(session_id)
+        if entry is None or encoding not in entry[1]:
+            return None
+        return entry[1][encoding], entry[2]
+
+    def put(self, session_id, columns, payloads=None, etag=None):
+        columns = _deserialize(_serialize(columns))  # 统一数据类型并与调用方的数组解耦
+        entry = (columns, dict(payloads or {}), etag)
+        if self._cache.getsizeof(entry) > self._cache.maxsize:
+            raise SessionTooLargeError()
+        with self._lock:
+            self._cache.pop(session_id, None)
+            self._cache[session_id] = entry
+
+    def delete(self, session_id):
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite 存储：各进程共享同一个数据库文件(WAL 模式，读写互不阻塞)。
+    会话数据以 npz 字节保存，读取时解码为只读数组。
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._conn = None
+        self._conn_pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # 连接在首次使用时创建；gunicorn fork 出的子进程不能复用父进程的连接
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = shared_sqlite.connect(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY, data BLOB NOT NULL, nbytes INTEGER NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed)")
+            if 'etag' not in {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}:
+                conn.execute("ALTER TABLE sessions ADD COLUMN etag TEXT")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_payloads ("
+                " session_id TEXT NOT NULL, encoding TEXT NOT NULL, data BLOB NOT NULL,"
+                " PRIMARY KEY (session_id, encoding))"
+            )
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def _select(self, sql: str, session_id: str, *params):
+        """查询未过期会话的一行；按 _TOUCH_INTERVAL 刷新最近访问时间"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(sql, (session_id, now - self.ttl, *params)).fetchone()
+            if row is None:
+                return None
+            if now - row[-1] > _TOUCH_INTERVAL:
+                conn.execute("UPDATE sessions SET accessed = ? WHERE session_id = ?", (now, session_id))
+        return row
+
+    def get(self, session_id):
+        row = self._select(
+            "SELECT data, accessed FROM sessions WHERE session_id = ? AND accessed > ?", session_id)
+        return _deserialize(row[0]) if row is not None else None
+
+    def get_etag(self, session_id):
+        row = self._select(
+            "SELECT etag, accessed FROM sessions WHERE session_id = ? AND accessed > ?", session_id)
+        return row[0] if row is not None else None
+
+    def get_with_etag(self, session_id):
+        row = self._select(
+            "SELECT data, etag, accessed FROM sessions WHERE session_id = ? AND accessed > ?", session_id)
+        return (_deserialize(row[0]), row[1]) if row is not None else None
+
+    def get_payload(self, session_id, encoding):
+        row = self._select(
+            "SELECT p.data, s.etag, s.accessed FROM sessions s JOIN session_payloads p ON p.session_id = s.session_id"
+            " WHERE s.session_id = ? AND s.accessed > ? AND p.encoding = ?", session_id, encoding)
+        return (row[0], row[1]) if row is not None else None
+
+    def put(self, session_id, columns, payloads=None, etag=None):
+        blob = _serialize(columns)
+        payloads = payloads or {}
+        nbytes = len(blob) + sum(len(data) for data in payloads.values())
+        if nbytes > self.max_bytes:
+            raise SessionTooLargeError()
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, data, nbytes, accessed, etag) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, blob, nbytes, now, etag),
+                )
+                conn.execute("DELETE FROM session_payloads WHERE session_id = ?", (session_id,))
+                conn.executemany(
+                    "INSERT INTO session_payloads (session_id, encoding, data) VALUES (?, ?, ?)",
+                    [(session_id, encoding, data) for encoding, data in payloads.items()],
+                )
+                self._evict(conn, now, session_id)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, session_id):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_payloads WHERE session_id = ?", (session_id,))
+
+    def _evict(self, conn: sqlite3.Connection, now: float, keep: str):
+        """删除过期会话；总字节数超过上限时，从最久未访问的会话开始删除(刚写入的会话 keep 不会被删除)"""
+        conn.execute("DELETE FROM sessions WHERE accessed <= ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM sessions WHERE session_id IN ("
+            " SELECT session_id FROM ("
+            "  SELECT session_id, SUM(nbytes) OVER ("
+            "   ORDER BY session_id = ? DESC, accessed DESC, session_id) AS running"
+            "  FROM sessions)"
+            " WHERE running > ? AND session_id != ?)",
+            (keep, self.max_bytes, keep),
+        )
+        conn.execute("DELETE FROM session_payloads WHERE session_id NOT IN (SELECT session_id FROM sessions)")
+
+
+def _create_store() -> SessionStore:
+    if settings.SESSION_STORE_BACKEND == 'memory':
+        return MemorySessionStore(settings.SESSION_STORE_MAX_BYTES, settings.SESSION_STORE_TTL)
+    return SQLiteSessionStore(settings.SESSION_STORE_PATH, settings.SESSION_STORE_MAX_BYTES,
+                              settings.SESSION_STORE_TTL)
+
+
+store = _create_store()
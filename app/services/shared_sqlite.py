@@ -0,0 +1,16 @@
+# 文件路径: app/services/shared_sqlite.py
+
+import os
+import sqlite3
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    打开各 worker 共享的 SQLite 数据库文件：WAL 模式(读写互不阻塞)，自动提交，
+    允许跨线程使用(调用方自行加锁)。连接不能跨进程复用，fork 后需要重新打开。
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
@@ -0,0 +1,152 @@
+# 文件路径: app/services/spatial_index.py
+
+import math
+
+import numpy as np
+
+# --- 地图点位空间索引与聚合 ---
+# 上传时把点位按规则网格单元排序，并记录每个单元在排序后数组中的起止位置(CSR 形式)，
+# 查询显示范围时只需检查与范围相交的单元。索引数组与点位列一起保存在会话存储中：
+#   id            点位ID(首次上传时为原始行号，之后追加的点位依次编号)
+#   _grid         网格参数 [xmin, ymin, 宽, 高, nx, ny]
+#   _grid_offsets 单元 (ix, iy) 的点位位于 [offsets[ix*ny+iy], offsets[ix*ny+iy+1])
+POINTS_PER_CELL = 8
+MAX_GRID_CELLS = 512
+
+# 低缩放级别下按屏幕像素网格聚合点位：聚合单元边长(像素)，以及不再聚合的最小缩放级别
+CLUSTER_CELL_PIXELS = 60
+CLUSTER_MAX_ZOOM = 15
+TILE_SIZE = 256
+
+
+def build(columns: dict, ids: np.ndarray | None = None) -> dict:
+    """
+    为会话点位建立网格索引，返回按单元排序后的列(附带 id 与索引数组)。
+    ids 为各行的点位ID，默认使用行号。
+    """
+    lng, lat = columns['lng'], columns['lat']
+    n = len(lng)
+    ids = np.arange(n, dtype=np.int32) if ids is None else np.asarray(ids, dtype=np.int32)
+    if n == 0:
+        return {**columns, 'id': ids,
+                '_grid': np.array([0.0, 0.0, 1.0, 1.0, 1, 1]), '_grid_offsets': np.zeros(2, dtype=np.int64)}
+
+    xmin, ymin = float(lng.min()), float(lat.min())
+    width = max(float(lng.max()) - xmin, 1e-9)
+    height = max(float(lat.max()) - ymin, 1e-9)
+    cells = int(min(max(math.sqrt(n / POINTS_PER_CELL), 1), MAX_GRID_CELLS))
+    nx = ny = cells
+
+    ix = np.clip(((lng - xmin) / width * nx).astype(np.int64), 0, nx - 1)
+    iy = np.clip(((lat - ymin) / height * ny).astype(np.int64), 0, ny - 1)
+    cell_id = ix * ny + iy
+    order = np.argsort(cell_id, kind='stable')
+    offsets = np.searchsorted(cell_id[order], np.arange(nx * ny + 1))
+
+    indexed = {name: arr[order] for name, arr in columns.items()}
+    indexed['id'] = ids[order]
+    indexed['_grid'] = np.array([xmin, ymin, width, height, nx, ny], dtype=np.float64)
+    indexed['_grid_offsets'] = offsets.astype(np.int64)
+    return indexed
+
+
+def _point_columns(indexed: dict) -> list:
+    return [name for name in indexed if not name.startswith('_')]
+
+
+def update(indexed: dict, drop: np.ndarray, delta: dict, delta_ids: np.ndarray) -> dict:
+    """
+    增量更新索引：删除位置 drop 上的点位，再插入 delta 中的点位(ID 为 delta_ids)。
+    新点位都落在原网格范围内且网格密度仍合适时，只把新点位插入各自单元的末尾，不重新排序；
+    否则重新建立索引。
+    """
+    xmin, ymin, width, height, nx, ny = indexed['_grid']
+    nx, ny = int(nx), int(ny)
+    lng, lat = delta['lng'], delta['lat']
+    names = _point_columns(indexed)
+    delta = {**delta, 'id': np.asarray(delta_ids, dtype=np.int32)}
+    n_after = len(indexed['id']) - len(drop) + len(lng)
+
+    in_grid = bool(np.all((lng >= xmin) & (lng <= xmin + width) & (lat >= ymin) & (lat <= ymin + height)))
+    cells = int(min(max(math.sqrt(n_after / POINTS_PER_CELL), 1), MAX_GRID_CELLS))
+    if len(indexed['id']) == 0 or not in_grid or not cells / 2 <= nx <= cells * 2:
+        merged = {name: np.concatenate([np.delete(indexed[name], drop), delta[name]]) for name in names}
+        ids = merged.pop('id')
+        return build(merged, ids)
+
+    # 删除：每个单元的起始位置减去排在它之前的被删除点位数
+    drop = np.sort(np.asarray(drop, dtype=np.int64))
+    offsets = indexed['_grid_offsets'] - np.searchsorted(drop, indexed['_grid_offsets'])
+    arrays = {name: np.delete(indexed[name], drop) for name in names}
+
+    # 插入：新点位放到所在单元的末尾，之后的单元整体后移
+    ix = np.clip(((lng - xmin) / width * nx).astype(np.int64), 0, nx - 1)
+    iy = np.clip(((lat - ymin) / height * ny).astype(np.int64), 0, ny - 1)
+    cell_id = ix * ny + iy
+    order = np.argsort(cell_id, kind='stable')
+    cell_id = cell_id[order]
+    insert_at = offsets[cell_id + 1]
+    for name in names:
+        values = delta[name][order]
+        arr = arrays[name].astype(np.promote_types(arrays[name].dtype, values.dtype), copy=False)
+        arrays[name] = np.insert(arr, insert_at, values)
+    arrays['_grid'] = indexed['_grid']
+    arrays['_grid_offsets'] = offsets + np.searchsorted(cell_id, np.arange(nx * ny + 1))
+    return arrays
+
+
+def query_bbox(columns: dict, bbox) -> np.ndarray:
+    """返回位于 bbox (min_lng, min_lat, max_lng, max_lat) 内的点位在列数组中的位置(按 id 排序)"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    xmin, ymin, width, height, nx, ny = columns['_grid']
+    nx, ny = int(nx), int(ny)
+    offsets = columns['_grid_offsets']
+
+    ix0 = max(int((min_lng - xmin) / width * nx), 0)
+    ix1 = min(int((max_lng - xmin) / width * nx), nx - 1)
+    iy0 = max(int((min_lat - ymin) / height * ny), 0)
+    iy1 = min(int((max_lat - ymin) / height * ny), ny - 1)
+    if ix0 > ix1 or iy0 > iy1:
+        return np.zeros(0, dtype=np.int64)
+
+    # 同一列(ix)上相邻单元在排序后的数组中是连续的一段
+    rows = np.arange(ix0, ix1 + 1) * ny
+    starts, ends = offsets[rows + iy0], offsets[rows + iy1 + 1]
+    candidates = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+    lng, lat = columns['lng'][candidates], columns['lat'][candidates]
+    inside = (lng >= min_lng) & (lng <= max_lng) & (lat >= min_lat) & (lat <= max_lat)
+    positions = candidates[inside]
+    return positions[np.argsort(columns['id'][positions], kind='stable')]
+
+
+def cluster(columns: dict, positions: np.ndarray, zoom: int):
+    """
+    按缩放级别 zoom 下 CLUSTER_CELL_PIXELS 像素的网格聚合点位。
+    返回 (clusters, singles)：clusters 为聚合结果列表(至少两个点)，singles 为未被聚合的点位位置(按 id 排序)。
+    """
+    lng, lat = columns['lng'][positions], columns['lat'][positions]
+    conc = columns['concentration'][positions]
+    scale = TILE_SIZE * 2 ** zoom / CLUSTER_CELL_PIXELS
+    # Web Mercator 像素坐标 / 单元边长
+    kx = np.floor((lng + 180.0) / 360.0 * scale).astype(np.int64)
+    lat_rad = np.radians(np.clip(lat, -85.05112878, 85.05112878))
+    ky = np.floor((1 - np.arcsinh(np.tan(lat_rad)) / np.pi) / 2 * scale).astype(np.int64)
+
+    keys, inverse, counts = np.unique(kx * (1 << 32) + ky, return_inverse=True, return_counts=True)
+    sums = lambda v: np.bincount(inverse, weights=v, minlength=len(keys))
+    mean_lng, mean_lat, mean_conc = sums(lng) / counts, sums(lat) / counts, sums(conc) / counts
+    min_conc = np.full(len(keys), np.inf)
+    max_conc = np.full(len(keys), -np.inf)
+    np.minimum.at(min_conc, inverse, conc)
+    np.maximum.at(max_conc, inverse, conc)
+
+    clusters = [
+        {
+            'cluster_id': f"{zoom}/{int(key >> 32)}/{int(key & 0xFFFFFFFF)}",
+            'lng': float(mean_lng[i]), 'lat': float(mean_lat[i]), 'count': int(counts[i]),
+            'concentration': {'mean': float(mean_conc[i]), 'min': float(min_conc[i]), 'max': float(max_conc[i])},
+        }
+        for i, key in enumerate(keys) if counts[i] > 1
+    ]
+    singles = positions[counts[inverse] == 1]
+    return clusters, singles
@@ -0,0 +1,157 @@
+# 文件路径: app/services/surface_export.py
+
+import json
+import struct
+
+import contourpy
+import numpy as np
+import shapely
+from shapely.geometry import Polygon, MultiPolygon, mapping
+
+# --- 插值曲面导出 ---
+# 把已保存的插值曲面以紧凑的形式交给前端自行着色/绘制：
+# 量化网格(二进制)或等值带 GeoJSON。服务端只求解一次，换色标、换样式都在客户端完成。
+
+# 二进制网格格式:
+#   4 字节魔数 b'HMGR' + 4 字节小端 uint32 头部长度 + UTF-8 JSON 头部 + 网格数据
+# 网格数据按行优先排列，首行为北、首列为西(与图片方向一致)，小端字节序。
+# uint8 编码: 值 = offset + q * scale，q == 255 表示边界外(无数据)；
+# float16 编码: 直接存数值，NaN 表示边界外。
+GRID_MAGIC = b'HMGR'
+GRID_VERSION = 1
+GRID_ENCODINGS = ('uint8', 'float16')
+UINT8_NODATA = 255
+
+DEFAULT_ISOBAND_LEVELS = 10
+MAX_ISOBAND_LEVELS = 64
+# GeoJSON 坐标保留的小数位数(约 1 米)
+COORD_DECIMALS = 5
+
+
+def _crop_to_data(grid_z: np.ndarray, bounds):
+    """裁掉四周全为 NaN 的行列，返回 (子网格, 子网格节点范围)"""
+    xmin, ymin, xmax, ymax = bounds
+    nx, ny = grid_z.shape
+    dx = (xmax - xmin) / (nx - 1)
+    dy = (ymax - ymin) / (ny - 1)
+    valid = np.isfinite(grid_z)
+    if not valid.any():
+        return grid_z[:0, :0], bounds
+    ix = np.flatnonzero(valid.any(axis=1))
+    iy = np.flatnonzero(valid.any(axis=0))
+    i0, i1, j0, j1 = ix[0], ix[-1], iy[0], iy[-1]
+    cropped = grid_z[i0:i1 + 1, j0:j1 + 1]
+    return cropped, (xmin + i0 * dx, ymin + j0 * dy, xmin + i1 * dx, ymin + j1 * dy)
+
+
+def export_grid(surface: dict, encoding: str = 'uint8') -> bytes:
+    """
+    把插值曲面编码为二进制网格(格式见模块开头的说明)，只保留边界外接矩形内的部分。
+    头部 bounds 为首末网格节点的经纬度 [xmin, ymin, xmax, ymax]。
+    不支持的编码抛出 ValueError。
+    """
+    if encoding not in GRID_ENCODINGS:
+        raise ValueError(f"不支持的网格编码: {encoding}")
+
+    grid_z, bounds = _crop_to_data(surface['grid_z'], surface['bounds'])
+    # [x, y] -> [行, 列]，北方在上
+    raster = grid_z.T[::-1]
+    valid = np.isfinite(raster)
+    vmin, vmax = surface['value_range']
+
+    header = {
+        'version': GRID_VERSION,
+        'encoding': encoding,
+        'width': int(raster.shape[1]),
+        'height': int(raster.shape[0]),
+        'bounds': [float(v) for v in bounds],
+        'value_range': [vmin, vmax],
+    }
+    if encoding == 'uint8':
+        # 数值范围映射到 0~254，255 留作无数据
+        scale = (vmax - vmin) / (UINT8_NODATA - 1) if vmax > vmin else 1.0
+        q = np.zeros(raster.shape, dtype=np.float64)
+        np.divide(raster - vmin, scale, out=q, where=valid)
+        data = np.clip(np.rint(q), 0, UINT8_NODATA - 1).astype(np.uint8)
+        data[~valid] = UINT8_NODATA
+        header.update(scale=scale, offset=vmin, nodata=UINT8_NODATA)
+    else:
+        data = raster.astype('<f2')
+        header.update(scale=1.0, offset=0.0, nodata=None)
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    return GRID_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes + np.ascontiguousarray(data).tobytes()
+
+
+def isoband_levels(value_range, levels=DEFAULT_ISOBAND_LEVELS) -> np.ndarray:
+    """
+    等值带分级：levels 为整数时在数值范围内等分为 levels 个等值带，
+    为序列时作为分级边界(升序去重)。分级无效时抛出 ValueError。
+    """
+    if isinstance(levels, (int, np.integer)):
+        if not 1 <= levels <= MAX_ISOBAND_LEVELS:
+            raise ValueError(f"等值带数量必须在 1~{MAX_ISOBAND_LEVELS} 之间")
+        vmin, vmax = value_range
+        if vmax <= vmin:
+            vmax = vmin + 1.0
+        return np.linspace(vmin, vmax, levels + 1)
+
+    edges = np.unique(np.asarray(levels, dtype=np.float64))
+    if len(edges) < 2 or len(edges) > MAX_ISOBAND_LEVELS + 1 or not np.all(np.isfinite(edges)):
+        raise ValueError(f"等值带分级边界须为 2~{MAX_ISOBAND_LEVELS + 1} 个有限数值")
+    return edges
+
+
+def _band_geometry(points_list, offsets_list):
+    """把 contourpy OuterOffset 格式的多边形(外环 + 内洞)组装为 shapely 几何"""
+    polygons = []
+    for points, offsets in zip(points_list, offsets_list):
+        rings = [points[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        polygons.append(Polygon(rings[0], rings[1:]))
+    if not polygons:
+        return None
+    return polygons[0] if len(polygons) == 1 else MultiPolygon(polygons)
+
+
+def export_isobands(surface: dict, levels=DEFAULT_ISOBAND_LEVELS, tolerance: float | None = None) -> dict:
+    """
+    把插值曲面转换为等值带 GeoJSON FeatureCollection，每个等值带一个要素，
+    properties 包含 lower/upper(数值区间)与 index(分级序号，自低到高)。
+    tolerance 为几何简化容差(度)，默认取半个网格间距。
+    """
+    grid_z, bounds = surface['grid_z'], surface['bounds']
+    edges = isoband_levels(surface['value_range'], levels)
+    xmin, ymin, xmax, ymax = bounds
+    nx, ny = grid_z.shape
+    if tolerance is None:
+        tolerance = (xmax - xmin) / (nx - 1) / 2
+
+    # contourpy 的 z 按 [行=y, 列=x] 排列
+    generator = contourpy.contour_generator(
+        np.linspace(xmin, xmax, nx), np.linspace(ymin, ymax, ny), np.ma.masked_invalid(grid_z.T),
+        fill_type=contourpy.FillType.OuterOffset,
+    )
+    features = []
+    last = len(edges) - 2
+    for index, (lower, upper) in enumerate(zip(edges[:-1], edges[1:])):
+        # 最高一级包含上端点(等于最大值的区域)
+        geometry = _band_geometry(*generator.filled(lower, np.nextafter(upper, np.inf) if index == last else upper))
+        if geometry is None:
+            continue
+        if tolerance > 0:
+            geometry = geometry.simplify(tolerance, preserve_topology=True)
+        geometry = shapely.set_precision(geometry, 10 ** -COORD_DECIMALS)
+        if geometry.is_empty:
+            continue
+        features.append({
+            'type': 'Feature',
+            'geometry': mapping(geometry),
+            'properties': {'index': index, 'lower': float(lower), 'upper': float(upper)},
+        })
+
+    return {
+        'type': 'FeatureCollection',
+        'features': features,
+        'levels': [float(v) for v in edges],
+        'value_range': list(surface['value_range']),
+    }
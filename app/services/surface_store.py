@@ -0,0 +1,108 @@
+# 文件路径: app/services/surface_store.py
+
+import os
+import threading
+import time
+
+import numpy as np
+from cachetools import LRUCache
+from app.config import settings
+
+# --- 插值曲面存储 ---
+# 每次插值的结果(网格 + 原始点位数据 + 插值参数)以 surface_id 为键保存到共享目录，
+# 瓦片、导出等接口可以在任意进程中复用，无需重新上传和求解。
+# surface_id 即插值缓存键，由输入内容唯一确定。
+_loaded = LRUCache(maxsize=16)
+_loaded_lock = threading.Lock()
+_last_cleanup = 0.0
+
+
+def _surface_path(surface_id: str) -> str:
+    return os.path.join(settings.HEATMAP_SURFACE_DIR, f"{surface_id}.npz")
+
+
+def is_valid_id(surface_id: str) -> bool:
+    return bool(surface_id) and len(surface_id) == 64 and all(c in '0123456789abcdef' for c in surface_id)
+
+
+def _cleanup_expired():
+    """删除超过保留时间的曲面文件，最多每分钟扫描一次"""
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < 60:
+        return
+    _last_cleanup = now
+    try:
+        for name in os.listdir(settings.HEATMAP_SURFACE_DIR):
+            path = os.path.join(settings.HEATMAP_SURFACE_DIR, name)
+            if os.path.isfile(path) and now - os.path.getmtime(path) > settings.HEATMAP_SURFACE_TTL:
+                os.remove(path)
+    except OSError as e:
+        print(f"清理插值曲面文件失败: {e}")
+
+
+def save_surface(surface_id: str, grid_z: np.ndarray, bounds, points: np.ndarray, values: np.ndarray,
+                 city: str, method: str):
+    """保存插值曲面；已存在时只刷新修改时间(延长保留期)"""
+    path = _surface_path(surface_id)
+    try:
+        if os.path.exists(path):
+            os.utime(path)
+            return
+        os.makedirs(settings.HEATMAP_SURFACE_DIR, exist_ok=True)
+        _cleanup_expired()
+        finite = grid_z[np.isfinite(grid_z)]
+        value_range = (float(finite.min()), float(finite.max())) if finite.size else (0.0, 1.0)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f, grid_z=grid_z, bounds=np.asarray(bounds, dtype=np.float64),
+                points=np.asarray(points, dtype=np.float64), values=np.asarray(values, dtype=np.float64),
+                value_range=np.asarray(value_range), city=np.asarray(city), method=np.asarray(method),
+            )
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"保存插值曲面失败: {e}")
+
+
+def exists(surface_id: str) -> bool:
+    """曲面是否存在(与 load_surface 能否读到一致)，只检查文件，不读取内容"""
+    if not is_valid_id(surface_id):
+        return False
+    with _loaded_lock:
+        if surface_id in _loaded:
+            return True
+    return os.path.isfile(_surface_path(surface_id))
+
+
+def load_surface(surface_id: str) -> dict | None:
+    """
+    读取插值曲面，返回 dict: grid_z, bounds, points, values, value_range, city, method；
+    不存在或已过期时返回 None。
+    """
+    if not is_valid_id(surface_id):
+        return None
+    with _loaded_lock:
+        surface = _loaded.get(surface_id)
+    if surface is not None:
+        return surface
+
+    try:
+        with np.load(_surface_path(surface_id), allow_pickle=False) as data:
+            surface = {
+                'grid_z': data['grid_z'],
+                'bounds': tuple(float(v) for v in data['bounds']),
+                'points': data['points'],
+                'values': data['values'],
+                'value_range': tuple(float(v) for v in data['value_range']),
+                'city': str(data['city']),
+                'method': str(data['method']),
+            }
+    except (OSError, ValueError, KeyError):
+        return None
+
+    for arr in (surface['grid_z'], surface['points'], surface['values']):
+        arr.flags.writeable = False
+    with _loaded_lock:
+        _loaded[surface_id] = surface
+    return surface
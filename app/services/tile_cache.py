@@ -0,0 +1,102 @@
+# 文件路径: app/services/tile_cache.py
+
+import os
+import struct
+import threading
+import time
+import uuid
+
+from cachetools import LRUCache
+from app.config import settings
+
+# --- 天气地图瓦片两级缓存 ---
+# L1: 进程内 LRU，按瓦片字节数计算容量；L2: 磁盘目录，按 op/z/x/y 存放，各 worker 共享。
+# 每个瓦片按上游 Cache-Control 给出的时长过期。
+# 磁盘文件格式：过期时间(<d) + Content-Type 长度(<H) + Content-Type + 瓦片内容
+_HEADER = struct.Struct('<dH')
+# 单个瓦片超过该字节数时不缓存
+MAX_TILE_BYTES = 1024 * 1024
+# 磁盘中过期瓦片的清理间隔(秒)
+_CLEANUP_INTERVAL = 3600
+
+
+class TileCache:
+    def __init__(self, max_bytes: int, path: str | None):
+        self.path = path
+        self._memory = LRUCache(maxsize=max_bytes, getsizeof=lambda entry: len(entry[0]))
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+
+    def _file(self, op: str, z: int, x: int, y: int) -> str:
+        return os.path.join(self.path, op, str(z), str(x), f"{y}.tile")
+
+    def get(self, op: str, z: int, x: int, y: int):
+        """返回 (瓦片内容, Content-Type, 过期时间)；未命中或已过期返回 None"""
+        key = (op, z, x, y)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry is not None and entry[2] > now:
+            return entry
+        if not self.path:
+            return None
+        try:
+            with open(self._file(op, z, x, y), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        expires, type_len = _HEADER.unpack_from(data)
+        if expires <= now:
+            return None
+        content_type = data[_HEADER.size:_HEADER.size + type_len].decode('ascii')
+        entry = (data[_HEADER.size + type_len:], content_type, expires)
+        with self._lock:
+            self._memory[key] = entry
+        return entry
+
+    def put(self, op: str, z: int, x: int, y: int, body: bytes, content_type: str, ttl: float):
+        if ttl <= 0 or len(body) > MAX_TILE_BYTES:
+            return
+        expires = time.time() + ttl
+        with self._lock:
+            self._memory[(op, z, x, y)] = (body, content_type, expires)
+        if not self.path:
+            return
+        path = self._file(op, z, x, y)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        type_bytes = content_type.encode('ascii', 'replace')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(_HEADER.pack(expires, len(type_bytes)))
+                f.write(type_bytes)
+                f.write(body)
+            os.replace(tmp, path)  # 原子替换，其他 worker 不会读到写了一半的文件
+        except OSError as e:
+            print(f"写入瓦片缓存失败: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        self._schedule_cleanup()
+
+    def _schedule_cleanup(self):
+        now = time.time()
+        if now - self._last_cleanup < _CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        threading.Thread(target=self._cleanup_expired, name='tile-cache-cleanup', daemon=True).start()
+
+    def _cleanup_expired(self):
+        """删除磁盘中已过期的瓦片"""
+        now = time.time()
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    with open(path, 'rb') as f:
+                        header = f.read(_HEADER.size)
+                    if len(header) < _HEADER.size or _HEADER.unpack(header)[0] <= now:
+                        os.remove(path)
+                except (OSError, struct.error):
+                    pass
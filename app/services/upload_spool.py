@@ -0,0 +1,120 @@
+# 文件路径: app/services/upload_spool.py
+
+import fcntl
+import os
+import time
+import uuid
+
+from app.config import settings
+
+# --- 分块上传暂存 ---
+# 大文件分多次请求上传，每块按偏移量追加到共享目录中的暂存文件(各 worker 都能续传)，
+# 中断后客户端查询已接收的字节数，从该位置继续上传。全部上传完成后再从磁盘流式解析。
+# 写入时对暂存文件加排他锁(各 worker 之间有效)，同一上传的并发请求不会交错写入。
+_COPY_BLOCK = 1024 * 1024
+_last_cleanup = 0.0
+
+
+class OffsetMismatchError(Exception):
+    """分块的起始偏移量与已接收的字节数不一致；received 为服务器已接收的字节数"""
+
+    def __init__(self, received: int):
+        self.received = received
+        super().__init__(f"偏移量不匹配，已接收 {received} 字节")
+
+
+class UploadTooLargeError(Exception):
+    """上传的文件超过 UPLOAD_MAX_BYTES"""
+
+
+def is_valid_id(upload_id: str) -> bool:
+    return bool(upload_id) and len(upload_id) == 32 and all(c in '0123456789abcdef' for c in upload_id)
+
+
+def spool_path(upload_id: str) -> str:
+    return os.path.join(settings.UPLOAD_SPOOL_DIR, f"{upload_id}.part")
+
+
+def _cleanup_expired():
+    """删除超过保留时间仍未完成的暂存文件，最多每分钟扫描一次"""
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < 60:
+        return
+    _last_cleanup = now
+    try:
+        for name in os.listdir(settings.UPLOAD_SPOOL_DIR):
+            path = os.path.join(settings.UPLOAD_SPOOL_DIR, name)
+            if os.path.isfile(path) and now - os.path.getmtime(path) > settings.UPLOAD_SPOOL_TTL:
+                os.remove(path)
+    except OSError as e:
+        print(f"清理上传暂存文件失败: {e}")
+
+
+def create() -> str:
+    """开始一次分块上传，返回上传ID"""
+    os.makedirs(settings.UPLOAD_SPOOL_DIR, exist_ok=True)
+    _cleanup_expired()
+    upload_id = uuid.uuid4().hex
+    open(spool_path(upload_id), 'wb').close()
+    return upload_id
+
+
+def received(upload_id: str) -> int | None:
+    """已接收的字节数；上传不存在(或已过期、已完成)时返回 None"""
+    if not is_valid_id(upload_id):
+        return None
+    try:
+        return os.path.getsize(spool_path(upload_id))
+    except OSError:
+        return None
+
+
+def append(upload_id: str, offset: int, stream) -> int:
+    """
+    把 stream 中的一块数据追加到暂存文件，返回追加后已接收的字节数。
+    offset 与已接收的字节数不一致、或其他请求正在写入同一上传时抛出 OffsetMismatchError(客户端据此续传)，
+    超过 UPLOAD_MAX_BYTES 时抛出 UploadTooLargeError(已写入的部分会被截断回 offset)。
+    上传不存在时抛出 FileNotFoundError。
+    """
+    if not is_valid_id(upload_id):
+        raise FileNotFoundError(upload_id)
+    with open(spool_path(upload_id), 'r+b') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # 同一上传的另一块正在写入，已接收的字节数还会变化，由客户端稍后查询再续传
+            raise OffsetMismatchError(os.fstat(f.fileno()).st_size) from None
+        try:
+            # 持有锁之后再检查偏移量，检查与写入之间不会有其他请求写入
+            size = os.fstat(f.fileno()).st_size
+            if offset != size:
+                raise OffsetMismatchError(size)
+            f.seek(offset)
+            for block in iter(lambda: stream.read(_COPY_BLOCK), b''):
+                if f.tell() + len(block) > settings.UPLOAD_MAX_BYTES:
+                    f.truncate(offset)
+                    raise UploadTooLargeError()
+                f.write(block)
+            f.flush()
+            return f.tell()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def save(stream) -> str:
+    """把一次性上传的文件流式写入暂存目录，返回上传ID"""
+    upload_id = create()
+    try:
+        append(upload_id, 0, stream)
+    except Exception:
+        discard(upload_id)
+        raise
+    return upload_id
+
+
+def discard(upload_id: str):
+    try:
+        os.remove(spool_path(upload_id))
+    except OSError:
+        pass
@@ -0,0 +1,55 @@
+# 文件路径: app/services/warmup.py
+
+import os
+import resource
+import time
+
+# --- 启动预热与启动报告 ---
+# 热力图相关的模块(geopandas/shapely/matplotlib/scipy/pykrige)在首次使用时才导入。
+# gunicorn 预加载模式下，master 在 fork worker 之前调用 warm_heatmap_stack()：导入这些模块，
+# 加载各城市边界、生成色标查找表并建立 matplotlib 字体缓存，各 worker 以写时复制的方式共享，不必各自加载。
+# startup_report() 给出进程的启动耗时与内存占用，由 gunicorn 的钩子写入日志，便于发现启动性能的退化。
+
+
+def warm_heatmap_stack() -> list:
+    """导入并预热热力图相关的模块与数据，返回已预热的城市目录"""
+    from matplotlib import font_manager
+    from app.services import geodata_registry, heatmap_tiles, raster_renderer, surface_export  # noqa: F401
+
+    # 首次访问时扫描系统字体并写入磁盘缓存；热力图使用 SimHei(不存在时 matplotlib 回退到默认字体)
+    font_manager.findfont('SimHei', fallback_to_default=True)
+
+    for name in raster_renderer.CUSTOM_COLORMAPS:
+        raster_renderer.get_colormap_lut(name)
+
+    cities = []
+    for city in sorted(os.listdir(geodata_registry.PROVINCE_DATA_PATH)):
+        try:
+            geodata_registry.get_clip_geometry(city)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        cities.append(city)
+    return cities
+
+
+def memory_usage() -> dict:
+    """
+    当前进程的内存占用(MB)：rss 为常驻内存，private 为本进程独占的部分(不含与 master 共享的写时复制页)。
+    读取 /proc/self/smaps_rollup，不可用时只给出峰值 rss。
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        kb = lambda name: int(fields.get(name, '0 kB').split()[0])
+        return {
+            'rss': round(kb('Rss') / 1024, 1),
+            'private': round((kb('Private_Clean') + kb('Private_Dirty')) / 1024, 1),
+        }
+    except OSError:
+        return {'rss': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+
+def startup_report(role: str, started: float) -> str:
+    """一行启动报告：进程角色、pid、自 started 起的耗时(秒)与内存占用"""
+    memory = ', '.join(f"{name}={value}MB" for name, value in memory_usage().items())
+    return f"[startup] {role} pid={os.getpid()} ready in {time.time() - started:.2f}s, {memory}"
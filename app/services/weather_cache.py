@@ -0,0 +1,304 @@
+# 文件路径: app/services/weather_cache.py
+
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+from cachetools import TLRUCache
+from app.config import settings
+from app.services import shared_sqlite
+
+# --- 天气数据两级缓存 ---
+# L1: 进程内缓存(按条目的过期时间淘汰)；L2: 各 gunicorn worker 共享的 SQLite 文件，
+# 一个 worker 取到的数据其他 worker 直接复用。
+# 同一个键同时未命中时只有一个请求访问上游(single-flight)：
+# 本进程内的其他请求等待它的结果；其他进程通过 SQLite 中的租约得知有请求正在获取，轮询 L2 等待结果。
+#
+# 软过期/硬过期：条目在 ttl 内为新鲜数据；之后的 stale_ttl 内仍可直接返回(旧数据)，同时在后台刷新；
+# 超过硬过期时间后才需要同步等待上游。
+# 预取：记录各个键的请求次数(定期减半衰减)，后台定时刷新请求最多的 prefetch_top_n 个键，使其在过期前就已更新。
+
+# 等待其他进程获取结果的轮询间隔(秒)
+_POLL_INTERVAL = 0.1
+# 记录请求次数的键数上限(相对 prefetch_top_n 的倍数)
+_HOT_KEYS_FACTOR = 10
+
+# 后台刷新的线程池(gevent worker 下为协程)
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='weather-refresh')
+
+
+class _Flight:
+    """本进程内正在进行的一次获取，其他请求等待 event 后读取 value"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class TieredCache:
+    """
+    两级缓存。值必须可以 JSON 序列化。
+    namespace 区分共享数据库中的不同缓存，ttl 为默认的新鲜期(秒)，stale_ttl 为新鲜期之后仍可返回旧数据的时长，
+    prefetch_top_n > 0 时每 prefetch_interval 秒在后台刷新请求最多的键。
+    """
+
+    def __init__(self, namespace: str, maxsize: int, ttl: float, path: str | None = None,
+                 stale_ttl: float = 0, prefetch_top_n: int = 0, prefetch_interval: float = 60):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.prefetch_top_n = prefetch_top_n
+        self.prefetch_interval = prefetch_interval
+        self.path = settings.WEATHER_CACHE_PATH if path is None else path
+        # 条目为 (值, 新鲜期截止时间, 硬过期时间)，按各自的硬过期时间淘汰(与 L2 保持一致)
+        self._l1 = TLRUCache(maxsize=maxsize, ttu=lambda key, entry, now: entry[2], timer=time.time)
+        self._l1_lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._db_lock = threading.Lock()
+        self._last_cleanup = 0.0
+        # 预取：键 -> (请求次数, fetch, should_cache, ttl)
+        self._hot = {}
+        self._hot_lock = threading.Lock()
+        self._scheduler_pid = None
+
+    # --- L2 (SQLite) ---
+
+    def _connection(self):
+        # 连接在首次使用时创建；gunicorn fork 出的子进程不能复用父进程的连接
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = shared_sqlite.connect(self.path)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS weather_cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            if 'fresh_until' not in {row[1] for row in conn.execute("PRAGMA table_info(weather_cache)")}:
+                conn.execute("ALTER TABLE weather_cache ADD COLUMN fresh_until REAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS weather_leases ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, expires REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def _l2_get(self, key: str):
+        if not self.path:
+            return None
+        try:
+            with self._db_lock:
+                row = self._connection().execute(
+                    "SELECT value, COALESCE(fresh_until, expires), expires FROM weather_cache"
+                    " WHERE namespace = ? AND key = ? AND expires > ?",
+                    (self.namespace, key, time.time()),
+                ).fetchone()
+        except Exception as e:
+            print(f"读取共享天气缓存失败: {e}")
+            return None
+        return (orjson.loads(row[0]), row[1], row[2]) if row is not None else None
+
+    def _l2_put(self, key: str, value, fresh_until: float, expires: float):
+        if not self.path:
+            return
+        try:
+            with self._db_lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO weather_cache (namespace, key, value, fresh_until, expires)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, orjson.dumps(value), fresh_until, expires),
+                )
+                now = time.time()
+                if now - self._last_cleanup > 60:
+                    self._last_cleanup = now
+                    conn.execute("DELETE FROM weather_cache WHERE expires <= ?", (now,))
+                    conn.execute("DELETE FROM weather_leases WHERE expires <= ?", (now,))
+        except Exception as e:
+            print(f"写入共享天气缓存失败: {e}")
+
+    def _acquire_lease(self, key: str, timeout: float) -> bool:
+        """尝试获得跨进程的获取租约；租约过期(持有者异常退出)后可以被其他进程重新获得"""
+        if not self.path:
+            return True
+        now = time.time()
+        try:
+            with self._db_lock:
+                conn = self._connection()
+                conn.execute("DELETE FROM weather_leases WHERE namespace = ? AND key = ? AND expires <= ?",
+                             (self.namespace, key, now))
+                cur = conn.execute("INSERT OR IGNORE INTO weather_leases (namespace, key, expires) VALUES (?, ?, ?)",
+                                   (self.namespace, key, now + timeout))
+                return cur.rowcount == 1
+        except Exception as e:
+            print(f"获取天气缓存租约失败: {e}")
+            return True
+
+    def _release_lease(self, key: str):
+        if not self.path:
+            return
+        try:
+            with self._db_lock:
+                self._connection().execute("DELETE FROM weather_leases WHERE namespace = ? AND key = ?",
+                                           (self.namespace, key))
+        except Exception as e:
+            print(f"释放天气缓存租约失败: {e}")
+
+    # --- 对外接口 ---
+
+    def _lookup(self, key: str):
+        """依次查询 L1、L2，命中 L2 时回填 L1；返回 (值, 新鲜期截止时间, 硬过期时间) 或 None"""
+        with self._l1_lock:
+            entry = self._l1.get(key)
+        if entry is None or entry[1] <= time.time():
+            # L1 中的旧数据可能已被其他进程在 L2 中刷新
+            shared = self._l2_get(key)
+            if shared is not None:
+                entry = shared
+                with self._l1_lock:
+                    self._l1[key] = entry
+        return entry
+
+    def _fresh(self, key: str):
+        entry = self._lookup(key)
+        return entry[0] if entry is not None and entry[1] > time.time() else None
+
+    def get(self, key: str):
+        """未过硬过期时间的值(可能是旧数据)；未命中返回 None"""
+        entry = self._lookup(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value, ttl: float | None = None):
+        fresh_until = time.time() + (self.ttl if ttl is None else ttl)
+        expires = fresh_until + self.stale_ttl
+        with self._l1_lock:
+            self._l1[key] = (value, fresh_until, expires)
+        self._l2_put(key, value, fresh_until, expires)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def get_or_fetch(self, key: str, fetch, should_cache=lambda value: value is not None,
+                     ttl: float | None = None, timeout: float = 30.0):
+        """
+        命中缓存直接返回；否则调用 fetch() 获取并按 should_cache(value) 决定是否写入缓存。
+        同一个键的并发未命中只调用一次 fetch()，其他请求等待并共享它的结果(最多等待 timeout 秒)。
+        命中旧数据(新鲜期已过、未到硬过期时间)时立即返回旧数据，并在后台刷新。
+        """
+        self._record_hit(key, fetch, should_cache, ttl)
+        entry = self._lookup(key)
+        if entry is not None:
+            if entry[1] <= time.time():
+                self._refresh_in_background(key, fetch, should_cache, ttl, timeout)
+            return entry[0]
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.event.wait(timeout)
+            return flight.value if flight.value is not None else self.get(key)
+
+        try:
+            flight.value = self._fetch_across_workers(key, fetch, should_cache, ttl, timeout)
+            return flight.value
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def _fetch_across_workers(self, key, fetch, should_cache, ttl, timeout):
+        deadline = time.monotonic() + timeout
+        acquired = self._acquire_lease(key, timeout)
+        while not acquired:
+            # 其他进程正在获取：等待其结果出现在 L2 中；对方释放租约但没有写入缓存时由本进程获取
+            time.sleep(_POLL_INTERVAL)
+            value = self._fresh(key)
+            if value is not None:
+                return value
+            if time.monotonic() >= deadline:
+                break
+            acquired = self._acquire_lease(key, timeout)
+        try:
+            return self._fetch_and_store(key, fetch, should_cache, ttl)
+        finally:
+            if acquired:
+                self._release_lease(key)
+
+    def _fetch_and_store(self, key, fetch, should_cache, ttl):
+        value = self._fresh(key)  # 等待租约期间可能已有其他进程写入
+        if value is None:
+            value = fetch()
+            if should_cache(value):
+                self.set(key, value, ttl)
+        return value
+
+    # --- 后台刷新与预取 ---
+
+    def _refresh_in_background(self, key, fetch, should_cache, ttl, timeout=30.0):
+        """在后台刷新一个键；本进程已在获取、或其他进程持有租约时跳过"""
+        with self._flights_lock:
+            if key in self._flights:
+                return
+            flight = self._flights[key] = _Flight()
+
+        def run():
+            try:
+                if self._acquire_lease(key, timeout):
+                    try:
+                        flight.value = self._fetch_and_store(key, fetch, should_cache, ttl)
+                    finally:
+                        self._release_lease(key)
+            except Exception as e:
+                print(f"后台刷新天气缓存 {key} 失败: {e}")
+            finally:
+                with self._flights_lock:
+                    self._flights.pop(key, None)
+                flight.event.set()
+
+        _refresh_executor.submit(run)
+
+    def _record_hit(self, key, fetch, should_cache, ttl):
+        if not self.prefetch_top_n:
+            return
+        with self._hot_lock:
+            count = self._hot[key][0] if key in self._hot else 0
+            self._hot[key] = (count + 1, fetch, should_cache, ttl)
+            if len(self._hot) > self.prefetch_top_n * _HOT_KEYS_FACTOR:
+                coldest = min(self._hot, key=lambda k: self._hot[k][0])
+                del self._hot[coldest]
+        if self._scheduler_pid != os.getpid():
+            self._start_scheduler()
+
+    def _start_scheduler(self):
+        with self._hot_lock:
+            if self._scheduler_pid == os.getpid():
+                return
+            self._scheduler_pid = os.getpid()
+        threading.Thread(target=self._prefetch_loop, name=f'weather-prefetch-{self.namespace}', daemon=True).start()
+
+    def _prefetch_loop(self):
+        while True:
+            time.sleep(self.prefetch_interval)
+            try:
+                self.prefetch_once()
+            except Exception as e:
+                print(f"天气缓存预取失败: {e}")
+
+    def prefetch_once(self):
+        """刷新请求次数最多、且将在两个预取周期内过期的键；请求次数随后减半"""
+        with self._hot_lock:
+            top = heapq.nlargest(self.prefetch_top_n, self._hot.items(), key=lambda item: item[1][0])
+            self._hot = {k: (v[0] // 2, *v[1:]) for k, v in self._hot.items() if v[0] // 2 > 0}
+        horizon = time.time() + self.prefetch_interval * 2
+        for key, (_, fetch, should_cache, ttl) in top:
+            entry = self._lookup(key)
+            if entry is None or entry[1] <= horizon:
+                self._refresh_in_background(key, fetch, should_cache, ttl)
@@ -1,47 +1,296 @@
 import requests
 import datetime
+import threading
 import time
-from cachetools import TTLCache
+import numpy as np
+import orjson
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from werkzeug.datastructures import ResponseCacheControl
+from werkzeug.http import parse_cache_control_header
 from app.config import settings
+from app.services import geocoding, history_store
+from app.services.tile_cache import TileCache
+from app.services.weather_cache import TieredCache
 
 # --- 缓存设置 ---
-weather_cache = TTLCache(maxsize=128, ttl=900)
-history_cache = TTLCache(maxsize=256, ttl=21600)
+# 进程内缓存 + 各 worker 共享的 SQLite 缓存；同一个键的并发未命中只请求一次上游。
+# 实时天气与趋势数据过期后先返回旧数据并在后台刷新，热门城市在过期前预取
+weather_cache = TieredCache('weather', maxsize=128, ttl=900, stale_ttl=settings.WEATHER_STALE_TTL,
+                            prefetch_top_n=settings.WEATHER_PREFETCH_TOP_N,
+                            prefetch_interval=settings.WEATHER_PREFETCH_INTERVAL)
+history_cache = TieredCache('history', maxsize=256, ttl=21600)
+tile_cache = TileCache(settings.TILE_CACHE_MEMORY_BYTES, settings.TILE_CACHE_DIR)
 
 # 使用 requests.Session() 可以复用TCP连接，提升性能
+# 连接池大小与并发请求数匹配，连接失败或网关错误时快速重试一次
 session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=settings.WEATHER_POOL_MAXSIZE,
+    max_retries=Retry(total=1, connect=1, read=0, backoff_factor=0.2,
+                      status_forcelist=(502, 503, 504), allowed_methods=frozenset(['GET'])),
+)
+session.mount('https://', _adapter)
+session.mount('http://', _adapter)
+
+# 每个上游请求的 (连接, 读取) 超时(秒)
+UPSTREAM_TIMEOUT = (settings.WEATHER_CONNECT_TIMEOUT, settings.WEATHER_READ_TIMEOUT)
+
+# 并发请求上游接口的线程池(gevent worker 下为协程)
+_fanout_executor = ThreadPoolExecutor(max_workers=settings.WEATHER_POOL_MAXSIZE, thread_name_prefix='weather')
+
+
+def _fetch_json(url: str, params: dict):
+    res = session.get(url, params=params, timeout=UPSTREAM_TIMEOUT)
+    res.raise_for_status()
+    return res.json()
+
+
+def _fetch_all(calls: dict, deadline: float) -> tuple[dict, dict]:
+    """
+    并发请求多个上游接口，calls 为 {名称: (url, params)}，最多等待 deadline 秒。
+    返回 (results, errors)：results 为成功的 {名称: JSON}，errors 为失败或超时的 {名称: 原因}。
+    """
+    futures = {name: _fanout_executor.submit(_fetch_json, url, params) for name, (url, params) in calls.items()}
+    wait(futures.values(), timeout=deadline)
+    results, errors = {}, {}
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            errors[name] = "timeout"
+        elif future.exception() is not None:
+            errors[name] = str(future.exception())
+        else:
+            results[name] = future.result()
+    return results, errors
 
 
 def _get_coords_for_city(city: str) -> dict | None:
-    """内部使用的函数，将城市名转换为经纬度，并带缓存"""
-    cache_key = f"coords_{city}"
-    if cache_key in weather_cache:
-        return weather_cache[cache_key]
+    """
+    内部使用的函数，将城市名转换为经纬度：先查永久的地理编码索引，未收录时请求地理编码接口并写入索引。
+    同一城市的并发查询只请求一次接口。
+    """
+    coords = geocoding.lookup(city)
+    if coords is not None:
+        return coords
+    coords = weather_cache.get_or_fetch(f"coords_{geocoding.city_key(city)}", lambda: _fetch_coords(city))
+    if coords is not None:
+        geocoding.add(city, coords)
+    return coords
 
+
+def _fetch_coords(city: str) -> dict | None:
     GEO_URL = "http://api.openweathermap.org/geo/1.0/direct"
     geo_params = {'q': city, 'limit': 1, 'appid': settings.API_KEY}
     try:
-        res = session.get(GEO_URL, params=geo_params)
+        res = session.get(GEO_URL, params=geo_params, timeout=UPSTREAM_TIMEOUT)
         res.raise_for_status()
         geo_data = res.json()
         if not geo_data:
             return None
 
-        coords = {'lat': geo_data[0]['lat'], 'lon': geo_data[0]['lon']}
-        weather_cache[cache_key] = coords
-        return coords
+        return {'lat': geo_data[0]['lat'], 'lon': geo_data[0]['lon']}
     except requests.exceptions.RequestException as e:
         print(f"获取经纬度失败: {e}")
         return None
 
 
 def get_realtime_weather_bundle(city: str) -> dict | None:
-    """获取“实时天气”页面所需的数据包"""
-    bundle_cache_key = f"bundle_{city}"
-    if bundle_cache_key in weather_cache:
-        print(f"从缓存读取 {city} 的实时天气数据包")
-        return weather_cache[bundle_cache_key]
+    """
+    获取“实时天气”页面所需的数据包。
+    实时天气、5天预报、空气质量三个接口并发请求，总耗时不超过 WEATHER_BUNDLE_DEADLINE 秒；
+    部分接口失败时对应字段为 None，并在 errors 中给出原因(部分结果不写入缓存)。全部失败时返回 None。
+    """
+    return weather_cache.get_or_fetch(
+        f"bundle_{city}", lambda: _fetch_and_summarize_bundle(city),
+        should_cache=lambda result: result is not None and "errors" not in result,
+    )
+
+
+def get_compact_weather(city: str) -> str | None:
+    """
+    实时天气数据包的精简视图(已序列化的 JSON)：当前天气摘要、空气质量与按天汇总的预报。
+    精简视图在数据包写入缓存时计算一次并缓存，命中时直接返回。
+    """
+    bundle = get_realtime_weather_bundle(city)
+    if bundle is None:
+        return None
+    version = _bundle_version(bundle)
+    cached = weather_cache.get(f"compact_{city}")
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    payload = _compact_payload(bundle)
+    if "errors" not in bundle:
+        weather_cache.set(f"compact_{city}", [version, payload])
+    return payload
+
+
+def _fetch_and_summarize_bundle(city: str) -> dict | None:
+    bundle = _fetch_realtime_bundle(city)
+    if bundle is not None and "errors" not in bundle:
+        weather_cache.set(f"compact_{city}", [_bundle_version(bundle), _compact_payload(bundle)])
+    return bundle
+
+
+def _bundle_version(bundle: dict):
+    """数据包的版本(实时天气的观测时间与第一条预报的时间)，用于判断缓存的精简视图是否对应当前数据包"""
+    forecast = (bundle.get("forecast") or {}).get('list') or [{}]
+    return [(bundle.get("current") or {}).get('dt'), forecast[0].get('dt')]
+
+
+def _compact_payload(bundle: dict) -> str:
+    compact = {
+        "current": _summarize_current(bundle.get("current")),
+        "air_quality": _summarize_air(bundle.get("air_quality")),
+        "daily": _summarize_daily(bundle.get("forecast")),
+    }
+    if "errors" in bundle:
+        compact["errors"] = bundle["errors"]
+    return orjson.dumps(compact).decode('utf-8')
+
+
+def _summarize_current(current: dict | None) -> dict | None:
+    if not current:
+        return None
+    main, weather = current.get('main', {}), (current.get('weather') or [{}])[0]
+    return {
+        "dt": current.get('dt'),
+        "temp": main.get('temp'),
+        "feels_like": main.get('feels_like'),
+        "humidity": main.get('humidity'),
+        "pressure": main.get('pressure'),
+        "wind_speed": current.get('wind', {}).get('speed'),
+        "description": weather.get('description'),
+        "icon": weather.get('icon'),
+    }
+
+
+def _summarize_air(air_quality: dict | None) -> dict | None:
+    entries = (air_quality or {}).get('list')
+    if not entries:
+        return None
+    components = entries[0].get('components', {})
+    return {
+        "aqi": entries[0].get('main', {}).get('aqi'),
+        "pm2_5": components.get('pm2_5'),
+        "pm10": components.get('pm10'),
+    }
+
+
+def _summarize_daily(forecast: dict | None) -> list | None:
+    """把 5天/3小时 预报按当地日期汇总：最低/最高气温、降水量合计、最大降水概率、中午前后的天气图标"""
+    entries = (forecast or {}).get('list')
+    if not entries:
+        return None
+    offset = (forecast.get('city') or {}).get('timezone', 0)
+    local = np.array([e['dt'] for e in entries], dtype=np.int64) + offset
+    days = local // 86400
+    temp_min = np.array([e.get('main', {}).get('temp_min', np.nan) for e in entries], dtype=np.float64)
+    temp_max = np.array([e.get('main', {}).get('temp_max', np.nan) for e in entries], dtype=np.float64)
+    precip = np.array([e.get('rain', {}).get('3h', 0) + e.get('snow', {}).get('3h', 0) for e in entries],
+                      dtype=np.float64)
+    pop = np.array([e.get('pop', 0) for e in entries], dtype=np.float64)
+
+    # 预报按时间排序，同一天的条目连续
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    # 每天取最接近当地 12 点的条目的天气图标
+    noon_distance = np.abs(local % 86400 - 43200)
+    icons = [
+        (entries[start + int(np.argmin(noon_distance[start:end]))].get('weather') or [{}])[0].get('icon')
+        for start, end in zip(starts, np.r_[starts[1:], len(entries)])
+    ]
+    dates = (days[starts] * 86400).astype('datetime64[s]').astype('datetime64[D]').astype(str)
+    daily_min = np.fmin.reduceat(temp_min, starts)
+    daily_max = np.fmax.reduceat(temp_max, starts)
+    daily_precip = np.add.reduceat(precip, starts)
+    daily_pop = np.maximum.reduceat(pop, starts)
+    return [
+        {"date": date, "temp_min": None if np.isnan(lo) else round(float(lo), 1),
+         "temp_max": None if np.isnan(hi) else round(float(hi), 1),
+         "precipitation": round(float(p), 1), "pop": round(float(chance), 2), "icon": icon}
+        for date, lo, hi, p, chance, icon in zip(dates.tolist(), daily_min, daily_max, daily_precip, daily_pop, icons)
+    ]
+
+
+# 批量查询时获取未命中城市的线程池(gevent worker 下为协程)。
+# 每个城市的上游请求再经 _fanout_executor 并发，两者分开以免外层任务占满内层线程池
+_batch_executor = ThreadPoolExecutor(max_workers=settings.WEATHER_BATCH_CONCURRENCY, thread_name_prefix='weather-batch')
+
+
+def get_weather_batch(cities: list, view: str = 'full', fields: list | None = None) -> list:
+    """
+    批量获取多个城市的实时天气数据包(view='compact' 时为精简视图)，按 cities 的顺序返回
+    [{'city', 'status', 'data', 'errors'}, ...]。status 为 ok / partial / not_found / error / timeout。
+    已缓存的城市直接返回；其余城市并发获取(最多 WEATHER_BATCH_CONCURRENCY 个)，最多等待 WEATHER_BATCH_DEADLINE 秒，
+    超时的城市在后台继续获取并写入缓存。
+    """
+    def load(city):
+        if view == 'compact':
+            payload = get_compact_weather(city)
+            return None if payload is None else orjson.loads(payload)
+        return get_realtime_weather_bundle(city)
+
+    def entry(city, data):
+        if data is None:
+            return {'city': city, 'status': 'not_found'}
+        result = {'city': city, 'status': 'partial' if 'errors' in data else 'ok'}
+        if 'errors' in data:
+            result['errors'] = data['errors']
+        result['data'] = project_fields(data, fields) if fields else data
+        return result
+
+    results, pending = {}, {}
+    for city in dict.fromkeys(cities):
+        if f"bundle_{city}" in weather_cache:
+            results[city] = entry(city, load(city))
+        else:
+            pending[city] = _batch_executor.submit(load, city)
+
+    wait(pending.values(), timeout=settings.WEATHER_BATCH_DEADLINE)
+    for city, future in pending.items():
+        if not future.done():
+            results[city] = {'city': city, 'status': 'timeout'}
+        elif future.exception() is not None:
+            results[city] = {'city': city, 'status': 'error', 'errors': str(future.exception())}
+        else:
+            results[city] = entry(city, future.result())
+    return [results[city] for city in dict.fromkeys(cities)]
+
+
+def project_fields(data: dict, fields: list) -> dict:
+    """
+    按字段路径投影：fields 为 ["current.main.temp", "forecast.city", ...]，
+    返回只包含这些字段的嵌套字典(不存在的路径忽略；列表中的字典按同一路径逐项投影)。
+    """
+    result = {}
+    for field in fields:
+        _project_path(data, field.split('.'), result)
+    return result
+
 
+def _project_path(data, path: list, out: dict):
+    head, rest = path[0], path[1:]
+    if not isinstance(data, dict) or head not in data:
+        return
+    value = data[head]
+    if not rest:
+        out[head] = value
+    elif isinstance(value, list):
+        items = out.get(head)
+        if not isinstance(items, list):
+            items = out[head] = [{} for _ in value]
+        for item, target in zip(value, items):
+            _project_path(item, rest, target)
+    elif isinstance(value, dict):
+        target = out.get(head)
+        if not isinstance(target, dict):
+            target = out[head] = {}
+        _project_path(value, rest, target)
+
+
+def _fetch_realtime_bundle(city: str) -> dict | None:
     coords = _get_coords_for_city(city)
     if not coords:
         return None
@@ -49,36 +298,87 @@ def get_realtime_weather_bundle(city: str) -> dict | None:
     BASE_URL = "https://api.openweathermap.org/data/2.5"
     params = {**coords, 'appid': settings.API_KEY, 'units': 'metric', 'lang': 'zh_cn'}
 
-    try:
-        print(f"从API获取 {city} 的新实时天气数据包...")
-        current_res = session.get(f"{BASE_URL}/weather", params=params)
-        current_res.raise_for_status()
-
-        forecast_res = session.get(f"{BASE_URL}/forecast", params=params)
-        forecast_res.raise_for_status()
-
-        air_res = session.get(f"{BASE_URL}/air_pollution", params=params)
-        air_res.raise_for_status()
-
-        result = {
-            "current": current_res.json(),
-            "forecast": forecast_res.json(),
-            "air_quality": air_res.json()
-        }
-        weather_cache[bundle_cache_key] = result
-        return result
-    except requests.exceptions.RequestException as e:
-        print(f"请求实时天气数据包失败: {e}")
+    print(f"从API获取 {city} 的新实时天气数据包...")
+    results, errors = _fetch_all({
+        "current": (f"{BASE_URL}/weather", params),
+        "forecast": (f"{BASE_URL}/forecast", params),
+        "air_quality": (f"{BASE_URL}/air_pollution", params),
+    }, deadline=settings.WEATHER_BUNDLE_DEADLINE)
+
+    if not results:
+        print(f"请求实时天气数据包失败: {errors}")
         return None
 
+    result = {name: results.get(name) for name in ("current", "forecast", "air_quality")}
+    if errors:
+        print(f"实时天气数据包部分请求失败: {errors}")
+        result["errors"] = errors
+    return result
+
+
+# 某一天结束该秒数之后，其历史天气视为不再变化(上游数据入库有延迟)
+_HISTORY_SETTLE_SECONDS = 6 * 3600
+
+# 按日期范围查询时并发请求各天历史天气的线程池(gevent worker 下为协程)，限制同时请求上游的数量
+_history_executor = ThreadPoolExecutor(max_workers=settings.WEATHER_HISTORY_CONCURRENCY,
+                                       thread_name_prefix='weather-history')
+
+
+def _is_final_day(date_str: str) -> bool:
+    try:
+        day = datetime.datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return (day + datetime.timedelta(days=1)).timestamp() + _HISTORY_SETTLE_SECONDS <= time.time()
+
 
 def get_historical_weather(city: str, date_str: str) -> dict | None:
-    """获取指定城市在过去某一日期的24小时历史天气数据。"""
-    cache_key = f"history_{city}_{date_str}"
-    if cache_key in history_cache:
-        print(f"从缓存读取 {city} 在 {date_str} 的历史天气")
-        return history_cache[cache_key]
+    """
+    获取指定城市在过去某一日期的24小时历史天气数据。
+    已结束的日期永久保存在历史天气存储中，其余日期使用 history_cache。
+    """
+    city_key = geocoding.city_key(city)
+    stored = history_store.get_many(city_key, [date_str])
+    if date_str in stored:
+        return stored[date_str]
+    return _get_history_day(city, city_key, date_str)
+
+
+def _get_history_day(city: str, city_key: str, date_str: str) -> dict | None:
+    data = history_cache.get_or_fetch(f"history_{city_key}_{date_str}", lambda: _fetch_historical(city, date_str))
+    if data is not None and _is_final_day(date_str):
+        history_store.put(city_key, date_str, data)
+    return data
 
+
+def get_historical_range(city: str, start: datetime.date, end: datetime.date) -> dict | None:
+    """
+    获取 start 至 end (含) 每一天的历史天气并合并：list 为按时间顺序拼接的逐小时数据，
+    missing 为获取失败的日期。未保存的日期并发请求(最多 WEATHER_HISTORY_CONCURRENCY 个)。
+    找不到城市时返回 None。
+    """
+    days = [(start + datetime.timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+    city_key = geocoding.city_key(city)
+    results = history_store.get_many(city_key, days)
+    missing = [day for day in days if day not in results]
+    if missing:
+        if not _get_coords_for_city(city):
+            return None
+        fetched = _history_executor.map(lambda day: _get_history_day(city, city_key, day), missing)
+        results.update((day, data) for day, data in zip(missing, fetched) if data is not None)
+
+    merged = [entry for day in days if day in results for entry in results[day].get('list', [])]
+    return {
+        'city': city,
+        'start': days[0],
+        'end': days[-1],
+        'cnt': len(merged),
+        'list': merged,
+        'missing': [day for day in days if day not in results],
+    }
+
+
+def _fetch_historical(city: str, date_str: str) -> dict | None:
     try:
         start_dt_object = datetime.datetime.strptime(date_str, "%Y-%m-%d")
         start_unix_timestamp = int(start_dt_object.timestamp())
@@ -105,11 +405,9 @@ def get_historical_weather(city: str, date_str: str) -> dict | None:
 
     try:
         print(f"从正确的API({HISTORY_URL})获取 {city} 在 {date_str} 的历史天气...")
-        res = session.get(HISTORY_URL, params=params)
+        res = session.get(HISTORY_URL, params=params, timeout=UPSTREAM_TIMEOUT)
         res.raise_for_status()
-        data = res.json()
-        history_cache[cache_key] = data
-        return data
+        return res.json()
     except requests.exceptions.RequestException as e:
         print(f"请求历史天气失败: {e}")
         return None
@@ -117,11 +415,10 @@ def get_historical_weather(city: str, date_str: str) -> dict | None:
 
 def get_30_day_forecast(city: str) -> dict | None:
     """获取指定城市的30天预报数据"""
-    cache_key = f"forecast30_{city}"
-    if cache_key in weather_cache:
-        print(f"从缓存读取 {city} 的30天预报")
-        return weather_cache[cache_key]
+    return weather_cache.get_or_fetch(f"forecast30_{city}", lambda: _fetch_30_day_forecast(city))
+
 
+def _fetch_30_day_forecast(city: str) -> dict | None:
     coords = _get_coords_for_city(city)
     if not coords:
         return None
@@ -136,11 +433,9 @@ def get_30_day_forecast(city: str) -> dict | None:
 
     try:
         print(f"从API获取 {city} 的30天预报...")
-        res = session.get(FORECAST_URL, params=params)
+        res = session.get(FORECAST_URL, params=params, timeout=UPSTREAM_TIMEOUT)
         res.raise_for_status()
-        data = res.json()
-        weather_cache[cache_key] = data
-        return data
+        return res.json()
     except requests.exceptions.RequestException as e:
         print(f"请求30天预报失败: {e}")
         return None
@@ -171,3 +466,113 @@ def get_map_layer_urls() -> dict:
             api_key=settings.API_KEY
         )
     return layer_urls
+
+
+# --- 地图瓦片代理 ---
+MAP_TILE_URL = "https://maps.openweathermap.org/maps/2.0/weather/{op}/{z}/{x}/{y}"
+_TILE_CHUNK = 16 * 1024
+
+# 正在从上游获取的瓦片：同一瓦片的并发请求等待第一个请求写入缓存
+_tile_flights = {}
+_tile_flights_lock = threading.Lock()
+
+
+def _tile_ttl(cache_control: str | None) -> float:
+    """按上游 Cache-Control 计算瓦片的缓存时长(秒)，不允许缓存时返回 0"""
+    if not cache_control:
+        return settings.TILE_CACHE_DEFAULT_TTL
+    cc = parse_cache_control_header(cache_control, cls=ResponseCacheControl)
+    if cc.no_store or cc.no_cache or cc.private:
+        return 0
+    max_age = cc.s_maxage if cc.s_maxage is not None else cc.max_age
+    return settings.TILE_CACHE_DEFAULT_TTL if max_age is None else max_age
+
+
+def _cached_tile(entry) -> tuple:
+    body, content_type, expires = entry
+    max_age = max(int(expires - time.time()), 0)
+    return body, {'Content-Type': content_type, 'Cache-Control': f"public, max-age={max_age}"}
+
+
+class _TileBody:
+    """
+    边从上游读取边返回给客户端的瓦片内容，完整读取后写入缓存。
+    读取结束时执行 on_close；客户端中途断开时由 WSGI 服务器调用 close()，释放上游连接并执行 on_close。
+    """
+
+    def __init__(self, res, key: tuple, content_type: str, ttl: float, on_close=None):
+        self._res = res
+        self._key = key
+        self._content_type = content_type
+        self._ttl = ttl
+        self._on_close = on_close
+
+    def __iter__(self):
+        chunks = []
+        for chunk in self._res.iter_content(_TILE_CHUNK):
+            chunks.append(chunk)
+            yield chunk
+        tile_cache.put(*self._key, b''.join(chunks), self._content_type, self._ttl)
+        self._finish()
+
+    def _finish(self):
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close()
+
+    def close(self):
+        self._res.close()
+        self._finish()
+
+
+def _stream_tile(op: str, z: int, x: int, y: int, on_close=None) -> tuple:
+    """请求上游瓦片，返回 (_TileBody, 响应头)；on_close 在响应结束或请求失败时调用"""
+    try:
+        res = session.get(MAP_TILE_URL.format(op=op, z=z, x=x, y=y), params={'appid': settings.API_KEY},
+                          timeout=UPSTREAM_TIMEOUT, stream=True)
+        res.raise_for_status()
+    except Exception:
+        if on_close is not None:
+            on_close()
+        raise
+
+    content_type = res.headers.get('Content-Type', 'image/png')
+    cache_control = res.headers.get('Cache-Control')
+    headers = {'Content-Type': content_type}
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+    if 'Content-Length' in res.headers and 'Content-Encoding' not in res.headers:
+        headers['Content-Length'] = res.headers['Content-Length']
+    return _TileBody(res, (op, z, x, y), content_type, _tile_ttl(cache_control), on_close), headers
+
+
+def get_map_tile(op: str, z: int, x: int, y: int) -> tuple:
+    """
+    获取天气地图瓦片，返回 (内容, 响应头)：缓存命中时内容为 bytes，否则为边下载边返回的可迭代对象。
+    同一瓦片同时未命中时只有一个请求访问上游，其余请求等待其写入缓存。
+    上游请求失败时抛出 requests.exceptions.RequestException。
+    """
+    entry = tile_cache.get(op, z, x, y)
+    if entry is not None:
+        return _cached_tile(entry)
+
+    key = (op, z, x, y)
+    with _tile_flights_lock:
+        done = _tile_flights.get(key)
+        leader = done is None
+        if leader:
+            done = _tile_flights[key] = threading.Event()
+    if not leader:
+        done.wait(sum(UPSTREAM_TIMEOUT))
+        entry = tile_cache.get(op, z, x, y)
+        if entry is not None:
+            return _cached_tile(entry)
+        # 第一个请求失败或瓦片不可缓存：自行请求上游
+        return _stream_tile(op, z, x, y)
+
+    def finish():
+        with _tile_flights_lock:
+            _tile_flights.pop(key, None)
+        done.set()
+
+    return _stream_tile(op, z, x, y, finish)
@@ -1,8 +1,12 @@
 # app/views/calculator_routes.py
 
-from flask import Blueprint, request, jsonify
+from itertools import chain
+
+import pandas as pd
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 # 从我们创建的services模块中导入核心逻辑类
-from app.services.carbon_estimator import CarbonEstimator
+from app.services import ingestion, upload_spool
+from app.services.carbon_estimator import CarbonEstimator, INVENTORY_COLUMNS
 
 # 创建一个名为 'calculator_bp' 的蓝图
 # url_prefix='/api' 表示这个蓝图下所有路由的URL都会以 /api 开头
@@ -30,3 +34,86 @@ def handle_estimation():
 
     except Exception as e:
         return jsonify({"success": False, "error": f"服务器内部错误: {str(e)}"}), 500
+
+
+# 批量估算结果的输出格式
+BATCH_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def _record_batches(records: list):
+    """JSON 数组 -> 每 BATCH_ROWS 行一批的 DataFrame；兼容 /estimate 的 {fuel_data, electricity_data} 结构"""
+    for start in range(0, len(records), ingestion.BATCH_ROWS):
+        rows = []
+        for record in records[start:start + ingestion.BATCH_ROWS]:
+            if 'fuel_data' in record or 'electricity_data' in record:
+                record = {'name': record.get('name'), **(record.get('fuel_data') or {}),
+                          **(record.get('electricity_data') or {})}
+            rows.append(record)
+        yield pd.DataFrame(rows, columns=list(dict.fromkeys(INVENTORY_COLUMNS.values())))
+
+
+def _stream_results(batches, fmt: str):
+    offset = 0
+    for frame in batches:
+        frame = frame.reset_index(drop=True)
+        result = estimator.estimate_batch(frame)
+        result.insert(0, 'row', range(offset, offset + len(frame)))
+        if fmt == 'csv':
+            if len(result):
+                result['flags'] = result['flags'].str.join(';')
+            # 第一批即使没有数据行也输出表头
+            yield result.to_csv(index=False, header=offset == 0)
+        elif len(result):
+            yield result.to_json(orient='records', lines=True, force_ascii=False).rstrip('\n') + '\n'
+        offset += len(frame)
+
+
+@calculator_bp.route('/estimate/batch', methods=['POST'])
+def handle_batch_estimation():
+    """
+    批量估算多家企业的碳排放。
+    请求体为 JSON 数组(每项为 {name, gas, diesel, gasoline, coal, consumption_kwh, region}，
+    或与 /estimate 相同的 {name, fuel_data, electricity_data})，或以 file 字段上传 Excel/CSV 清单。
+    ?format=ndjson(默认) 或 csv；结果逐批计算、逐批返回，每行附带 row(在输入中的序号)、valid 与 flags。
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in BATCH_FORMATS:
+        return jsonify({"success": False, "error": f"format 只能是 {', '.join(BATCH_FORMATS)}"}), 400
+
+    upload_id = None
+    if 'file' in request.files:
+        try:
+            # 先流式写入暂存目录，再从磁盘逐批读取，不把整个文件读入内存
+            upload_id = upload_spool.save(request.files['file'].stream)
+        except upload_spool.UploadTooLargeError:
+            return jsonify({"success": False, "error": "文件过大"}), 413
+        batches = ingestion.iter_tables(upload_spool.spool_path(upload_id), INVENTORY_COLUMNS)
+    else:
+        records = request.get_json(silent=True)
+        if not isinstance(records, list) or not records:
+            return jsonify({"success": False, "error": "请求体应为非空的 JSON 数组或上传的清单文件"}), 400
+        if not all(isinstance(record, dict) for record in records):
+            return jsonify({"success": False, "error": "JSON 数组的每一项都应为对象"}), 400
+        batches = _record_batches(records)
+
+    def cleanup():
+        batches.close()
+        if upload_id is not None:
+            upload_spool.discard(upload_id)
+
+    # 先读取第一批，文件无法解析、缺少所有需要的列或没有数据行时直接返回错误
+    try:
+        first = next(batches)
+        if not set(first.columns) - {'name'}:
+            raise ValueError("清单中没有燃料消耗或用电量列")
+        if first.empty:
+            raise ValueError("清单中没有数据行")
+    except Exception as e:
+        cleanup()
+        return jsonify({"success": False, "error": f"无法读取清单: {str(e)}"}), 400
+
+    response = Response(stream_with_context(_stream_results(chain([first], batches), fmt)),
+                        mimetype=BATCH_FORMATS[fmt])
+    # 响应结束(包括客户端在开始读取前断开)时释放文件并删除暂存文件
+    response.call_on_close(cleanup)
+    return response
@@ -1,8 +1,16 @@
 # 文件路径: app/views/heatmap_routes.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, url_for, Response
 import json
-from app.services.heatmap_service import create_heatmap_image
+import math
+import base64
+import hashlib
+from app.config import settings
+from app.services import heatmap_jobs, surface_store
+
+# 瓦片渲染与曲面导出依赖 geopandas/shapely/matplotlib/scipy 等较重的模块，
+# 在首次使用时才导入(见各路由函数)，只处理天气等其他接口的 worker 不必加载它们。
+# 预加载模式下由 gunicorn master 预先导入(见 app/services/warmup.py)。
 
 # 1. 创建一个专门用于热力图功能的新蓝图(Blueprint)
 # 我们为它指定一个URL前缀'/api/heatmap'，这样所有属于这个蓝图的路由都会在这个路径下
@@ -16,6 +24,10 @@ heatmap_bp = Blueprint('heatmap', __name__, url_prefix='/api/heatmap')
 def generate_heatmap():
     """
     接收前端请求，生成热力图的API端点。
+    热力图在后台进程池中生成；表单字段 async=true 时立即返回任务ID，
+    之后通过 /api/heatmap/jobs/<job_id> 轮询结果。
+    表单字段 response=binary 时直接返回图片字节(而不是base64 JSON)，
+    图片也可以通过 /api/heatmap/jobs/<job_id>/image 以可缓存的GET请求获取。
     """
     if 'excelFile' not in request.files:
         return jsonify({"status": "error", "message": "请求中缺少 'excelFile' 文件部分"}), 400
@@ -28,22 +40,234 @@ def generate_heatmap():
         try:
             options_str = request.form.get('options', '{}')
             options = json.loads(options_str)
+            if 'image_width' in options:
+                image_width = _parse_image_width(options['image_width'])
+                if image_width is None:
+                    return jsonify({"status": "error", "message": "image_width 必须是正整数"}), 400
+                options['image_width'] = image_width
+            file_bytes = file.read()
 
-            base64_image = create_heatmap_image(file, options)
+            if request.form.get('async', '').lower() in ('1', 'true'):
+                job_id = heatmap_jobs.submit(file_bytes, options)
+                return _job_pending_response(job_id)
 
-            if base64_image:
-                return jsonify({
-                    "status": "success",
-                    "message": "热力图生成成功",
-                    "image_base64": base64_image
-                })
-            else:
-                return jsonify({"status": "error", "message": "后端生成热力图失败，请检查服务器日志"}), 500
+            job = heatmap_jobs.run(file_bytes, options)
+            if job['status'] == 'done' and request.form.get('response') == 'binary':
+                return _image_response(job)
+            return _job_response(job)
 
+        except heatmap_jobs.QueueFullError:
+            return jsonify({"status": "error", "message": "热力图任务繁忙，请稍后重试"}), 503
         except json.JSONDecodeError:
             return jsonify({"status": "error", "message": "选项(options)字段的JSON格式错误"}), 400
         except Exception as e:
             print(f"Unhandled error: {e}")
             return jsonify({"status": "error", "message": "服务器内部错误"}), 500
 
-    return jsonify({"status": "error", "message": "无效的文件或请求"}), 400
\ No newline at end of file
+    return jsonify({"status": "error", "message": "无效的文件或请求"}), 400
+
+
+@heatmap_bp.route('/jobs/<string:job_id>', methods=['GET'])
+def get_heatmap_job(job_id):
+    """
+    查询异步热力图任务的状态；任务完成时返回图片。
+    """
+    return _job_response({**heatmap_jobs.get_status(job_id), 'job_id': job_id})
+
+
+@heatmap_bp.route('/jobs/<string:job_id>/image', methods=['GET'])
+def get_heatmap_job_image(job_id):
+    """
+    以二进制形式获取任务生成的图片，支持 ETag / If-None-Match 条件请求(未变化时返回304)。
+    任务未完成或失败时返回与状态查询相同的JSON。
+    """
+    job = {**heatmap_jobs.get_status(job_id), 'job_id': job_id}
+    if job['status'] == 'done':
+        return _image_response(job)
+    return _job_response(job)
+
+
+@heatmap_bp.route('/tiles/<string:surface_id>/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+def get_heatmap_tile(surface_id, z, x, y):
+    """
+    插值曲面的 XYZ 瓦片(与天气图层代理相同的瓦片方案)，边界外透明。
+    可选参数: colormap (默认 classic_custom)，vmin/vmax (默认使用整个曲面的数值范围)。
+    """
+    from app.services import heatmap_tiles
+
+    if not heatmap_tiles.is_valid_tile(z, x, y):
+        return jsonify({"status": "error", "message": "无效的瓦片坐标"}), 400
+
+    colormap = request.args.get('colormap', 'classic_custom')
+    value_range = None
+    if 'vmin' in request.args and 'vmax' in request.args:
+        try:
+            value_range = (float(request.args['vmin']), float(request.args['vmax']))
+        except ValueError:
+            return jsonify({"status": "error", "message": "vmin/vmax 参数必须是数字"}), 400
+
+    try:
+        rendered = heatmap_tiles.render_tile(surface_id, z, x, y, colormap, value_range)
+    except (KeyError, ValueError):
+        return jsonify({"status": "error", "message": f"无效的色标: {colormap}"}), 400
+    if rendered is None:
+        return jsonify({"status": "error", "message": "插值曲面不存在或已过期"}), 404
+
+    tile, final = rendered
+    response = Response(tile, mimetype='image/png')
+    response.set_etag(hashlib.sha256(tile).hexdigest()[:32])
+    if final:
+        # 同一曲面的瓦片内容不会变化，可以被客户端缓存
+        response.cache_control.public = True
+        response.cache_control.max_age = settings.HEATMAP_SURFACE_TTL
+    else:
+        # 细化尚未完成的粗略瓦片：客户端每次使用前都要重新验证，细化完成后即可取到新内容
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@heatmap_bp.route('/surfaces/<string:surface_id>/grid', methods=['GET'])
+def export_surface_grid(surface_id):
+    """
+    以紧凑的二进制形式导出插值网格，供前端自行着色(格式见 surface_export 模块说明)。
+    可选参数: encoding=uint8 (默认，量化) / float16。
+    """
+    from app.services import surface_export
+
+    encoding = request.args.get('encoding', 'uint8')
+    if encoding not in surface_export.GRID_ENCODINGS:
+        return jsonify({"status": "error", "message": f"不支持的网格编码: {encoding}"}), 400
+
+    etag = _export_etag(surface_id, 'grid', encoding)
+    # 曲面过期被删除后不能再用 304 确认客户端缓存有效
+    if not surface_store.exists(surface_id):
+        return jsonify({"status": "error", "message": "插值曲面不存在或已过期"}), 404
+    if etag in request.if_none_match:
+        return _export_response(b'', 'application/octet-stream', etag)
+
+    surface = surface_store.load_surface(surface_id)
+    if surface is None:
+        return jsonify({"status": "error", "message": "插值曲面不存在或已过期"}), 404
+    return _export_response(surface_export.export_grid(surface, encoding), 'application/octet-stream', etag)
+
+
+@heatmap_bp.route('/surfaces/<string:surface_id>/isobands', methods=['GET'])
+def export_surface_isobands(surface_id):
+    """
+    以等值带 GeoJSON 导出插值曲面。
+    可选参数: levels=等值带数量(默认10) 或 逗号分隔的分级边界，如 levels=20,40,60,80；
+    tolerance=几何简化容差(度，默认半个网格间距)。
+    """
+    from app.services import surface_export
+
+    try:
+        levels_arg = request.args.get('levels', str(surface_export.DEFAULT_ISOBAND_LEVELS))
+        levels = [float(v) for v in levels_arg.split(',')] if ',' in levels_arg else int(levels_arg)
+    except ValueError:
+        return jsonify({"status": "error", "message": "levels 参数必须是整数或逗号分隔的数字"}), 400
+    # 参数出现但格式错误时不能静默退回默认值(ETag 也会对应错误的参数)
+    tolerance = None
+    if 'tolerance' in request.args:
+        try:
+            tolerance = float(request.args['tolerance'])
+        except ValueError:
+            tolerance = math.nan
+        if not math.isfinite(tolerance) or tolerance < 0:
+            return jsonify({"status": "error", "message": "tolerance 参数必须是非负数"}), 400
+
+    etag = _export_etag(surface_id, 'isobands', levels_arg, tolerance)
+    # 曲面过期被删除后不能再用 304 确认客户端缓存有效
+    if not surface_store.exists(surface_id):
+        return jsonify({"status": "error", "message": "插值曲面不存在或已过期"}), 404
+    if etag in request.if_none_match:
+        return _export_response(b'', 'application/geo+json', etag)
+
+    surface = surface_store.load_surface(surface_id)
+    if surface is None:
+        return jsonify({"status": "error", "message": "插值曲面不存在或已过期"}), 404
+    try:
+        geojson = surface_export.export_isobands(surface, levels, tolerance)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    body = json.dumps(geojson, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return _export_response(body, 'application/geo+json', etag)
+
+
+def _parse_image_width(value):
+    """image_width 选项：整数(或整数字符串)，截断到 HEATMAP_RASTER_MIN_WIDTH~HEATMAP_RASTER_MAX_WIDTH；无效时返回 None"""
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        return None
+    return min(max(value, settings.HEATMAP_RASTER_MIN_WIDTH), settings.HEATMAP_RASTER_MAX_WIDTH)
+
+
+def _export_etag(surface_id, *params):
+    """导出结果由曲面与参数唯一确定，不必先计算就能判断客户端缓存是否有效"""
+    return hashlib.sha256(json.dumps([surface_id, *params]).encode('utf-8')).hexdigest()[:32]
+
+
+def _export_response(body, mimetype, etag):
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = settings.HEATMAP_SURFACE_TTL
+    return response.make_conditional(request)
+
+
+def _job_pending_response(job_id):
+    return jsonify({
+        "status": "pending",
+        "message": "热力图任务已提交",
+        "job_id": job_id,
+        "result_url": url_for('heatmap.get_heatmap_job', job_id=job_id),
+        "image_url": url_for('heatmap.get_heatmap_job_image', job_id=job_id)
+    }), 202
+
+
+def _image_response(job):
+    """
+    直接返回图片字节：内容哈希作为 ETag，命中 If-None-Match 时返回304。
+    任务结果由输入内容唯一确定，在保留期内不会变化，可以被客户端缓存。
+    """
+    response = Response(job['image'], mimetype=job['mimetype'])
+    response.set_etag(job['etag'])
+    response.cache_control.private = True
+    response.cache_control.max_age = settings.HEATMAP_JOB_RESULT_TTL
+    response.headers['Content-Location'] = url_for('heatmap.get_heatmap_job_image', job_id=job['job_id'])
+    # 色标对应的数值范围 "vmin,vmax"
+    response.headers['X-Value-Range'] = ','.join(str(v) for v in job['value_range'])
+    response.headers['Access-Control-Expose-Headers'] = 'ETag, Content-Location, X-Value-Range'
+    return response.make_conditional(request)
+
+
+def _surface_urls(surface_id):
+    """插值曲面的ID、瓦片URL模板与导出地址，供前端地图平移缩放时直接取瓦片或自行着色"""
+    if not surface_id:
+        return {}
+    tile_url = url_for('heatmap.get_heatmap_tile', surface_id=surface_id, z=0, x=0, y=0)
+    return {
+        "surface_id": surface_id,
+        "tile_url_template": tile_url.replace('/0/0/0.png', '/{z}/{x}/{y}.png'),
+        "grid_url": url_for('heatmap.export_surface_grid', surface_id=surface_id),
+        "isobands_url": url_for('heatmap.export_surface_isobands', surface_id=surface_id)
+    }
+
+
+def _job_response(job):
+    """把任务状态转换为接口响应"""
+    if job['status'] == 'done':
+        return jsonify({
+            "status": "success",
+            "message": "热力图生成成功",
+            "image_base64": base64.b64encode(job['image']).decode('utf-8'),
+            # 色标对应的数值范围，栅格渲染模式(不含色标条)下供前端绘制图例
+            "value_range": job['value_range'],
+            "image_url": url_for('heatmap.get_heatmap_job_image', job_id=job['job_id']),
+            **_surface_urls(job.get('surface_id'))
+        })
+    if job['status'] == 'pending':
+        return _job_pending_response(job['job_id'])
+    if job['status'] == 'failed':
+        return jsonify({"status": "error", "message": job['message']}), 500
+    return jsonify({"status": "error", "message": "任务不存在或已过期"}), 404
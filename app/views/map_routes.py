@@ -1,20 +1,31 @@
 # app/views/map_routes.py
 
-from flask import Blueprint, request, jsonify
-import pandas as pd
-import uuid
+from flask import Blueprint, request, jsonify, Response
+import numpy as np
+from app.services import ingestion, map_sessions, payload_codec, spatial_index, upload_spool
+from app.services.session_store import SessionTooLargeError, store
 
 # 创建一个名为 'map_bp' 的蓝图
 map_bp = Blueprint('map_bp', __name__, url_prefix='/map')
 
-# 【修改】将 PROCESSED_DATA 从单个变量变成一个字典
-# 它将像这样存储数据: {'session_id_1': [points...], 'session_id_2': [points...]}
-# 这就是我们的“临时内存数据库”
-PROCESSED_DATA = {}
+# 每个会话的点位以列数组的形式保存在会话存储中(各 worker 共享，超时/超出容量自动淘汰)，
+# 不再使用进程内的 PROCESSED_DATA 字典
+
+REQUIRED_COLUMNS = map_sessions.POINT_COLUMNS
+
+# 按显示范围查询时每页返回的条目数(聚合点 + 点位)
+DEFAULT_PAGE_SIZE = 2000
+MAX_PAGE_SIZE = 10000
+MAX_ZOOM = 22
 
 
 @map_bp.route('/upload', methods=['POST'])
 def upload_file():
+    """
+    上传点位文件。可选表单字段:
+    - mode: replace (默认，替换会话数据) / append (追加) / upsert (按 key 合并)
+    - key: upsert 的合并键，name (标记名称，默认) / coords (经纬度)
+    """
     # 【修改】从请求的表单中获取 session_id
     session_id = request.form.get('session_id')
     if not session_id:
@@ -29,41 +40,205 @@ def upload_file():
 
     if file:
         try:
-            df = pd.read_excel(file)
-            df_renamed = df.rename(columns={
-                '经度': 'lng', '纬度': 'lat',
-                '污染物浓度': 'concentration', '标记名称': 'name'
-            })
+            # 先流式写入暂存目录，再从磁盘逐批解析，不把整个文件读入内存
+            upload_id = upload_spool.save(file.stream)
+        except upload_spool.UploadTooLargeError:
+            return jsonify({'success': False, 'message': '文件过大'}), 413
+        return _ingest_upload(upload_id, session_id, request.form, file.filename)
 
-            required_columns = ['lng', 'lat', 'concentration', 'name']
-            if not all(col in df_renamed.columns for col in required_columns):
-                missing = [col for col in required_columns if col not in df_renamed.columns]
-                return jsonify({'success': False, 'message': f'Excel文件中缺少必要的列: {", ".join(missing)}'}), 400
-
-            # 【修改】将数据存入以 session_id 为键的字典中
-            PROCESSED_DATA[session_id] = df_renamed.to_dict('records')
+    return jsonify({'success': False, 'message': '未知错误'}), 500
 
-            return jsonify({'success': True, 'message': f'文件 "{file.filename}" 已为会话 {session_id} 处理成功!'})
-        except Exception as e:
-            return jsonify({'success': False, 'message': f'文件解析失败: {str(e)}'}), 500
 
-    return jsonify({'success': False, 'message': '未知错误'}), 500
+@map_bp.route('/upload/chunked', methods=['POST'])
+def start_chunked_upload():
+    """
+    开始分块上传，返回 upload_id。之后:
+    - PUT /map/upload/chunked/<upload_id>?offset=N，请求体为从第 N 字节开始的一块原始数据
+    - GET /map/upload/chunked/<upload_id> 查询已接收的字节数(中断后从该位置续传)
+    - POST /map/upload/chunked/<upload_id>/complete，表单字段同 /map/upload(session_id、mode、key)
+    """
+    upload_id = upload_spool.create()
+    return jsonify({'success': True, 'upload_id': upload_id, 'offset': 0})
+
+
+@map_bp.route('/upload/chunked/<string:upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    offset = upload_spool.received(upload_id)
+    if offset is None:
+        return jsonify({'success': False, 'message': '上传不存在或已过期'}), 404
+    return jsonify({'success': True, 'upload_id': upload_id, 'offset': offset})
+
+
+@map_bp.route('/upload/chunked/<string:upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'message': '缺少 offset 参数'}), 400
+    try:
+        received = upload_spool.append(upload_id, offset, request.stream)
+    except FileNotFoundError:
+        return jsonify({'success': False, 'message': '上传不存在或已过期'}), 404
+    except upload_spool.OffsetMismatchError as e:
+        return jsonify({'success': False, 'message': str(e), 'offset': e.received}), 409
+    except upload_spool.UploadTooLargeError:
+        return jsonify({'success': False, 'message': '文件过大'}), 413
+    return jsonify({'success': True, 'upload_id': upload_id, 'offset': received})
+
+
+@map_bp.route('/upload/chunked/<string:upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    form = request.form if request.form else (request.get_json(silent=True) or {})
+    session_id = form.get('session_id')
+    if not session_id:
+        return jsonify({'success': False, 'message': '缺少 session_id'}), 400
+    if upload_spool.received(upload_id) is None:
+        return jsonify({'success': False, 'message': '上传不存在或已过期'}), 404
+    return _ingest_upload(upload_id, session_id, form, form.get('filename', upload_id))
+
+
+def _ingest_upload(upload_id, session_id, form, filename):
+    """解析暂存的上传文件并写入会话(替换/追加/合并)，完成后删除暂存文件"""
+    mode = form.get('mode', 'replace')
+    key = form.get('key', 'name')
+    if mode not in map_sessions.MERGE_MODES or key not in map_sessions.UPSERT_KEYS:
+        upload_spool.discard(upload_id)
+        return jsonify({'success': False, 'message': f'mode 必须是 {"/".join(map_sessions.MERGE_MODES)}，'
+                                                     f'key 必须是 {"/".join(map_sessions.UPSERT_KEYS)}'}), 400
+    try:
+        # 与热力图共用的读取层：支持 Excel/CSV/Parquet/Arrow，相同文件只解析一次
+        columns = ingestion.load_columns(upload_spool.spool_path(upload_id), required=REQUIRED_COLUMNS)
+        stats = map_sessions.save(session_id, columns, mode, key)
+        return jsonify({'success': True, 'message': f'文件 "{filename}" 已为会话 {session_id} 处理成功!', **stats})
+    except ingestion.MissingColumnsError as e:
+        return jsonify({'success': False, 'message': f'文件中缺少必要的列: {", ".join(e.missing)}'}), 400
+    except SessionTooLargeError:
+        return jsonify({'success': False, 'message': '会话数据过大，超过存储上限'}), 413
+    except TimeoutError as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'文件解析失败: {str(e)}'}), 500
+    finally:
+        upload_spool.discard(upload_id)
 
 
 @map_bp.route('/get-data', methods=['GET'])
 def get_data():
+    """
+    获取会话的点位数据。不带查询参数时返回全部点位。
+    可选参数(任一出现即按显示范围分页返回):
+    - bbox=最小经度,最小纬度,最大经度,最大纬度: 只返回范围内的点位
+    - zoom=地图缩放级别: 低于 spatial_index.CLUSTER_MAX_ZOOM 时把相邻点位聚合为 clusters(带浓度统计)
+    - limit / cursor: 分页，cursor 取上一页返回的 next_cursor
+    响应带 ETag(数据未变化时返回304)，并按 Accept-Encoding 返回 gzip/br 压缩的内容。
+    """
     # 【修改】从请求的URL参数中获取 session_id
     session_id = request.args.get('session_id')
     if not session_id:
         return jsonify({'success': False, 'message': '缺少 session_id'}), 400
 
-    # 【修改】从字典中根据 session_id 获取对应的数据
-    user_data = PROCESSED_DATA.get(session_id)
-
-    if user_data is not None:
-        data_with_id = [dict(p, id=i) for i, p in enumerate(user_data)]
-        return jsonify({'success': True, 'points': data_with_id})
-    else:
+    viewport = any(name in request.args for name in ('bbox', 'zoom', 'limit', 'cursor'))
+    try:
+        bbox, zoom, limit, offset = _parse_viewport_args(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    session_etag = store.get_etag(session_id)
+    if session_etag is not None:
+        etag = _response_etag(session_etag, viewport)
+        if etag in request.if_none_match:
+            return _payload_response(b'', 'identity', etag)
+        if not viewport:
+            return _session_payload_response(session_id)
+
+    # 从会话存储中根据 session_id 获取对应的数据；ETag 与数据在同一次读取中取出，
+    # 期间有新的上传时也不会把新数据和旧 ETag 配在一起
+    entry = store.get_with_etag(session_id)
+    columns, session_etag = entry if entry is not None else (None, None)
+
+    if columns is None:
         # 如果这个session_id没有对应的数据，返回空列表
+        if viewport:
+            return jsonify({'success': True, 'points': [], 'clusters': [], 'total': 0, 'next_cursor': None})
+        return jsonify({'success': True, 'points': []})
+
+    if not viewport:
+        return jsonify({'success': True, 'points': map_sessions.point_records(columns, np.argsort(columns['id']))})
+
+    positions = spatial_index.query_bbox(columns, bbox) if bbox else np.argsort(columns['id'])
+    clusters = []
+    if zoom is not None and zoom < spatial_index.CLUSTER_MAX_ZOOM:
+        clusters, positions = spatial_index.cluster(columns, positions, zoom)
+
+    # 聚合点在前、点位在后，按 offset/limit 切出当前页
+    total = len(clusters) + len(positions)
+    end = offset + limit
+    page_points = positions[max(offset - len(clusters), 0):max(end - len(clusters), 0)]
+    result = {
+        'success': True,
+        'points': map_sessions.point_records(columns, page_points),
+        'clusters': clusters[offset:end],
+        'total': total,
+        'next_cursor': str(end) if end < total else None
+    }
+    if session_etag is None:
+        return jsonify(result)
+    data = payload_codec.encode_json(result)
+    encoding = 'identity'
+    if len(data) >= payload_codec.MIN_COMPRESS_BYTES:
+        encoding = payload_codec.choose_encoding(request.accept_encodings, payload_codec.available_encodings())
+    return _payload_response(payload_codec.compress(data, encoding), encoding, _response_etag(session_etag, viewport))
+
+
+def _response_etag(session_etag, viewport):
+    # 显示范围查询的结果由会话数据和查询参数唯一确定
+    if not viewport:
+        return session_etag
+    return payload_codec.content_etag(
+        f"{session_etag}?{request.query_string.decode('utf-8', 'replace')}".encode('utf-8'))
+
+
+def _session_payload_response(session_id):
+    """返回上传时预先序列化、压缩好的完整点位列表(ETag 取自与内容同一次读取的会话记录)"""
+    encoding = payload_codec.choose_encoding(request.accept_encodings, payload_codec.available_encodings())
+    entry = store.get_payload(session_id, encoding)
+    if entry is None:
+        # 内容过小未压缩
+        encoding, entry = 'identity', store.get_payload(session_id, 'identity')
+    if entry is None:
         return jsonify({'success': True, 'points': []})
+    data, etag = entry
+    return _payload_response(data, encoding, etag)
+
 
+def _payload_response(data, encoding, etag):
+    response = Response(data, mimetype='application/json')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    # 可以缓存，但每次使用前都要向服务器验证(上传新文件后立即生效)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def _parse_viewport_args(args):
+    """解析 bbox/zoom/limit/cursor 参数，格式错误时抛出 ValueError"""
+    bbox = None
+    if args.get('bbox'):
+        try:
+            bbox = tuple(float(v) for v in args['bbox'].split(','))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            raise ValueError('bbox 参数格式应为: 最小经度,最小纬度,最大经度,最大纬度')
+
+    zoom = args.get('zoom', type=int)
+    if 'zoom' in args and (zoom is None or not 0 <= zoom <= MAX_ZOOM):
+        raise ValueError(f'zoom 参数必须是 0~{MAX_ZOOM} 的整数')
+
+    # 参数出现但不是整数时 args.get 返回 None，不能静默退回默认值
+    limit = args.get('limit', type=int) if 'limit' in args else DEFAULT_PAGE_SIZE
+    offset = args.get('cursor', type=int) if 'cursor' in args else 0
+    if limit is None or offset is None or not 1 <= limit <= MAX_PAGE_SIZE or offset < 0:
+        raise ValueError(f'limit 必须是 1~{MAX_PAGE_SIZE} 的整数，cursor 必须是上一页返回的 next_cursor')
+    return bbox, zoom, limit, offset
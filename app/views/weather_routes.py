@@ -1,6 +1,8 @@
 # --- 关键修改：补全所有必需的 import ---
 from flask import Blueprint, jsonify, request, Response, current_app
 from flask_cors import CORS
+import datetime
+import orjson
 import requests
 from app.config import settings
 # ------------------------------------
@@ -13,27 +15,87 @@ weather_bp = Blueprint('weather_bp', __name__, url_prefix='/api/weather')
 CORS(weather_bp) 
 
 # 2. 在蓝图上定义路由
+BUNDLE_VIEWS = ('full', 'compact')
+
+
+def _parse_fields(value: str | None) -> list | None:
+    """?fields=current.main.temp,forecast.list.dt -> ['current.main.temp', 'forecast.list.dt']"""
+    if not value:
+        return None
+    return [field.strip() for field in value.split(',') if field.strip()] or None
+
+
 @weather_bp.route("/realtime/<string:city_name>", methods=['GET'])
 def get_realtime_weather(city_name):
     """
     获取指定城市的实时天气、5天预报和空气质量的聚合数据。
+    ?view=compact 返回精简视图(当前天气摘要与按天汇总的预报)；?fields= 只返回指定字段(逗号分隔的路径)。
     """
     if not city_name:
         return jsonify({"error": "未提供城市名称"}), 400
+    view = request.args.get('view', 'full')
+    if view not in BUNDLE_VIEWS:
+        return jsonify({"error": f"view 参数只能是 {', '.join(BUNDLE_VIEWS)}"}), 400
+    fields = _parse_fields(request.args.get('fields'))
+
+    if view == 'compact':
+        payload = weather_service.get_compact_weather(city_name)
+        if payload is None:
+            return jsonify({"error": f"找不到城市 '{city_name}' 的天气数据"}), 404
+        if fields is None:
+            # 精简视图已预先序列化，直接返回
+            return Response(payload, mimetype='application/json')
+        return jsonify(weather_service.project_fields(orjson.loads(payload), fields))
 
     data_bundle = weather_service.get_realtime_weather_bundle(city_name)
 
     if not data_bundle:
         return jsonify({"error": f"找不到城市 '{city_name}' 的天气数据"}), 404
 
+    if fields is not None:
+        return jsonify(weather_service.project_fields(data_bundle, fields))
     return jsonify(data_bundle)
 
 
+@weather_bp.route("/batch", methods=['GET', 'POST'])
+def get_batch_weather():
+    """
+    一次获取多个城市的实时天气。
+    GET ?cities=太原,大同&view=compact&fields=current.temp
+    POST {"cities": ["太原", "大同"], "view": "compact", "fields": ["current.temp"]}
+    返回 {"results": [{"city", "status", "data"}, ...]}，顺序与请求一致。
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        cities, view, fields = body.get('cities'), body.get('view', 'full'), body.get('fields')
+        if isinstance(fields, str):
+            fields = _parse_fields(fields)
+    else:
+        cities = _parse_fields(request.args.get('cities'))
+        view, fields = request.args.get('view', 'full'), _parse_fields(request.args.get('fields'))
+
+    if not cities or not isinstance(cities, list) or not all(isinstance(c, str) and c.strip() for c in cities):
+        return jsonify({"error": "请提供城市列表 cities"}), 400
+    if len(cities) > settings.WEATHER_BATCH_MAX_CITIES:
+        return jsonify({"error": f"一次最多查询 {settings.WEATHER_BATCH_MAX_CITIES} 个城市"}), 400
+    if view not in BUNDLE_VIEWS:
+        return jsonify({"error": f"view 参数只能是 {', '.join(BUNDLE_VIEWS)}"}), 400
+    if fields is not None and (not isinstance(fields, list) or not all(isinstance(f, str) for f in fields)):
+        return jsonify({"error": "fields 参数格式错误"}), 400
+
+    results = weather_service.get_weather_batch([c.strip() for c in cities], view, fields or None)
+    return jsonify({"results": results})
+
+
 @weather_bp.route("/history/<string:city_name>", methods=['GET'])
 def get_history_weather(city_name):
     """
     获取指定城市的历史天气。
+    ?date=YYYY-MM-DD 返回一天的数据；?start=YYYY-MM-DD&end=YYYY-MM-DD 返回日期范围(含两端)内合并后的数据。
     """
+    if 'start' in request.args or 'end' in request.args:
+        return _get_history_range(city_name)
+
     date_str = request.args.get('date')
     if not date_str:
         return jsonify({"error": "缺少'date'参数, 请使用 ?date=YYYY-MM-DD 格式提供"}), 400
@@ -45,6 +107,25 @@ def get_history_weather(city_name):
     return jsonify(data)
 
 
+def _get_history_range(city_name):
+    try:
+        start = datetime.date.fromisoformat(request.args.get('start', ''))
+        end = datetime.date.fromisoformat(request.args.get('end', ''))
+    except ValueError:
+        return jsonify({"error": "start 与 end 参数请使用 YYYY-MM-DD 格式提供"}), 400
+    if start > end:
+        return jsonify({"error": "start 不能晚于 end"}), 400
+    if end > datetime.date.today():
+        return jsonify({"error": "end 不能晚于今天"}), 400
+    if (end - start).days + 1 > settings.WEATHER_HISTORY_MAX_DAYS:
+        return jsonify({"error": f"日期范围不能超过 {settings.WEATHER_HISTORY_MAX_DAYS} 天"}), 400
+
+    data = weather_service.get_historical_range(city_name, start, end)
+    if data is None:
+        return jsonify({"error": f"找不到城市 '{city_name}' 的历史数据"}), 404
+    return jsonify(data)
+
+
 @weather_bp.route("/trends/<string:city_name>", methods=['GET'])
 def get_trends_weather(city_name):
     """
@@ -75,26 +156,13 @@ def get_map_tile_proxy(op, z, x, y):
     if op not in valid_ops:
         return jsonify({"error": "Invalid layer code"}), 400
 
-    tile_url = f"https://maps.openweathermap.org/maps/2.0/weather/{op}/{z}/{x}/{y}"
-    params = {'appid': settings.API_KEY}
-
     try:
-        # 使用 timeout，并恢复为更可靠的非流式请求
-        res = requests.get(tile_url, params=params, timeout=(3, 10))
-        res.raise_for_status()
-        
-        # *** 关键修改：修正了 Response 的创建方式 ***
-        # 直接使用 res.content 返回完整的图片数据
-        response = Response(res.content, content_type=res.headers['Content-Type'])
-        
-        # 透传缓存头
-        if 'Cache-Control' in res.headers:
-            response.headers['Cache-Control'] = res.headers['Cache-Control']
-        
-        return response
+        # 命中缓存时直接返回；否则边从上游读取边返回，并写入缓存
+        body, headers = weather_service.get_map_tile(op, z, x, y)
+        return Response(body, headers=headers)
 
     except requests.exceptions.Timeout:
-        current_app.logger.error(f"Timeout fetching tile: {tile_url}")
+        current_app.logger.error(f"Timeout fetching tile: {op}/{z}/{x}/{y}")
         return jsonify({"error": "Upstream service timeout"}), 504
     except requests.exceptions.RequestException as e:
         current_app.logger.error(f"Tile proxy failed: {str(e)}")
@@ -0,0 +1,37 @@
+# gunicorn 配置: gunicorn -c gunicorn.conf.py run:app
+# GUNICORN_PRELOAD=1(默认) 时应用在 master 中加载并预热，worker 通过 fork 共享已导入的模块与数据；
+# 设为 0 时每个 worker 各自加载应用(便于对比启动耗时与内存)。
+import os
+import time
+
+_started = time.time()
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+if preload_app:
+    # 应用在 master 中导入，gevent 需要在此之前替换标准库，fork 出的 worker 才会使用协作式的 socket/ssl/threading
+    from gevent import monkey
+
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+worker_class = "gevent"
+
+
+def when_ready(server):
+    from app.services import warmup
+
+    if preload_app:
+        cities = warmup.warm_heatmap_stack()
+        server.log.info(f"[startup] 已预热热力图模块与城市数据: {', '.join(cities)}")
+    server.log.info(warmup.startup_report('master', _started))
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.time()
+
+
+def post_worker_init(worker):
+    from app.services import warmup
+
+    worker.log.info(warmup.startup_report('worker', worker.forked_at))
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+# 测试使用独立的临时目录存放缓存、会话与暂存文件；必须在导入 app.config 之前设置
+_TMP = tempfile.mkdtemp(prefix='app-tests-')
+for name, value in {
+    'WEATHER_CACHE_PATH': os.path.join(_TMP, 'weather-cache.sqlite3'),
+    'WEATHER_HISTORY_PATH': os.path.join(_TMP, 'weather-history.sqlite3'),
+    'GEOCODE_INDEX_PATH': os.path.join(_TMP, 'geocode-index.sqlite3'),
+    'TILE_CACHE_DIR': os.path.join(_TMP, 'weather-tiles'),
+    'HEATMAP_GRID_CACHE_DIR': os.path.join(_TMP, 'heatmap-grids'),
+    'HEATMAP_JOB_DIR': os.path.join(_TMP, 'heatmap-jobs'),
+    'HEATMAP_SURFACE_DIR': os.path.join(_TMP, 'heatmap-surfaces'),
+    'UPLOAD_PARSE_CACHE_DIR': os.path.join(_TMP, 'upload-parse-cache'),
+    'SESSION_STORE_PATH': os.path.join(_TMP, 'map-sessions.sqlite3'),
+    'UPLOAD_SPOOL_DIR': os.path.join(_TMP, 'map-uploads'),
+    'WEATHER_PREFETCH_TOP_N': '0',
+}.items():
+    os.environ[name] = value
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,76 @@
+import io
+import json
+import os
+
+import pytest
+
+from app import create_app
+from app.config import settings
+from app.services.carbon_estimator import CarbonEstimator
+
+
+@pytest.fixture
+def client():
+    return create_app().test_client()
+
+
+def _spooled_files():
+    if not os.path.isdir(settings.UPLOAD_SPOOL_DIR):
+        return []
+    return [name for name in os.listdir(settings.UPLOAD_SPOOL_DIR) if name.endswith('.part')]
+
+
+RECORDS = [
+    {'name': 'A', 'gas': 1, 'diesel': '2', 'consumption_kwh': 1000, 'region': 'North'},
+    {'name': 'B', 'fuel_data': {'coal': 'abc', 'gasoline': 3},
+     'electricity_data': {'consumption_kwh': 500, 'region': 'Mars'}},
+    {'name': 'C', 'coal': -1, 'consumption_kwh': 10},
+]
+
+
+def test_batch_matches_single_estimation(client):
+    response = client.post('/api/estimate/batch', json=RECORDS)
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 3
+    estimator = CarbonEstimator()
+    assert rows[0]['total_emissions'] == estimator.estimate_total_emissions(
+        {'gas': 1, 'diesel': '2'}, {'consumption_kwh': 1000, 'region': 'North'})['total_emissions']
+    assert rows[0]['valid'] and rows[0]['flags'] == []
+    assert rows[1]['flags'] == ['invalid_coal', 'unknown_region']
+    assert rows[2]['flags'] == ['negative_coal', 'missing_region']
+    assert [row['row'] for row in rows] == [0, 1, 2]
+
+
+def test_csv_upload_streams_csv_and_removes_spool_file(client):
+    body = '企业名称,煤炭,用电量,电网区域\nE1,2,1000,North\nE2,,,\n'.encode('gbk')
+    response = client.post('/api/estimate/batch?format=csv', data={'file': (io.BytesIO(body), 'inv.csv')})
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == 'row,name,total_emissions,scope1_emissions,scope2_emissions,valid,flags'
+    assert len(lines) == 3
+    response.close()
+    assert _spooled_files() == []
+
+
+def test_header_only_csv_is_rejected(client):
+    for fmt in ('csv', 'ndjson'):
+        data = {'file': (io.BytesIO(b'name,coal,consumption_kwh\n'), 'inv.csv')}
+        response = client.post(f'/api/estimate/batch?format={fmt}', data=data)
+        assert response.status_code == 400
+    assert _spooled_files() == []
+
+
+def test_spool_file_removed_when_response_is_never_read(client):
+    data = {'file': (io.BytesIO(b'name,coal\nA,1\n'), 'inv.csv')}
+    response = client.post('/api/estimate/batch', data=data, buffered=False)
+    assert response.status_code == 200
+    assert _spooled_files()
+    response.close()  # 客户端未读取任何内容即断开
+    assert _spooled_files() == []
+
+
+def test_invalid_requests(client):
+    assert client.post('/api/estimate/batch', json={'a': 1}).status_code == 400
+    assert client.post('/api/estimate/batch', json=[]).status_code == 400
+    assert client.post('/api/estimate/batch?format=xml', json=RECORDS).status_code == 400
@@ -0,0 +1,21 @@
+from app.services import geocoding
+
+
+def test_seeded_aliases_share_one_key():
+    keys = {geocoding.city_key(name) for name in
+            ('Taiyuan', 'taiyuan', ' Tai Yuan ', 'TAIYUAN,CN', '太原', '太原市', 'Taiyuan City', 'taiyuanshi')}
+    assert keys == {'太原'}
+    assert geocoding.lookup('Taiyuan City') == geocoding.lookup('太原')
+
+
+def test_distinct_cities_map_to_distinct_keys():
+    pairs = [('Mexico City', 'Mexico'), ('Quebec City', 'Quebec'), ('Kansas City', 'Kansas'), ('Jinshi', 'Jin')]
+    for a, b in pairs:
+        assert geocoding.city_key(a) != geocoding.city_key(b)
+
+
+def test_added_coordinates_do_not_leak_to_similar_names():
+    geocoding.add('Mexico City', {'lat': 19.43, 'lon': -99.13})
+    geocoding._memory.clear()  # 从共享索引读取
+    assert geocoding.lookup('mexico city') == {'lat': 19.43, 'lon': -99.13}
+    assert geocoding.lookup('Mexico') is None
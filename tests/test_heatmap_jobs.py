@@ -0,0 +1,19 @@
+import pytest
+
+from app.services import heatmap_jobs
+
+
+class _ClosedPool:
+    def submit(self, *args):
+        raise RuntimeError('cannot schedule new futures after shutdown')
+
+
+def test_failed_submit_does_not_leave_a_pending_marker(monkeypatch):
+    monkeypatch.setattr(heatmap_jobs, '_get_executor', lambda: _ClosedPool())
+    options = {'render_mode': 'raster'}
+    with pytest.raises(RuntimeError):
+        heatmap_jobs.submit(b'points', options)
+
+    job_id = heatmap_jobs.job_id_for(b'points', options)
+    assert heatmap_jobs.get_status(job_id) == {'status': 'unknown'}
+    assert job_id not in heatmap_jobs._inflight
@@ -0,0 +1,69 @@
+import io
+import json
+
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from app import create_app
+from app.config import settings
+from app.services import geodata_registry, heatmap_jobs, heatmap_service
+
+
+@pytest.fixture
+def test_city(tmp_path, monkeypatch):
+    # 边界文件的第二个要素(如周边区域)远在裁剪多边形之外
+    city = tmp_path / 'testcity'
+    city.mkdir()
+    gpd.GeoDataFrame(geometry=[shapely.box(112.0, 37.0, 113.0, 38.0), shapely.box(118.0, 40.0, 119.0, 41.0)],
+                     crs='EPSG:4326').to_file(city / 'boundary.geojson', driver='GeoJSON')
+    monkeypatch.setattr(geodata_registry, 'PROVINCE_DATA_PATH', str(tmp_path))
+    return 'testcity'
+
+
+def test_grid_extent_covers_only_the_clip_polygon(test_city):
+    rng = np.random.default_rng(0)
+    points = np.column_stack([rng.uniform(112, 113, 30), rng.uniform(37, 38, 30)])
+    values = rng.uniform(0, 100, 30)
+    grid_z, bounds, _ = heatmap_service.compute_grid(
+        points, values, {'city': 'testcity', 'interpolation_method': 'idw', 'grid_resolution': 40})
+
+    assert bounds == (112.0, 37.0, 113.0, 38.0)
+    assert grid_z.shape == (40, 40) and np.isfinite(grid_z).any()
+
+
+@pytest.mark.parametrize('constant', [False, True])
+def test_figure_and_raster_modes_report_the_same_value_range(test_city, constant):
+    rng = np.random.default_rng(1)
+    points = np.column_stack([rng.uniform(112, 113, 30), rng.uniform(37, 38, 30)])
+    values = np.full(30, 53.57) if constant else rng.uniform(0, 100, 30)
+    options = {'city': test_city, 'interpolation_method': 'idw', 'grid_resolution': 40,
+               'extent': {'xmin': 112.2, 'xmax': 112.6, 'ymin': 37.2, 'ymax': 37.6}}
+    raster = heatmap_service._render_raster(points, values, {**options, 'image_width': 200})
+    figure = heatmap_service._render_figure(points, values, options)
+    assert raster['value_range'] == figure['value_range']
+    if constant:
+        assert raster['value_range'] == pytest.approx((53.57, 53.57))
+    # 按整个曲面(裁剪范围内)计算，不随显示范围变化
+    whole = heatmap_service._render_raster(points, values, {**options, 'extent': None, 'image_width': 200})
+    assert whole['value_range'] == raster['value_range']
+
+
+def test_invalid_image_width_is_rejected_before_a_job_is_submitted(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(heatmap_jobs, 'submit', lambda file_bytes, options: submitted.append(options) or 'a' * 64)
+    client = create_app().test_client()
+
+    def generate(width):
+        return client.post('/api/heatmap/generate', data={
+            'excelFile': (io.BytesIO(b'x'), 'p.csv'), 'async': 'true',
+            'options': json.dumps({'render_mode': 'raster', 'image_width': width})})
+
+    for width in ('abc', -5, 0, 1.5, True, None):
+        assert generate(width).status_code == 400
+    assert submitted == []
+
+    assert generate(10 ** 9).status_code == 202
+    assert generate('800').status_code == 202
+    assert [options['image_width'] for options in submitted] == [settings.HEATMAP_RASTER_MAX_WIDTH, 800]
@@ -0,0 +1,81 @@
+from concurrent.futures import Future
+
+import numpy as np
+import shapely
+
+from app import create_app
+from app.services import geodata_registry, heatmap_jobs, heatmap_tiles, surface_store
+
+SURFACE_ID = 'a' * 64
+BOUNDS = (112.0, 37.0, 113.0, 38.0)
+
+
+def _save_surface():
+    rng = np.random.default_rng(0)
+    points = np.column_stack([rng.uniform(112, 113, 50), rng.uniform(37, 38, 50)])
+    values = rng.uniform(0, 100, 50)
+    grid_z = np.linspace(0, 100, 50 * 50).reshape(50, 50)
+    surface_store.save_surface(SURFACE_ID, grid_z, BOUNDS, points, values, 'taiyuan', 'idw')
+
+
+def _fake_boundary(monkeypatch):
+    monkeypatch.setattr(geodata_registry, 'get_clip_geometry', lambda city: shapely.box(*BOUNDS))
+    monkeypatch.setattr(geodata_registry, 'boundary_contains', lambda city, xs, ys: np.ones(
+        (len(xs), len(ys)), dtype=bool))
+
+
+def test_refinement_runs_in_pool_and_coarse_tile_is_not_cached(monkeypatch):
+    _save_surface()
+    _fake_boundary(monkeypatch)
+    submitted = []
+
+    def fake_submit(key, fn, *args):
+        assert fn is heatmap_tiles.refine_tile
+        submitted.append(Future())
+        return submitted[-1]
+
+    monkeypatch.setattr(heatmap_jobs, 'submit_task', fake_submit)
+    z, x, y = 14, 13312, 6348  # 瓦片宽度远小于基础网格间距的 REFINE_NODES 倍，需要细化
+    client = create_app().test_client()
+
+    coarse = client.get(f'/api/heatmap/tiles/{SURFACE_ID}/{z}/{x}/{y}.png')
+    assert coarse.status_code == 200 and coarse.cache_control.no_cache
+    assert len(submitted) == 1
+
+    # 细化完成前的粗略瓦片不进入缓存，请求会再次提交(由进程池按 key 去重)
+    client.get(f'/api/heatmap/tiles/{SURFACE_ID}/{z}/{x}/{y}.png')
+    assert len(submitted) == 2
+
+    lon_min, lat_min, lon_max, lat_max = heatmap_tiles.tile_bounds(z, x, y)
+    node_bounds = (lon_min, lat_min, lon_max, lat_max)
+    for future in submitted:
+        future.set_result((np.full((heatmap_tiles.REFINE_NODES,) * 2, 42.0), node_bounds))
+
+    refined = client.get(f'/api/heatmap/tiles/{SURFACE_ID}/{z}/{x}/{y}.png')
+    assert refined.status_code == 200 and refined.cache_control.max_age
+    assert refined.data != coarse.data
+    assert len(submitted) == 2
+
+
+def test_export_revalidation_of_a_missing_surface_returns_404():
+    _save_surface()
+    client = create_app().test_client()
+    url = f'/api/heatmap/surfaces/{SURFACE_ID}/grid'
+    etag = client.get(url).headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    missing = 'b' * 64
+    missing_etag = client.get(f'/api/heatmap/surfaces/{missing}/grid').headers.get('ETag')
+    assert missing_etag is None
+    for path in ('grid', 'isobands'):
+        response = client.get(f'/api/heatmap/surfaces/{missing}/{path}', headers={'If-None-Match': '*'})
+        assert response.status_code == 404
+
+
+def test_malformed_isoband_tolerance_is_rejected():
+    _save_surface()
+    client = create_app().test_client()
+    url = f'/api/heatmap/surfaces/{SURFACE_ID}/isobands'
+    for tolerance in ('abc', '', '-0.01', 'nan', 'inf'):
+        assert client.get(f'{url}?tolerance={tolerance}').status_code == 400
+    assert client.get(f'{url}?tolerance=0.001').status_code == 200
@@ -0,0 +1,34 @@
+import io
+
+import numpy as np
+import pytest
+from cachetools import LRUCache
+
+from app.services import ingestion
+
+
+def _csv(rows):
+    return ('经度,纬度,污染物浓度,标记名称\n'
+            + ''.join(f'112.{i % 1000:03d},37.{i % 997:03d},{i % 300},监测点{i}\n' for i in range(rows))).encode('utf-8')
+
+
+@pytest.fixture
+def small_memory_cache(monkeypatch):
+    cache = LRUCache(maxsize=1024 * 1024, getsizeof=ingestion._memory_cache.getsizeof)
+    monkeypatch.setattr(ingestion, '_memory_cache', cache)
+    return cache
+
+
+def test_parse_result_larger_than_memory_budget_is_kept_on_disk_only(small_memory_cache):
+    data = _csv(60000)
+    for _ in range(2):  # 第二次从磁盘层读取
+        columns = ingestion.load_columns(io.BytesIO(data))
+        assert len(columns['lng']) == 60000 and columns['name'][-1] == '监测点59999'
+    assert len(small_memory_cache) == 0
+
+
+def test_small_parse_result_is_cached_in_memory(small_memory_cache):
+    columns = ingestion.load_columns(_csv(10))
+    assert ingestion.load_columns(_csv(10)) is not None and len(small_memory_cache) == 1
+    assert not columns['concentration'].flags.writeable
+    np.testing.assert_array_equal(columns['concentration'], np.arange(10))
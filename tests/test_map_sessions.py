@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from app.services import map_sessions
+from app.services.session_store import store
+
+
+def _columns(rows):
+    lng, lat, concentration, name = zip(*rows)
+    return {'lng': np.array(lng, dtype=np.float64), 'lat': np.array(lat, dtype=np.float64),
+            'concentration': np.array(concentration, dtype=np.float64), 'name': np.array(name)}
+
+
+def _points(session_id):
+    columns = store.get(session_id)
+    return {p['name']: p for p in map_sessions.point_records(columns, np.argsort(columns['id']))}
+
+
+def test_upsert_by_name_updates_values_and_keeps_ids():
+    map_sessions.save('upsert', _columns([(112.1, 37.1, 10, 'A'), (112.2, 37.2, 20, 'B')]))
+    ids = {name: p['id'] for name, p in _points('upsert').items()}
+
+    result = map_sessions.save('upsert', _columns([(112.2, 37.2, 25, 'B'), (112.3, 37.3, 30, 'C'),
+                                                   (112.3, 37.3, 35, 'C')]), mode='upsert')
+    assert result == {'total': 3, 'added': 1, 'updated': 1}
+    points = _points('upsert')
+    assert points['B']['concentration'] == 25 and points['B']['id'] == ids['B']
+    # 同一批数据中重复的键以最后一行为准
+    assert points['C']['concentration'] == 35 and points['C']['id'] == max(ids.values()) + 1
+    assert points['A'] == {'lng': 112.1, 'lat': 37.1, 'concentration': 10, 'name': 'A', 'id': ids['A']}
+
+
+def test_upsert_by_coords_and_append():
+    map_sessions.save('coords', _columns([(112.1, 37.1, 10, 'A')]))
+    result = map_sessions.save('coords', _columns([(112.1000001, 37.1, 15, 'A2')]), mode='upsert', key='coords')
+    assert result == {'total': 1, 'added': 0, 'updated': 1}
+    assert _points('coords')['A2']['concentration'] == 15
+
+    result = map_sessions.save('coords', _columns([(112.1, 37.1, 20, 'A2')]), mode='append')
+    assert result == {'total': 2, 'added': 1, 'updated': 0}
+    assert sorted(p['id'] for p in map_sessions.point_records(store.get('coords'), slice(None))) == [0, 1]
+
+
+def test_merge_into_missing_session_and_empty_upload():
+    assert map_sessions.save('fresh', _columns([(112.1, 37.1, 10, 'A')]), mode='upsert')['added'] == 1
+    empty = {'lng': np.zeros(0), 'lat': np.zeros(0), 'concentration': np.zeros(0), 'name': np.zeros(0, dtype=str)}
+    assert map_sessions.save('fresh', empty, mode='upsert') == {'total': 1, 'added': 0, 'updated': 0}
+    assert map_sessions.save('fresh', empty) == {'total': 0, 'added': 0, 'updated': 0}
+
+
+def test_unknown_mode_or_key_is_rejected():
+    with pytest.raises(ValueError):
+        map_sessions.save('bad', _columns([(112.1, 37.1, 10, 'A')]), mode='merge')
+    with pytest.raises(ValueError):
+        map_sessions.save('bad', _columns([(112.1, 37.1, 10, 'A')]), mode='upsert', key='id')
@@ -0,0 +1,95 @@
+import io
+
+import numpy as np
+import pytest
+
+from app import create_app
+from app.services import payload_codec, session_store
+from app.services.session_store import MemorySessionStore, SessionTooLargeError, SQLiteSessionStore
+
+
+def _columns(n):
+    return {'lng': np.linspace(112, 113, n), 'lat': np.linspace(37, 38, n),
+            'concentration': np.arange(n, dtype=np.float64), 'name': np.array([f'P{i}' for i in range(n)])}
+
+
+def _stores(tmp_path, max_bytes):
+    return [MemorySessionStore(max_bytes, ttl=3600),
+            SQLiteSessionStore(str(tmp_path / 'sessions.sqlite3'), max_bytes, ttl=3600)]
+
+
+def test_roundtrip_with_payload_and_etag(tmp_path):
+    for store in _stores(tmp_path, 10 ** 7):
+        store.put('s', _columns(10), {'identity': b'{}', 'gzip': b'gz'}, 'etag-1')
+        columns = store.get('s')
+        assert columns['name'][3] == 'P3'
+        assert not columns['lng'].flags.writeable
+        assert store.get_etag('s') == 'etag-1'
+        assert store.get_payload('s', 'gzip') == (b'gz', 'etag-1')
+        assert store.get_with_etag('s')[1] == 'etag-1'
+        store.delete('s')
+        assert store.get('s') is None and store.get_payload('s', 'gzip') is None
+        assert store.get_with_etag('s') is None
+
+
+def test_oversized_session_is_rejected_without_touching_existing_data(tmp_path):
+    for store in _stores(tmp_path, 4096):
+        store.put('s', _columns(5), etag='old')
+        with pytest.raises(SessionTooLargeError):
+            store.put('s', _columns(5000), etag='new')
+        assert store.get_etag('s') == 'old'
+
+
+def test_eviction_keeps_the_session_just_written(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.sqlite3'), 0, ttl=3600)
+    store.max_bytes = 10 ** 6
+    for i in range(3):
+        store.put(f's{i}', _columns(1000))
+    # 上限只够保存最近写入的会话
+    store.max_bytes = len(session_store._serialize(_columns(1000))) + 10
+    store.put('s3', _columns(1000))
+    assert store.get('s3') is not None
+    assert all(store.get(f's{i}') is None for i in range(3))
+
+
+def test_upload_over_store_limit_returns_413(monkeypatch):
+    if not isinstance(session_store.store, SQLiteSessionStore):
+        pytest.skip('SQLite 会话存储专用')
+    monkeypatch.setattr(session_store.store, 'max_bytes', 1024)
+    csv = '经度,纬度,污染物浓度,标记名称\n' + ''.join(f'112.{i},37.{i},{i},P{i}\n' for i in range(2000))
+    client = create_app().test_client()
+    response = client.post('/map/upload', data={'session_id': 'big', 'file': (io.BytesIO(csv.encode()), 'p.csv')})
+    assert response.status_code == 413
+    assert client.get('/map/get-data?session_id=big').get_json()['points'] == []
+
+
+def _upload(client, session_id, rows):
+    csv = '经度,纬度,污染物浓度,标记名称\n' + ''.join(f'112.{i},37.{i},{i},P{i}\n' for i in range(rows))
+    response = client.post('/map/upload', data={'session_id': session_id, 'file': (io.BytesIO(csv.encode()), 'p.csv')})
+    assert response.status_code == 200
+
+
+def test_get_data_etag_matches_the_payload_it_is_sent_with(monkeypatch):
+    client = create_app().test_client()
+    _upload(client, 'race', 3)
+    stale_etag = session_store.store.get_etag('race')
+    _upload(client, 'race', 5)
+    # 模拟 get_etag 与读取数据之间发生了新的上传
+    monkeypatch.setattr(session_store.store, 'get_etag', lambda session_id: stale_etag)
+
+    full = client.get('/map/get-data?session_id=race')
+    assert len(full.get_json()['points']) == 5
+    assert full.headers['ETag'].strip('"') == session_store.store.get_with_etag('race')[1]
+
+    page = client.get('/map/get-data?session_id=race&limit=10')
+    assert page.get_json()['total'] == 5
+    assert page.headers['ETag'].strip('"') == payload_codec.content_etag(
+        f"{session_store.store.get_with_etag('race')[1]}?session_id=race&limit=10".encode('utf-8'))
+
+
+def test_malformed_paging_arguments_are_rejected():
+    client = create_app().test_client()
+    _upload(client, 'paging', 3)
+    for query in ('limit=abc', 'limit=', 'cursor=x', 'cursor=-1', 'limit=0', 'zoom=1.5'):
+        assert client.get(f'/map/get-data?session_id=paging&{query}').status_code == 400
+    assert client.get('/map/get-data?session_id=paging&cursor=1').get_json()['total'] == 3
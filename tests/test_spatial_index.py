@@ -0,0 +1,75 @@
+import numpy as np
+
+from app.services import spatial_index
+
+
+def _points(rng, n, lo=(112.0, 37.0), hi=(113.0, 38.0)):
+    return {'lng': rng.uniform(lo[0], hi[0], n), 'lat': rng.uniform(lo[1], hi[1], n),
+            'concentration': rng.uniform(0, 100, n), 'name': np.array([f'P{i}' for i in range(n)])}
+
+
+def _by_id(indexed):
+    order = np.argsort(indexed['id'])
+    return {name: indexed[name][order] for name in ('id', 'lng', 'lat', 'concentration', 'name')}
+
+
+def _assert_index_consistent(indexed):
+    """每个单元内的点位都确实落在该单元中"""
+    xmin, ymin, width, height, nx, ny = indexed['_grid']
+    nx, ny = int(nx), int(ny)
+    ix = np.clip(((indexed['lng'] - xmin) / width * nx).astype(np.int64), 0, nx - 1)
+    iy = np.clip(((indexed['lat'] - ymin) / height * ny).astype(np.int64), 0, ny - 1)
+    offsets = indexed['_grid_offsets']
+    assert offsets[-1] == len(indexed['id'])
+    expected = np.repeat(np.arange(nx * ny), np.diff(offsets))
+    assert np.array_equal(ix * ny + iy, expected)
+
+
+def _assert_same_points(a, b):
+    a, b = _by_id(a), _by_id(b)
+    for name in a:
+        assert np.array_equal(a[name], b[name]), name
+
+
+def test_incremental_update_matches_full_rebuild():
+    rng = np.random.default_rng(1)
+    base = _points(rng, 2000)
+    indexed = spatial_index.build(base)
+    drop = rng.choice(2000, 150, replace=False)
+    delta = _points(rng, 300, lo=(112.1, 37.1), hi=(112.9, 37.9))
+    delta_ids = np.arange(2000, 2300)
+
+    updated = spatial_index.update(indexed, drop, delta, delta_ids)
+    # 新点位都在原网格内：沿用原网格，不重新建立索引
+    assert np.array_equal(updated['_grid'], indexed['_grid'])
+    _assert_index_consistent(updated)
+
+    kept = np.setdiff1d(np.arange(2000), indexed['id'][drop])
+    rebuilt = spatial_index.build(
+        {name: np.concatenate([base[name][kept], delta[name]]) for name in base},
+        np.concatenate([kept, delta_ids]))
+    _assert_same_points(updated, rebuilt)
+
+    bbox = (112.3, 37.2, 112.6, 37.7)
+    assert np.array_equal(updated['id'][spatial_index.query_bbox(updated, bbox)],
+                          rebuilt['id'][spatial_index.query_bbox(rebuilt, bbox)])
+
+
+def test_update_outside_grid_rebuilds_the_index():
+    rng = np.random.default_rng(2)
+    indexed = spatial_index.build(_points(rng, 500))
+    delta = _points(rng, 10, lo=(114.0, 39.0), hi=(114.5, 39.5))
+    updated = spatial_index.update(indexed, np.zeros(0, dtype=np.int64), delta, np.arange(500, 510))
+    assert updated['_grid'][0] + updated['_grid'][2] >= 114.0
+    _assert_index_consistent(updated)
+    assert len(spatial_index.query_bbox(updated, (114.0, 39.0, 114.5, 39.5))) == 10
+
+
+def test_empty_index_accepts_updates():
+    empty = spatial_index.build({'lng': np.zeros(0), 'lat': np.zeros(0), 'concentration': np.zeros(0),
+                                 'name': np.zeros(0, dtype=str)})
+    assert len(spatial_index.query_bbox(empty, (0, 0, 180, 90))) == 0
+    delta = _points(np.random.default_rng(3), 20)
+    updated = spatial_index.update(empty, np.zeros(0, dtype=np.int64), delta, np.arange(20))
+    _assert_index_consistent(updated)
+    assert len(spatial_index.query_bbox(updated, (112.0, 37.0, 113.0, 38.0))) == 20
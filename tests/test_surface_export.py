@@ -0,0 +1,48 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from app.services import surface_export
+
+
+def _surface():
+    grid_z = np.full((6, 5), np.nan)
+    grid_z[1:4, 1:4] = np.arange(9, dtype=np.float64).reshape(3, 3) * 10
+    grid_z[2, 2] = np.nan
+    return {'grid_z': grid_z, 'bounds': (112.0, 37.0, 117.0, 41.0), 'value_range': (0.0, 80.0)}
+
+
+def _parse(body):
+    assert body[:4] == surface_export.GRID_MAGIC
+    (length,) = struct.unpack('<I', body[4:8])
+    header = json.loads(body[8:8 + length].decode('utf-8'))
+    return header, body[8 + length:]
+
+
+def test_uint8_grid_is_cropped_north_up_and_quantized():
+    header, data = _parse(surface_export.export_grid(_surface(), 'uint8'))
+    assert header['version'] == surface_export.GRID_VERSION
+    assert (header['width'], header['height']) == (3, 3)
+    assert header['bounds'] == [113.0, 38.0, 115.0, 40.0]
+    q = np.frombuffer(data, dtype=np.uint8).reshape(3, 3)
+    values = np.where(q == header['nodata'], np.nan, header['offset'] + q * header['scale'])
+    # 首行为北(y 最大)、首列为西(x 最小)
+    expected = (np.arange(9, dtype=np.float64).reshape(3, 3) * 10).T[::-1]
+    expected[1, 1] = np.nan
+    np.testing.assert_allclose(values, expected, atol=header['scale'] / 2)
+
+
+def test_float16_grid_keeps_nan_for_missing_cells():
+    header, data = _parse(surface_export.export_grid(_surface(), 'float16'))
+    raster = np.frombuffer(data, dtype='<f2').reshape(header['height'], header['width'])
+    assert np.isnan(raster[1, 1]) and raster[0, 0] == 20
+
+
+def test_empty_surface_and_unknown_encoding():
+    surface = {**_surface(), 'grid_z': np.full((4, 4), np.nan)}
+    header, data = _parse(surface_export.export_grid(surface))
+    assert (header['width'], header['height']) == (0, 0) and data == b''
+    with pytest.raises(ValueError):
+        surface_export.export_grid(_surface(), 'png')
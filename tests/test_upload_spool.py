@@ -0,0 +1,88 @@
+import fcntl
+import io
+import os
+
+import pytest
+from cachetools import LRUCache
+
+from app import create_app
+from app.config import settings
+from app.services import ingestion, upload_spool
+from app.services.upload_spool import OffsetMismatchError, UploadTooLargeError
+
+
+def test_chunks_append_at_the_received_offset():
+    upload_id = upload_spool.create()
+    assert upload_spool.received(upload_id) == 0
+    assert upload_spool.append(upload_id, 0, io.BytesIO(b'abc')) == 3
+
+    # 重复发送已接收的块(例如响应丢失后重试)：返回已接收的字节数，供客户端续传
+    with pytest.raises(OffsetMismatchError) as excinfo:
+        upload_spool.append(upload_id, 0, io.BytesIO(b'abc'))
+    assert excinfo.value.received == 3
+    with pytest.raises(OffsetMismatchError):
+        upload_spool.append(upload_id, 5, io.BytesIO(b'xyz'))
+
+    assert upload_spool.append(upload_id, 3, io.BytesIO(b'def')) == 6
+    with open(upload_spool.spool_path(upload_id), 'rb') as f:
+        assert f.read() == b'abcdef'
+    upload_spool.discard(upload_id)
+    assert upload_spool.received(upload_id) is None
+
+
+def test_oversized_chunk_is_truncated_back_to_its_offset(monkeypatch):
+    monkeypatch.setattr(settings, 'UPLOAD_MAX_BYTES', 10)
+    upload_id = upload_spool.create()
+    upload_spool.append(upload_id, 0, io.BytesIO(b'12345'))
+    with pytest.raises(UploadTooLargeError):
+        upload_spool.append(upload_id, 5, io.BytesIO(b'678901'))
+    assert upload_spool.received(upload_id) == 5
+    upload_spool.discard(upload_id)
+
+
+def test_unknown_uploads_are_rejected():
+    assert upload_spool.received('../etc/passwd') is None
+    assert upload_spool.received('0' * 32) is None
+    with pytest.raises(FileNotFoundError):
+        upload_spool.append('0' * 32, 0, io.BytesIO(b'x'))
+
+
+def test_save_discards_the_spool_file_on_failure(monkeypatch):
+    monkeypatch.setattr(settings, 'UPLOAD_MAX_BYTES', 4)
+    before = set(os.listdir(settings.UPLOAD_SPOOL_DIR)) if os.path.isdir(settings.UPLOAD_SPOOL_DIR) else set()
+    with pytest.raises(UploadTooLargeError):
+        upload_spool.save(io.BytesIO(b'too large'))
+    assert set(os.listdir(settings.UPLOAD_SPOOL_DIR)) == before
+
+
+def test_chunk_is_rejected_while_another_request_writes_the_same_upload():
+    upload_id = upload_spool.create()
+    upload_spool.append(upload_id, 0, io.BytesIO(b'abc'))
+    # 另一个 worker 正在写入(持有暂存文件的锁)
+    with open(upload_spool.spool_path(upload_id), 'r+b') as other:
+        fcntl.flock(other, fcntl.LOCK_EX)
+        with pytest.raises(OffsetMismatchError) as excinfo:
+            upload_spool.append(upload_id, 3, io.BytesIO(b'def'))
+        assert excinfo.value.received == 3
+        fcntl.flock(other, fcntl.LOCK_UN)
+    assert upload_spool.append(upload_id, 3, io.BytesIO(b'def')) == 6
+    upload_spool.discard(upload_id)
+
+
+def test_large_chunked_upload_larger_than_the_parse_cache(monkeypatch):
+    # 解析结果超过解析缓存的内存预算时仍然可以上传
+    monkeypatch.setattr(ingestion, '_memory_cache', LRUCache(
+        maxsize=1024 * 1024, getsizeof=ingestion._memory_cache.getsizeof))
+    rows = 80000
+    data = ('经度,纬度,污染物浓度,标记名称\n'
+            + ''.join(f'112.{i % 1000:03d},37.{i % 997:03d},{i % 300},监测点{i}\n' for i in range(rows))).encode('utf-8')
+    client = create_app().test_client()
+    upload_id = client.post('/map/upload/chunked').get_json()['upload_id']
+    chunk = 256 * 1024
+    for offset in range(0, len(data), chunk):
+        response = client.put(f'/map/upload/chunked/{upload_id}?offset={offset}', data=data[offset:offset + chunk])
+        assert response.status_code == 200
+    response = client.post(f'/map/upload/chunked/{upload_id}/complete', data={'session_id': 'large'})
+    assert response.status_code == 200 and response.get_json()['total'] == rows
+    page = client.get('/map/get-data?session_id=large&limit=5').get_json()
+    assert page['total'] == rows and len(page['points']) == 5
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from app.services.weather_cache import TieredCache
+
+
+def _slow_fetch(calls, value, delay=0.3):
+    def fetch():
+        calls.append(value)
+        time.sleep(delay)
+        return value
+    return fetch
+
+
+def _run_concurrently(targets):
+    results = [None] * len(targets)
+
+    def run(i, target):
+        results[i] = target()
+
+    threads = [threading.Thread(target=run, args=(i, target)) for i, target in enumerate(targets)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_misses_in_one_process_fetch_once(tmp_path):
+    cache = TieredCache('single', maxsize=16, ttl=60, path=str(tmp_path / 'cache.sqlite3'))
+    calls = []
+    fetch = _slow_fetch(calls, {'temp': 20})
+    results = _run_concurrently([lambda: cache.get_or_fetch('k', fetch)] * 8)
+    assert calls == [{'temp': 20}]
+    assert results == [{'temp': 20}] * 8
+
+
+def test_lease_shares_one_fetch_across_workers(tmp_path):
+    # 两个实例共用同一个 SQLite 文件、各自的 L1，相当于两个 gunicorn worker
+    path = str(tmp_path / 'cache.sqlite3')
+    workers = [TieredCache('lease', maxsize=16, ttl=60, path=path) for _ in range(2)]
+    calls = []
+    fetch = _slow_fetch(calls, 'value')
+    results = _run_concurrently([lambda cache=cache: cache.get_or_fetch('k', fetch) for cache in workers])
+    assert calls == ['value']
+    assert results == ['value', 'value']
+
+
+def test_released_lease_without_a_value_lets_the_waiter_fetch(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    first, second = (TieredCache('retry', maxsize=16, ttl=60, path=path) for _ in range(2))
+    first_calls, second_calls = [], []
+    # 第一个 worker 取到的结果不写入缓存，另一个 worker 不应一直等待
+    results = _run_concurrently([
+        lambda: first.get_or_fetch('k', _slow_fetch(first_calls, None, 0.5)),
+        lambda: (time.sleep(0.1), second.get_or_fetch('k', _slow_fetch(second_calls, 'fresh', 0)))[1],
+    ])
+    assert results == [None, 'fresh'] and len(second_calls) == 1
+
+
+def test_stale_value_is_served_while_refreshing_in_background(tmp_path):
+    cache = TieredCache('swr', maxsize=16, ttl=0.2, stale_ttl=60, path=str(tmp_path / 'cache.sqlite3'))
+    cache.set('k', 'old')
+    time.sleep(0.3)
+
+    calls = []
+    refreshed = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        refreshed.set()
+        return 'new'
+
+    started = time.monotonic()
+    assert cache.get_or_fetch('k', fetch) == 'old'
+    assert time.monotonic() - started < 0.2
+    assert refreshed.wait(5)
+    deadline = time.monotonic() + 5
+    while cache.get('k') != 'new' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get('k') == 'new' and calls == [1]
+
+
+def test_value_past_the_stale_window_is_fetched_synchronously(tmp_path):
+    cache = TieredCache('expired', maxsize=16, ttl=0.1, stale_ttl=0.1, path=str(tmp_path / 'cache.sqlite3'))
+    cache.set('k', 'old')
+    time.sleep(0.3)
+    assert cache.get('k') is None
+    assert cache.get_or_fetch('k', lambda: 'new') == 'new'